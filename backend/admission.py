@@ -0,0 +1,151 @@
+"""Admission control for write endpoints.
+
+Write routes are wrapped with ``admitted(view, lane)``:
+
+- every write takes a token from the caller's bucket (per session user, or
+  client address); an empty bucket is answered with 429 + Retry-After
+- ``tx`` routes also need slots in the in-flight transaction budget, one per
+  transaction the request sends (``weight``, capped at the budget); when it
+  is full they wait in a bounded queue for up to ``TX_QUEUE_TIMEOUT``
+  seconds, and a full queue or an expired wait gets 503 + Retry-After
+
+Reads (dashboards, trace pages, QR codes) never pass through here, so a
+burst of writes holds at most ``TX_MAX_INFLIGHT + TX_MAX_QUEUE`` request
+threads and can't starve them. Budgets are per worker process.
+"""
+import math, time
+from functools import wraps
+from threading import Condition, Lock
+
+from flask import current_app, jsonify, request, session
+
+import metrics
+
+class TokenBucket:
+    """Per-key token buckets refilled at ``rate`` tokens/s up to ``burst``."""
+    MAX_KEYS = 10000
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # key -> [tokens, updated_at]
+        self._lock = Lock()
+
+    def take(self, key):
+        """Return (allowed, retry_after_seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_KEYS:
+                    self._prune(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True, 0
+            bucket[0] = tokens
+            return False, (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key, (tokens, updated_at) in list(self._buckets.items()):
+            if tokens + (now - updated_at) * self.rate >= self.burst:
+                del self._buckets[key]
+
+class Budget:
+    """Bounded in-flight slots with a bounded, timed wait queue."""
+
+    def __init__(self, name, limit, queue_limit, max_wait):
+        self.name = name
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.waiting = 0
+        self.avg_hold = 1.0  # EWMA of seconds a slot is held, for Retry-After
+        self._cond = Condition()
+
+    def _publish(self):
+        metrics.ADMISSION_INFLIGHT.set(self.inflight, lane=self.name)
+        metrics.ADMISSION_QUEUE_DEPTH.set(self.waiting, lane=self.name)
+
+    def clamp(self, slots):
+        # A request bigger than the whole budget takes all of it rather than never running
+        return max(1, min(int(slots), self.limit))
+
+    def acquire(self, slots=1):
+        with self._cond:
+            if self.inflight + slots <= self.limit:
+                self.inflight += slots
+                self._publish()
+                return True
+            if self.waiting >= self.queue_limit:
+                return False
+            self.waiting += 1
+            self._publish()
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.inflight + slots > self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.inflight += slots
+                return True
+            finally:
+                self.waiting -= 1
+                self._publish()
+
+    def release(self, held, slots=1):
+        with self._cond:
+            self.inflight -= slots
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held / slots
+            self._publish()
+            # Waiters need different numbers of slots; let each recheck
+            self._cond.notify_all()
+
+    def retry_after(self):
+        # Time for the queue ahead of a new caller to drain
+        with self._cond:
+            return self.avg_hold * (self.waiting + 1) / max(self.limit, 1)
+
+class AdmissionController:
+    def __init__(self, config):
+        self.buckets = TokenBucket(config["RATE_LIMIT_PER_SEC"], config["RATE_LIMIT_BURST"])
+        self.tx = Budget("tx", config["TX_MAX_INFLIGHT"], config["TX_MAX_QUEUE"], config["TX_QUEUE_TIMEOUT"])
+
+def _reject(status, message, retry_after, lane, reason):
+    metrics.ADMISSION_REJECTED.inc(lane=lane, reason=reason)
+    response = jsonify({"error": message, "retry_after": round(retry_after, 2)})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def admitted(view, lane="write", weight=None):
+    """Wrap a write view; ``lane="tx"`` also takes in-flight transaction slots.
+
+    ``weight()`` returns how many transactions the current request sends
+    (one when omitted)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        controller = current_app.extensions["admission"]
+        caller = session.get("user") or request.remote_addr or "anonymous"
+        allowed, retry_after = controller.buckets.take(caller)
+        if not allowed:
+            return _reject(429, "Too many requests; slow down", retry_after, lane, "rate_limit")
+        if lane != "tx":
+            return view(*args, **kwargs)
+
+        budget = controller.tx
+        slots = budget.clamp(weight() if weight else 1)
+        if not budget.acquire(slots):
+            return _reject(503, "Too many blockchain transactions in flight; try again shortly",
+                           budget.retry_after(), lane, "saturated")
+        started = time.monotonic()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            budget.release(time.monotonic() - started, slots)
+    return wrapper
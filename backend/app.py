@@ -1,132 +1,141 @@
 from flask import (
-    Flask, jsonify, request, render_template,
-    redirect, url_for, session, send_file
+    Flask, jsonify, request, render_template as flask_render_template,
+    redirect, url_for, session, send_file,
+    Response, stream_with_context, g, current_app
 )
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
-from web3 import Web3
-import json, os
+from werkzeug.local import LocalProxy
+import os
 from datetime import datetime
 import qrcode
 import time
-from threading import Thread, Lock
-import random
-
-# ---------------------------
-# Configuration (edit here)
-# ---------------------------
-GANACHE_URL = "http://127.0.0.1:7545"
-PRIVATE_KEY = "0xf248d6a4e7fbdf1eca5ffd286e8aef4c1da95c103daa5d5ff270e07dd6fdf6ea"
-CONTRACT_ADDRESS = "0x2D485a42fE61e30DF7B44D3268DbE6ca9C858177"
-
-# ---------------------------
-# Web3 / contract setup
-# ---------------------------
-web3 = Web3(Web3.HTTPProvider(GANACHE_URL))
-if not web3.is_connected():
-    raise Exception("❌ Could not connect to Ganache!")
-
-SIGNER_ACCOUNT = web3.eth.account.from_key(PRIVATE_KEY).address
-print("✅ Connected to Ganache. Signing account:", SIGNER_ACCOUNT)
+from functools import partial
+from threading import Thread, Lock, get_ident
+from storage import (
+    DATA_DIR, USERS_FILE, BATCHES_FILE, GANACHE_BLOCKS_FILE,
+    read_json, write_json
+)
+import export
+
+from config import GANACHE_URL, PRIVATE_KEY, CONTRACT_ADDRESS, SHARD_PRIVATE_KEYS
+import chain
+import bus
+import leader
+import metrics
+import tracing
+import fanout
+import httpcache
+import admission
+import history
+import records
+import sessions
+import shards
+import temporal
+import users
+from workload import random_batch, assess_condition
 
-# Load contract ABI (assumes contract_abi.json present)
-with open("contract_abi.json", "r") as f:
-    ABI = json.load(f)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QR_DIR = os.path.join(BASE_DIR, "static")
 
-contract = web3.eth.contract(address=CONTRACT_ADDRESS, abi=ABI)
+DEFAULT_CONFIG = {
+    "GANACHE_URL": GANACHE_URL,
+    "PRIVATE_KEY": PRIVATE_KEY,
+    "CONTRACT_ADDRESS": CONTRACT_ADDRESS,
+    # Signing key per contract shard (empty: PRIVATE_KEY); shards with their own key transact in parallel
+    "SHARD_PRIVATE_KEYS": SHARD_PRIVATE_KEYS,
+    # Web3 provider object to use instead of GANACHE_URL (benchmarks, tests)
+    "WEB3_PROVIDER": None,
+    "SECRET_KEY": "supersecretkey",
+    # Connect to the chain / prepare data files in a background thread
+    "WARMUP": True,
+    # Poll Ganache for new blocks and push them over SocketIO
+    "START_MONITOR": True,
+    # Only the worker holding this lock runs the block monitor
+    "LEADER_LOCK": os.path.join(DATA_DIR, "leader.lock"),
+    # Serializes nonce allocation for the shared signer across workers (tx.lock.<n> for extra shard signers)
+    "TX_LOCK": os.path.join(DATA_DIR, "tx.lock"),
+    # How SocketIO events reach every worker: local://, file:///dir or a broker URL
+    "EVENT_BUS": "local://",
+    # SocketIO events are coalesced per client for this long, then sent as one message
+    "SOCKET_COALESCE_MS": 100,
+    # Unacknowledged messages after which a client counts as slow and its events are dropped
+    "SOCKET_MAX_UNACKED": 4,
+    # Span sink (jsonl:///path or otlp:///path); tracing is off when unset
+    "TRACE_SINK": os.environ.get("TRACE_SINK"),
+    "TRACE_SAMPLE_RATE": float(os.environ.get("TRACE_SAMPLE_RATE", "1.0")),
+    # Requests sent with ?profile=1 or "X-Profile: 1" dump folded stacks when slower than this
+    "PROFILE_THRESHOLD_MS": 1000,
+    "PROFILE_DIR": os.path.join(DATA_DIR, "profiles"),
+    # Write admission: per-user token bucket, then a bounded in-flight tx budget per worker
+    "RATE_LIMIT_PER_SEC": 2.0,
+    "RATE_LIMIT_BURST": 10,
+    "TX_MAX_INFLIGHT": 8,
+    "TX_MAX_QUEUE": 16,
+    "TX_QUEUE_TIMEOUT": 5.0,
+    "TX_RECEIPT_TIMEOUT": 60,
+    # JSON/HTML responses smaller than this are sent uncompressed
+    "COMPRESS_MIN_BYTES": 1024,
+    "COMPRESS_LEVEL": 6,
+    # Cache lifetime for fingerprinted (?v=<hash>) static files and QR images
+    "STATIC_MAX_AGE": 31536000,
+    # Mixed into revision ETags; defaults to the templates' last change
+    "ETAG_SALT": None,
+    # Server-side sessions: memory:// (one worker) or file:///dir (shared by workers)
+    "SESSION_STORE": "memory://",
+    "SESSION_TTL": 12 * 3600,
+    # How often logins check users.json for changes, and how long a verified password is remembered
+    "USERS_REFRESH_SECONDS": 2.0,
+    "LOGIN_CACHE_TTL": 300,
+    # Point-in-time queries: snapshot the batch state every N deltas; all of the newest M
+    # snapshots are kept, older ones are thinned out logarithmically
+    "TEMPORAL_SNAPSHOT_EVERY": 500,
+    "TEMPORAL_SNAPSHOT_RETAIN": 20,
+    # Contract shards (shards.py); without this file CONTRACT_ADDRESS is the only shard
+    "SHARDS_FILE": shards.SHARDS_FILE,
+}
 
 # ---------------------------
-# Flask + SocketIO app
+# Per-app state (built by create_app, kept in app.extensions)
 # ---------------------------
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-os.makedirs(DATA_DIR, exist_ok=True)
-
-USERS_FILE = os.path.join(DATA_DIR, "users.json")
-BATCHES_FILE = os.path.join(DATA_DIR, "batches.json")
-GANACHE_BLOCKS_FILE = os.path.join(DATA_DIR, "ganache_blocks.json")
-QR_DIR = os.path.join(BASE_DIR, "static")
-os.makedirs(QR_DIR, exist_ok=True)
+# These read the current app's instance, so a second create_app() never rewires an earlier app
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
 
-app = Flask(__name__, template_folder="templates", static_folder="static")
-app.secret_key = "supersecretkey"
-CORS(app)
+# Web3 / contract setup (lazy, connected by create_app's warmup)
+chain_client = _extension("chain")
+shard_registry = _extension("shards")
+event_bus = _extension("event_bus")
+socket_emitter = _extension("socket_emitter")
+user_directory = _extension("users")
+temporal_log = _extension("temporal")
 
-# SocketIO for real-time Ganache updates
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# SocketIO for real-time Ganache updates (bound to the app in create_app)
+socketio = SocketIO()
 
 # Global variables for real-time block monitoring
 block_monitor_lock = Lock()
 last_processed_block = 0
 ganache_blocks_data = {"blocks": []}
 
-# ---------------------------
-# JSON helpers (robust)
-# ---------------------------
-def write_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2)
-
-def read_json(path, default=None):
-    if not os.path.exists(path):
-        if default is not None:
-            write_json(path, default)
-            return default
-        return default or {}
-    try:
-        with open(path, "r") as f:
-            content = f.read().strip()
-            if not content:
-                if default is not None:
-                    write_json(path, default)
-                    return default
-                return default or {}
-            return json.loads(content)
-    except Exception:
-        if default is not None:
-            write_json(path, default)
-            return default
-        return default or {}
-
-# Ensure files exist with sensible defaults
-read_json(USERS_FILE, {"users": []})
-read_json(BATCHES_FILE, {"batches": [], "conditions": []})
-read_json(GANACHE_BLOCKS_FILE, {"blocks": []})
-
-# ---------------------------
-# Random batch data generator
-# ---------------------------
-RANDOM_DATA_POOLS = {
-    "origins": ["Mysore", "Bangalore", "Coimbatore", "Ratnagiri", "Pune"],
-    "farms": ["GreenFarm-001", "SunriseFarm-002", "OrganicFarm-003", "GoldenFields-004"],
-    "exporters": ["ABC Exports", "XYZ Traders", "Global Foods", "AgriLink Exports"],
-    "colors": ["Yellow", "Green", "Red", "Orange"],
-    "conditions": ["Fresh", "Good", "Excellent", "Premium"],
-    "farmers": ["Ramesh K", "Sita M", "Rajesh P", "Lakshmi R"]
-}
+def render_template(template_name, **context):
+    with tracing.span("render_template", template=template_name):
+        return flask_render_template(template_name, **context)
 
-def generate_random_batch():
-    return {
-        "id": f"{len(read_json(BATCHES_FILE, {'batches': []})['batches']) + 1001}",
-        "origin": random.choice(RANDOM_DATA_POOLS["origins"]),
-        "farm": random.choice(RANDOM_DATA_POOLS["farms"]),
-        "exporter": random.choice(RANDOM_DATA_POOLS["exporters"]),
-        "ipfsHash": f"Qm{random.randint(100000, 999999)}{random.randrange(1000, 9999)}",
-        "color": random.choice(RANDOM_DATA_POOLS["colors"]),
-        "temperature": round(20 + random.uniform(-5, 10), 1),
-        "condition": random.choice(RANDOM_DATA_POOLS["conditions"]),
-        "created_by": random.choice(RANDOM_DATA_POOLS["farmers"]),
-        "timestamp": datetime.utcnow().isoformat()
-    }
+def ensure_data_files(app):
+    # Ensure files exist with sensible defaults
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(QR_DIR, exist_ok=True)
+    app.extensions["users"].refresh(force=True)
+    read_json(BATCHES_FILE, {"batches": [], "conditions": []})
+    read_json(GANACHE_BLOCKS_FILE, {"blocks": []})
 
 # ---------------------------
 # Simple registration/login (unchanged)
 # ---------------------------
-@app.route("/")
 def index():
     return redirect(url_for("login"))
 
-@app.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         username = (request.form.get("username") or "").strip()
@@ -137,35 +146,27 @@ def register():
         if not username or not password or not role:
             return render_template("register.html", error="All fields required")
 
-        users_data = read_json(USERS_FILE, {"users": []})
-        for u in users_data.get("users", []):
-            if u.get("username") == username:
-                return render_template("register.html", error="Username already exists")
-
-        users_data["users"].append({
-            "username": username,
-            "password": password,
-            "role": role
-        })
-        write_json(USERS_FILE, users_data)
+        try:
+            user_directory.register(username, password, role)
+        except ValueError as e:
+            return render_template("register.html", error=str(e))
         return render_template("login.html", success="Registered — please login")
     return render_template("register.html")
 
-@app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = (request.form.get("username") or "").strip()
         password = (request.form.get("password") or "").strip()
-        users_data = read_json(USERS_FILE, {"users": []})
-        for u in users_data.get("users", []):
-            if u.get("username") == username and u.get("password") == password:
-                session["user"] = username
-                session["role"] = u.get("role")
-                return redirect(url_for("dashboard"))
+        user = user_directory.authenticate(username, password)
+        if user is not None:
+            session.clear()
+            session.regenerate()
+            session["user"] = username
+            session["role"] = user.get("role")
+            return redirect(url_for("dashboard"))
         return render_template("login.html", error="Invalid credentials")
     return render_template("login.html")
 
-@app.route("/logout")
 def logout():
     session.clear()
     return redirect(url_for("login"))
@@ -173,17 +174,17 @@ def logout():
 # ---------------------------
 # NEW: Generate Random Batch (for farmer dashboard)
 # ---------------------------
-@app.route("/generate_random_batch", methods=["POST"])
 def generate_random_batch_endpoint():
     if "user" not in session or session.get("role") != "farmer":
         return jsonify({"error": "Farmer access only"}), 403
     
-    new_batch = generate_random_batch()
-    
-    # Save to local storage (NO blockchain yet)
-    batches_data = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
-    batches_data["batches"].append(new_batch)
-    write_json(BATCHES_FILE, batches_data)
+    # Save to local storage (NO blockchain yet); one read gives both the id and the list
+    with temporal_log.writing():
+        batches_data = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
+        new_batch = random_batch(len(batches_data["batches"]) + 1001)
+        batches_data["batches"].append(new_batch)
+        write_json(BATCHES_FILE, batches_data)
+        temporal_log.record(new_batch, source="generate")
     
     return jsonify({
         "message": "Random batch generated and saved locally",
@@ -193,7 +194,6 @@ def generate_random_batch_endpoint():
 # ---------------------------
 # NEW: Create Block with Multiple Selected Batches
 # ---------------------------
-@app.route("/create_block", methods=["POST"])
 def create_block():
     if "user" not in session or session.get("role") != "farmer":
         return jsonify({"error": "Farmer access only"}), 403
@@ -216,8 +216,12 @@ def create_block():
     if not selected_batches:
         return jsonify({"error": "No valid batches found"}), 400
     
+    # Fail fast (503) while the chain is unreachable instead of dropping batches
+    chain_client.web3
+
     print(f"🚀 Creating block with {len(selected_batches)} batches...")
     tx_results = []
+    created = []
     
     # Send each batch as separate transaction (will go to same/next block due to Ganache blockTime)
     for batch in selected_batches:
@@ -225,30 +229,24 @@ def create_block():
             # Remove from pending list, mark as processed
             batches_data["batches"] = [b for b in batches_data["batches"] if b.get("id") != batch["id"]]
             
-            # Create blockchain transaction
-            nonce = web3.eth.get_transaction_count(SIGNER_ACCOUNT)
-            txn = contract.functions.createBatch(
+            # Create blockchain transaction on the batch's shard
+            shard = shard_registry.shard_for(batch)
+            contract = chain_client.contract_at(shard)
+            tx_hex, receipt = chain_client.transact(contract.functions.createBatch(
                 batch["origin"], 
                 batch["farm"], 
                 batch["exporter"], 
                 batch["ipfsHash"]
-            ).build_transaction({
-                "from": SIGNER_ACCOUNT,
-                "nonce": nonce,
-                "gas": 3000000,
-                "gasPrice": web3.to_wei("20", "gwei")
-            })
-            
-            signed = web3.eth.account.sign_transaction(txn, private_key=PRIVATE_KEY)
-            raw_tx = signed.raw_transaction
-            tx_hash = web3.eth.send_raw_transaction(raw_tx)
-            receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+            ))
             
             # Update batch with blockchain details
-            batch["tx_hash"] = web3.to_hex(tx_hash)
+            batch["tx_hash"] = tx_hex
             batch["block_number"] = receipt.blockNumber
+            batch["chain_id"] = chain.created_batch_id(contract, receipt)
+            batch["shard"] = shard
             batch["status"] = "On Blockchain"
             batch["timestamp"] = datetime.utcnow().isoformat()
+            created.append(batch)
             
             tx_results.append({
                 "batch_id": batch["id"],
@@ -265,20 +263,42 @@ def create_block():
                 "error": str(e)
             })
     
-    write_json(BATCHES_FILE, batches_data)
+    # Re-read under the log lock so the store write and its deltas land in the same order
+    selected_ids = [b["id"] for b in selected_batches]
+    with temporal_log.writing():
+        batches_data = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
+        batches_data["batches"] = [b for b in batches_data["batches"] if b.get("id") not in selected_ids]
+        write_json(BATCHES_FILE, batches_data)
+        for batch in created:
+            temporal_log.record(batch, source="create_block", block=batch["block_number"])
+    for batch in created:
+        publish_batch_update(batch)
     return jsonify({
         "message": f"✅ Created {len([t for t in tx_results if 'error' not in t])} successful transactions",
         "results": tx_results
     })
 
+def create_block_weight():
+    # One transaction per selected batch, each holding an admission slot
+    return len((request.get_json(silent=True) or {}).get("batch_ids") or []) or 1
+
 # ---------------------------
 # SocketIO: Real-time Ganache block monitoring
 # ---------------------------
-def monitor_ganache_blocks():
+def monitor_ganache_blocks(app):
+    with app.app_context():
+        _monitor_ganache_blocks()
+
+def _monitor_ganache_blocks():
     global last_processed_block, ganache_blocks_data
     while True:
+        if not chain_client.ready:
+            time.sleep(2)  # Wait for warmup to connect
+            continue
         try:
+            web3 = chain_client.web3
             current_block = web3.eth.block_number
+            metrics.MONITOR_LAG.set(max(current_block - last_processed_block, 0))
             if current_block > last_processed_block:
                 with block_monitor_lock:
                     block = web3.eth.get_block(current_block, full_transactions=True)
@@ -290,47 +310,93 @@ def monitor_ganache_blocks():
                         "transactions": []
                     }
                     
-                    # Filter transactions for your contract
+                    # Filter transactions for our contract shards
+                    rooms = {fanout.role_room("farmer")}
                     for tx in block.transactions:
-                        if tx.get('to') and tx['to'].lower() == CONTRACT_ADDRESS.lower():
+                        shard = shard_registry.index_of(tx.get('to'))
+                        if shard is not None:
+                            function, farm = decode_contract_call(tx)
+                            if farm:
+                                rooms.add(fanout.farm_room(farm))
                             block_data["transactions"].append({
                                 "tx_hash": tx.hash.hex(),
                                 "from": tx.get('from', ''),
-                                "gas_used": tx.get('gas', 0)
+                                "gas_used": tx.get('gas', 0),
+                                "function": function,
+                                "shard": shard
                             })
                     
                     if block_data["transactions"]:  # Only emit blocks with our contract txs
+                        temporal_log.mark_block(current_block, block_data["transactions"])
                         ganache_blocks_data["blocks"].append(block_data)
                         # Keep only last 10 blocks
                         if len(ganache_blocks_data["blocks"]) > 10:
                             ganache_blocks_data["blocks"] = ganache_blocks_data["blocks"][-10:]
                         write_json(GANACHE_BLOCKS_FILE, ganache_blocks_data)
                         
-                        # Emit to all connected clients
-                        # socketio.emit('new_ganache_block', block_data, broadcast=True)
-                        # socketio.emit('new_ganache_block', block_data, room=None, include_self=False, to_all=True)
-                        socketio.emit('new_ganache_block', block_data)
+                        # Emit to farmer dashboards and the farms involved (on every worker)
+                        event_bus.publish('new_ganache_block', block_data, rooms=sorted(rooms))
                         print(f"🔗 New block {current_block} with {len(block_data['transactions'])} contract txs")
                     
                     last_processed_block = current_block
+                    metrics.MONITOR_LAST_BLOCK.set(current_block)
+                    metrics.MONITOR_LAG_SECONDS.set(max(time.time() - block.timestamp, 0))
                 
         except Exception as e:
             print(f"⚠️ Block monitor error: {str(e)}")
         
         time.sleep(2)  # Poll every 2 seconds
 
-# Start block monitor thread
-Thread(target=monitor_ganache_blocks, daemon=True).start()
+def decode_contract_call(tx):
+    """Return (function name, farm) for a transaction to one of our contract shards (they share the ABI)."""
+    try:
+        function, params = chain_client.contract.decode_function_input(tx.get('input', '0x'))
+        return function.fn_name, params.get("farm")
+    except Exception:
+        return None, None
+
+def publish_batch_update(batch, condition=None):
+    """Push a batch change to its trace viewers and its farm's dashboards."""
+    data = {key: batch.get(key) for key in ("id", "farm", "status", "color", "temperature", "tx_hash", "timestamp")}
+    if condition is not None:
+        data["condition"] = condition
+    event_bus.publish('batch_updated', data, rooms=[fanout.batch_room(batch.get("id")), fanout.farm_room(batch.get("farm"))])
 
 @socketio.on('connect')
 def handle_connect():
     print('Client connected to SocketIO')
+    metrics.SOCKET_CLIENTS.inc()
+    socket_emitter.join(request.sid, fanout.ALL)
+    if session.get("role"):
+        socket_emitter.join(request.sid, fanout.role_room(session["role"]))
     emit('connected', {'message': 'Connected to Ganache real-time updates'})
 
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    metrics.SOCKET_CLIENTS.dec()
+    socket_emitter.forget(request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Join batch/farm rooms: {"batch_ids": [...], "farms": [...]}. Acks the rooms joined."""
+    data = data or {}
+    rooms = [fanout.batch_room(b) for b in data.get("batch_ids", [])]
+    rooms += [fanout.farm_room(f) for f in data.get("farms", [])]
+    for room in rooms:
+        if not socket_emitter.join(request.sid, room):
+            return {"error": f"At most {fanout.MAX_ROOMS_PER_CLIENT} subscriptions", "rooms": sorted(socket_emitter.rooms(request.sid))}
+    return {"rooms": sorted(socket_emitter.rooms(request.sid))}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    data = data or {}
+    for room in [fanout.batch_room(b) for b in data.get("batch_ids", [])] + [fanout.farm_room(f) for f in data.get("farms", [])]:
+        socket_emitter.leave(request.sid, room)
+    return {"rooms": sorted(socket_emitter.rooms(request.sid))}
+
 # ---------------------------
 # Dashboard routing (unchanged)
 # ---------------------------
-@app.route("/dashboard")
 def dashboard():
     if "user" not in session:
         return redirect(url_for("login"))
@@ -344,7 +410,6 @@ def dashboard():
 # ---------------------------
 # Existing endpoints (unchanged but preserved)
 # ---------------------------
-@app.route("/create_batch", methods=["POST"])
 def create_batch():
     if request.is_json:
         data = request.get_json()
@@ -374,46 +439,49 @@ def create_batch():
     except Exception:
         temp_val = None
 
+    route = {"farm": farm}
+    if shard_registry.key == "id":
+        # Routed by the id this batch is about to get
+        route["id"] = len(read_json(BATCHES_FILE, {"batches": [], "conditions": []})["batches"]) + 1
+    shard = shard_registry.shard_for(route)
     try:
-        nonce = web3.eth.get_transaction_count(SIGNER_ACCOUNT)
-        txn = contract.functions.createBatch(origin, farm, exporter, ipfsHash).build_transaction({
-            "from": SIGNER_ACCOUNT,
-            "nonce": nonce,
-            "gas": 3000000,
-            "gasPrice": web3.to_wei("20", "gwei")
-        })
-        signed = web3.eth.account.sign_transaction(txn, private_key=PRIVATE_KEY)
-        raw_tx = signed.raw_transaction
-        tx_hash = web3.eth.send_raw_transaction(raw_tx)
-        receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-        tx_hex = web3.to_hex(tx_hash)
+        contract = chain_client.contract_at(shard)
+        tx_hex, receipt = chain_client.transact(contract.functions.createBatch(origin, farm, exporter, ipfsHash))
         print("✅ createBatch tx:", tx_hex)
+    except chain.ChainUnavailable:
+        raise  # 503 from the registered handler
     except Exception as e:
         print("❌ Blockchain create_batch failed:", str(e))
         if not request.is_json:
             return render_template(f"{session.get('role')}_dashboard.html", user=session.get("user"), error=str(e))
         return jsonify({"error": str(e)}), 500
 
-    batches = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
-    new_id = len(batches["batches"]) + 1
-    new_batch = {
-        "id": new_id,
-        "origin": origin,
-        "farm": farm,
-        "exporter": exporter,
-        "status": "Batch Created",
-        "ipfsHash": ipfsHash,
-        "color": color or "",
-        "temperature": temp_val,
-        "condition": condition or "",
-        "tx_hash": tx_hex,
-        "created_by": session.get("user"),
-        "timestamp": datetime.utcnow().isoformat()
-    }
-    batches["batches"].append(new_batch)
-    write_json(BATCHES_FILE, batches)
+    chain_id = chain.created_batch_id(contract, receipt)
+    with temporal_log.writing():
+        batches = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
+        new_id = len(batches["batches"]) + 1
+        new_batch = {
+            "id": new_id,
+            "origin": origin,
+            "farm": farm,
+            "exporter": exporter,
+            "status": "Batch Created",
+            "ipfsHash": ipfsHash,
+            "color": color or "",
+            "temperature": temp_val,
+            "condition": condition or "",
+            "tx_hash": tx_hex,
+            "block_number": receipt.blockNumber,
+            "chain_id": chain_id,
+            "shard": shard,
+            "created_by": session.get("user"),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        batches["batches"].append(new_batch)
+        write_json(BATCHES_FILE, batches)
+        temporal_log.record(new_batch, source="create_batch", block=receipt.blockNumber)
+    publish_batch_update(new_batch)
 
-    
 
     if request.is_json:
         return jsonify({"message": "✅ Batch created and recorded locally & on-chain", "batch": new_batch})
@@ -421,7 +489,6 @@ def create_batch():
 
 # [Other existing endpoints unchanged - submit_condition, generate_qr, trace_page, update_status, local_batches]
 
-@app.route("/submit_condition", methods=["POST"])
 def submit_condition():
     if "user" not in session:
         return redirect(url_for("login"))
@@ -450,28 +517,7 @@ def submit_condition():
     except Exception:
         temperature = None
 
-    batches = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
-    index = batch_id - 1
-    if index < 0 or index >= len(batches["batches"]):
-        msg = f"Batch {batch_id} not found"
-        if request.is_json:
-            return jsonify({"error": msg}), 404
-        return render_template(f"{session.get('role')}_dashboard.html", user=session.get("user"), error=msg)
-
-    approved = True
-    reasons = []
-    if color:
-        if color.lower() in ["black", "bad", "rotten"]:
-            approved = False
-            reasons.append("Bad color")
-    if temperature is not None:
-        if temperature < 5 or temperature > 35:
-            approved = False
-            reasons.append("Temperature out of range")
-    if remarks:
-        if "mold" in remarks.lower() or "spoilt" in remarks.lower():
-            approved = False
-            reasons.append("Remark indicates spoilage")
+    approved, reasons = assess_condition(color, temperature, remarks)
 
     status = "Approved" if approved else "Rejected"
 
@@ -486,21 +532,33 @@ def submit_condition():
         "reasons": reasons,
         "timestamp": datetime.utcnow().isoformat()
     }
-    if "conditions" not in batches:
-        batches["conditions"] = []
-    batches["conditions"].append(record)
 
-    if approved:
-        batches["batches"][index]["status"] = f"{role.capitalize()} Approved"
-        batches["batches"][index].setdefault("history", []).append(record)
+    with temporal_log.writing():
+        batches = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
+        index = batch_id - 1
+        if index < 0 or index >= len(batches["batches"]):
+            msg = f"Batch {batch_id} not found"
+            if request.is_json:
+                return jsonify({"error": msg}), 404
+            return render_template(f"{session.get('role')}_dashboard.html", user=session.get("user"), error=msg)
 
-    write_json(BATCHES_FILE, batches)
+        if "conditions" not in batches:
+            batches["conditions"] = []
+        batches["conditions"].append(record)
+
+        if approved:
+            batches["batches"][index]["status"] = f"{role.capitalize()} Approved"
+            history.append(batches["batches"][index], [record], BATCHES_FILE)
+
+        write_json(BATCHES_FILE, batches)
+        if approved:
+            temporal_log.record(batches["batches"][index], ["status", *history.HEADER_FIELDS], "submit_condition")
+    publish_batch_update(batches["batches"][index], condition=record)
 
     if request.is_json:
         return jsonify({"message": "Condition recorded", "record": record})
     return render_template(f"{session.get('role')}_dashboard.html", user=session.get("user"), success=f"Condition {status}")
 
-@app.route('/generate_qr', methods=['POST'])
 def generate_qr():
     data = request.get_json()
     batch_id = data.get("batchId")
@@ -513,24 +571,60 @@ def generate_qr():
 
     trace_url = f"http://127.0.0.1:5000/trace/{batch_id}"
 
-    qr = qrcode.make(trace_url)
-    qr.save(qr_path)
+    with tracing.span("qr.render", batch_id=batch_id):
+        qr = qrcode.make(trace_url)
+        qr.save(qr_path)
 
     return jsonify({
-        "qr_url": f"static/{qr_filename}",
+        "qr_url": f"static/{qr_filename}?v={httpcache.fingerprint(qr_path)}",
         "trace_url": trace_url
     })
 
-@app.route("/trace/<int:batch_id>")
 def trace_page(batch_id):
-    data = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
-    batches = data.get("batches", [])
-    batch = next((b for b in batches if int(b.get("id", -1)) == batch_id), None)
+    if request.args.get("as_of"):
+        try:
+            block, timestamp = temporal.parse_as_of(request.args["as_of"])
+        except ValueError:
+            return "<h2>as_of must be a block number or an ISO timestamp.</h2>", 400
+        batch, as_of = temporal_log.batch_as_of(batch_id, block, timestamp)
+        if not batch:
+            return f"<h2>Batch {batch_id} did not exist at {request.args['as_of']}.</h2>", 404
+        # The header at that point names the extent its history was in then
+        past = history.load(batch, BATCHES_FILE)
+        try:
+            contract_address = shard_registry.address(batch.get("shard"))
+        except ValueError as e:
+            return f"<h2>Batch {batch_id}: {e}</h2>", 500
+        return render_template("trace.html", batch=batch, history=past, as_of=as_of,
+                               contract_address=contract_address)
+
+    # Compact in-memory copy of the store, rebuilt only when it changes
+    batch = records.cached_table(BATCHES_FILE).get(batch_id)
     if not batch:
         return f"<h2>Batch {batch_id} not found.</h2>", 404
-    return render_template("trace.html", batch=batch)
+    try:
+        contract_address = shard_registry.address(batch.get("shard"))
+    except ValueError as e:
+        return f"<h2>Batch {batch_id}: {e}</h2>", 500
+    # Only the viewed batch's history is read: one extent of a shared segment
+    return render_template("trace.html", batch=batch, history=history.load(batch, BATCHES_FILE), as_of=None,
+                           contract_address=contract_address)
+
+def query_batches():
+    """Batch state at a block or time: /query?as_of=<block|ISO time>[&batch_id=&farm=&status=]"""
+    try:
+        block, timestamp = temporal.parse_as_of(request.args.get("as_of"))
+    except ValueError:
+        return jsonify({"error": "as_of must be a block number or an ISO timestamp"}), 400
+    state, as_of = temporal_log.as_of(block, timestamp)
+    batches = list(state.values())
+    if request.args.get("batch_id"):
+        batches = [b for b in batches if str(b.get("id")) == request.args["batch_id"]]
+    for field in ("farm", "status"):
+        if request.args.get(field):
+            batches = [b for b in batches if b.get(field) == request.args[field]]
+    return jsonify({"as_of": as_of, "batches": batches})
 
-@app.route("/update_status", methods=["POST"])
 def update_status():
     try:
         data = request.get_json()
@@ -543,37 +637,48 @@ def update_status():
         if status is None:
             return jsonify({"error": "Missing status"}), 400
 
-        nonce = web3.eth.get_transaction_count(SIGNER_ACCOUNT)
-        txn = contract.functions.updateBatch(batch_id, status, ipfsHash, color, temperature).build_transaction({
-            "from": SIGNER_ACCOUNT,
-            "nonce": nonce,
-            "gas": 3000000,
-            "gasPrice": web3.to_wei("20", "gwei")
-        })
-
-        signed_txn = web3.eth.account.sign_transaction(txn, private_key=PRIVATE_KEY)
-        raw_tx = signed_txn.raw_transaction
-        tx_hash = web3.eth.send_raw_transaction(raw_tx)
-        web3.eth.wait_for_transaction_receipt(tx_hash)
-        tx_hex = web3.to_hex(tx_hash)
-
+        # Local ids are not contract ids; use the mapping recorded at creation
         batches = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
         index = batch_id - 1
-
+        chain_batch_id, shard = batch_id, 0
         if 0 <= index < len(batches.get("batches", [])):
-            batches["batches"][index]["status"] = status
-            batches["batches"][index]["ipfsHash"] = ipfsHash
-            batches["batches"][index]["color"] = color
-            try:
-                batches["batches"][index]["temperature"] = float(temperature) if temperature != "" else ""
-            except Exception:
-                batches["batches"][index]["temperature"] = temperature
-            batches["batches"][index]["tx_hash"] = tx_hex
-            batches["batches"][index]["timestamp"] = datetime.utcnow().isoformat()
-            write_json(BATCHES_FILE, batches)
+            chain_batch_id = batches["batches"][index].get("chain_id") or batch_id
+            shard = batches["batches"][index].get("shard") or 0
+
+        try:
+            contract = chain_client.contract_at(shard)
+        except ValueError as e:
+            # Recorded on a shard this deployment no longer registers
+            return jsonify({"error": str(e)}), 409
+        tx_hex, receipt = chain_client.transact(
+            contract.functions.updateBatch(chain_batch_id, status, ipfsHash, color, temperature)
+        )
+
+        with temporal_log.writing():
+            batches = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
+            updated = 0 <= index < len(batches.get("batches", []))
+            if updated:
+                batches["batches"][index]["status"] = status
+                batches["batches"][index]["ipfsHash"] = ipfsHash
+                batches["batches"][index]["color"] = color
+                try:
+                    batches["batches"][index]["temperature"] = float(temperature) if temperature != "" else ""
+                except Exception:
+                    batches["batches"][index]["temperature"] = temperature
+                batches["batches"][index]["tx_hash"] = tx_hex
+                batches["batches"][index]["timestamp"] = datetime.utcnow().isoformat()
+                write_json(BATCHES_FILE, batches)
+                temporal_log.record(
+                    batches["batches"][index], ["status", "ipfsHash", "color", "temperature", "tx_hash", "timestamp"],
+                    "update_status", block=receipt.blockNumber,
+                )
+        if updated:
+            publish_batch_update(batches["batches"][index])
 
         return jsonify({"message": "✅ Status and IoT data updated successfully!", "tx_hash": tx_hex})
 
+    except chain.ChainUnavailable:
+        raise  # 503 from the registered handler
     except Exception as e:
         print("❌ Error update_status:", str(e))
         return jsonify({"error": str(e)}), 500
@@ -585,7 +690,6 @@ def local_batches():
     data["batches"].sort(key=lambda x: int(x.get("id", 0)))
     return jsonify(data)
 ''' 
-@app.route("/local_batches", methods=["GET"])
 def local_batches():
     data = read_json(BATCHES_FILE, {"batches": [], "conditions": []})
     # FIXED: Safe sorting for both numeric (1,2,3) and alphanumeric (B1001) IDs
@@ -597,22 +701,223 @@ def local_batches():
     
     if data["batches"]:
         data["batches"].sort(key=get_sort_key)
-    return jsonify(data)
+    # Headers only; /trace/<id> loads a batch's history
+    data["batches"] = [history.header(b) for b in data["batches"]]
+    return httpcache.stream_json(data)
 
 
 
 # NEW: Get Ganache blocks data
-@app.route("/ganache_blocks", methods=["GET"])
 def ganache_blocks():
     return jsonify(read_json(GANACHE_BLOCKS_FILE, {"blocks": []}))
 
+# ---------------------------
+# Streaming traceability export (NDJSON / CSV / Parquet)
+# ---------------------------
+def export_batches():
+    if "user" not in session:
+        return jsonify({"error": "Login required"}), 403
+
+    fmt = request.args.get("format", "ndjson")
+    compress = request.args.get("compress") or None
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    if compress not in (None, "gzip"):
+        return jsonify({"error": f"Unsupported compression: {compress}"}), 400
+
+    try:
+        stream = export.export_stream(
+            fmt, compress, BATCHES_FILE,
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            farm=request.args.get("farm"),
+            status=request.args.get("status"),
+            role=request.args.get("role"),
+        )
+    except RuntimeError as e:
+        # e.g. parquet without pyarrow installed
+        return jsonify({"error": str(e)}), 501
+    mimetype = "application/gzip" if compress else export.FORMATS[fmt][0]
+    return Response(
+        stream_with_context(stream),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={export.export_filename(fmt, compress)}"},
+    )
+
+# ---------------------------
+# Health / readiness
+# ---------------------------
+def healthz():
+    return jsonify({"status": "ok"})
+
+def readyz():
+    status = chain_client.status()
+    return jsonify({"ready": status["connected"], "chain": status}), (200 if status["connected"] else 503)
+
+def chain_unavailable(e):
+    return jsonify({"error": str(e)}), 503
+
+# ---------------------------
+# Metrics
+# ---------------------------
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_LATENCY.observe(
+            time.perf_counter() - started,
+            route=route, method=request.method, status=response.status_code,
+        )
+    return response
+
+# ---------------------------
+# Tracing / profiling
+# ---------------------------
+def start_request_trace():
+    profile = request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+    root, token = tracing.start_trace(
+        f"{request.method} {request.path}",
+        traceparent=request.headers.get("traceparent"),
+        force=profile,
+        method=request.method, path=request.path,
+    )
+    g.trace = (root, token)
+    g.trace_id = root.trace_id if root else tracing.parse_traceparent(request.headers.get("traceparent"))[0]
+    g.profiler = tracing.SamplingProfiler(get_ident()).start() if profile else None
+
+def finish_request_trace(response):
+    root, token = g.pop("trace", (None, None))
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+        if root is not None and root.duration_ms >= current_app.config["PROFILE_THRESHOLD_MS"]:
+            path = profiler.dump(os.path.join(current_app.config["PROFILE_DIR"], f"{root.trace_id}.folded"))
+            response.headers["X-Profile-Path"] = os.path.relpath(path, BASE_DIR)
+            print(f"🐢 Slow request {request.path} ({root.duration_ms:.0f} ms) profiled → {path}")
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    tracing.end_trace(root, token, route=route, status=response.status_code)
+    if g.get("trace_id"):
+        response.headers["X-Trace-Id"] = g.trace_id
+    return response
+
+# ---------------------------
+# Application factory
+# ---------------------------
+ROUTES = [
+    ("/", index, ["GET"]),
+    ("/register", register, ["GET", "POST"]),
+    ("/login", login, ["GET", "POST"]),
+    ("/logout", logout, ["GET"]),
+    ("/generate_random_batch", generate_random_batch_endpoint, ["POST"]),
+    ("/create_block", admission.admitted(create_block, "tx", weight=create_block_weight), ["POST"]),
+    ("/dashboard", dashboard, ["GET"]),
+    ("/create_batch", admission.admitted(create_batch, "tx"), ["POST"]),
+    ("/submit_condition", admission.admitted(submit_condition), ["POST"]),
+    ("/generate_qr", generate_qr, ["POST"]),
+    ("/trace/<batch_id>", httpcache.revalidated(trace_page, BATCHES_FILE, temporal.log_path(BATCHES_FILE)), ["GET"]),
+    ("/query", httpcache.revalidated(query_batches, temporal.log_path(BATCHES_FILE)), ["GET"]),
+    ("/update_status", admission.admitted(update_status, "tx"), ["POST"]),
+    ("/local_batches", httpcache.revalidated(local_batches, BATCHES_FILE), ["GET"]),
+    ("/ganache_blocks", httpcache.revalidated(ganache_blocks, GANACHE_BLOCKS_FILE), ["GET"]),
+    ("/export", export_batches, ["GET"]),
+    ("/healthz", healthz, ["GET"]),
+    ("/readyz", readyz, ["GET"]),
+    ("/metrics", metrics_endpoint, ["GET"]),
+]
+
+def create_app(config=None):
+    """Build the Flask app. Nothing here blocks on Ganache or the data files."""
+    started = time.perf_counter()
+
+    app = Flask(__name__, template_folder="templates", static_folder="static")
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    app.secret_key = app.config["SECRET_KEY"]
+    app.json.compact = True
+    app.session_interface = sessions.ServerSessionInterface(
+        sessions.make_session_store(app.config["SESSION_STORE"]), app.config["SESSION_TTL"])
+    app.extensions["users"] = users.UserDirectory(
+        USERS_FILE, refresh_interval=app.config["USERS_REFRESH_SECONDS"], cache_ttl=app.config["LOGIN_CACHE_TTL"])
+    app.extensions["temporal"] = temporal.TemporalLog(
+        BATCHES_FILE, spacing=app.config["TEMPORAL_SNAPSHOT_EVERY"], retain=app.config["TEMPORAL_SNAPSHOT_RETAIN"])
+    if app.config["ETAG_SALT"] is None:
+        template_dir = os.path.join(BASE_DIR, "templates")
+        app.config["ETAG_SALT"] = str(max((os.stat(os.path.join(template_dir, t)).st_mtime_ns for t in os.listdir(template_dir)), default=0))
+    CORS(app)
+
+    for rule, view, methods in ROUTES:
+        app.add_url_rule(rule, view_func=view, methods=methods)
+    app.register_error_handler(chain.ChainUnavailable, chain_unavailable)
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    app.before_request(start_request_trace)
+    app.after_request(finish_request_trace)
+    app.after_request(httpcache.finalize_response)
+    app.url_defaults(httpcache.static_url_defaults)
+    tracing.configure(app.config["TRACE_SINK"], app.config["TRACE_SAMPLE_RATE"])
+    metrics.WORKER_INFO.set(1, pid=os.getpid())
+
+    event_bus, message_queue = bus.make_bus(app.config["EVENT_BUS"])
+    socketio.init_app(app, cors_allowed_origins="*", async_mode='threading', message_queue=message_queue)
+    socket_emitter = fanout.CoalescingEmitter(
+        socketio,
+        window=app.config["SOCKET_COALESCE_MS"] / 1000,
+        max_unacked=app.config["SOCKET_MAX_UNACKED"],
+        per_client=message_queue is None,
+    ).start()
+    # Bus events are coalesced and sent to this worker's clients in the target rooms
+    event_bus.subscribe(socket_emitter.publish)
+    app.extensions["event_bus"] = event_bus
+    app.extensions["socket_emitter"] = socket_emitter
+
+    shard_registry = app.extensions["shards"] = shards.load(app.config["SHARDS_FILE"], app.config["CONTRACT_ADDRESS"])
+    chain_client = app.extensions["chain"] = chain.ChainClient(
+        app.config["GANACHE_URL"], app.config["CONTRACT_ADDRESS"], app.config["PRIVATE_KEY"],
+        provider=app.config["WEB3_PROVIDER"], shard_addresses=shard_registry.addresses,
+        shard_keys=app.config["SHARD_PRIVATE_KEYS"],
+    )
+    os.makedirs(DATA_DIR, exist_ok=True)
+    chain_client.tx_locks = [leader.FileLock(app.config["TX_LOCK"] + (f".{i}" if i else ""))
+                             for i in range(len(chain_client.keys))]
+    chain_client.receipt_timeout = app.config["TX_RECEIPT_TIMEOUT"]
+    app.extensions["admission"] = admission.AdmissionController(app.config)
+    if app.config["WARMUP"]:
+        Thread(target=ensure_data_files, args=(app,), daemon=True).start()
+        chain_client.warmup()
+    if app.config["START_MONITOR"]:
+        leader.LeaderLease(app.config["LEADER_LOCK"]).run_when_leader([partial(monitor_ganache_blocks, app)])
+
+    app.config["STARTUP_MS"] = round((time.perf_counter() - started) * 1000, 2)
+    print(f"⏱️ App created in {app.config['STARTUP_MS']} ms (chain connects in background)")
+    return app
+
 # ---------------------------
 # Run server
 # ---------------------------
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Mango supply chain server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1, help="Pre-forked worker processes (disables debug)")
+    args = parser.parse_args()
+
     print("🚀 Starting Flask + SocketIO server with Ganache real-time monitoring...")
     print("💡 Run Ganache with: ganache-cli -p 7545 --blockTime 60")
-    socketio.run(app, host="127.0.0.1", port=5000, debug=True)
+    if args.workers > 1:
+        import serve
+        serve.serve(args.workers, args.host, args.port)
+    else:
+        # The debug reloader's parent process only watches files; keep it idle
+        reloader_parent = os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+        app = create_app({"WARMUP": not reloader_parent, "START_MONITOR": not reloader_parent})
+        socketio.run(app, host=args.host, port=args.port, debug=True)
 
 
 
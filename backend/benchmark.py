@@ -0,0 +1,243 @@
+"""Benchmark harness running the app against an in-process EVM.
+
+Deploys the contract (``contract_abi.json`` + compiled bytecode) onto
+eth-tester / py-evm, seeds a scratch data directory with N batches from
+``workload.py`` and drives the Flask app through its test client from
+concurrent workers. Reports
+p50/p95/p99 latency, requests/s and tx/s per scenario and dataset size, and
+writes the results as JSON for regression comparison.
+
+    pip install "web3[tester]"
+    python benchmark.py --bytecode contract_bytecode.bin --sizes 1000,10000,100000
+    python benchmark.py --bytecode contract_bytecode.bin --compare bench_results/<previous>.json
+
+The bytecode file holds the hex ``bytecode.object`` of MangoTraceability as
+compiled by Remix/solc.
+"""
+import argparse, json, os, platform, random, statistics, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Thread, Lock, Event
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench_results")
+SCENARIOS = ["create_block", "submit_condition", "update_status", "local_batches", "trace"]
+
+# ---------------------------
+# In-process chain
+# ---------------------------
+def start_chain(bytecode_path, block_time=0.0):
+    """Deploy the contract on eth-tester; return (provider, address, private_key, stop_event)."""
+    try:
+        from eth_tester import EthereumTester, PyEVMBackend
+        from web3 import Web3, EthereumTesterProvider
+    except ImportError:
+        raise SystemExit('❌ Benchmarks need eth-tester and py-evm: pip install "web3[tester]"')
+    import chain
+
+    if not os.path.exists(bytecode_path):
+        raise SystemExit(f"❌ Contract bytecode not found at {bytecode_path} (compile MangoTraceability and save bytecode.object there)")
+    with open(bytecode_path) as f:
+        bytecode = f.read().strip()
+
+    tester = EthereumTester(PyEVMBackend())
+
+    class LockedTesterProvider(EthereumTesterProvider):
+        # py-evm is not thread-safe; the app and the miner call it concurrently
+        _lock = Lock()
+
+        def make_request(self, method, params):
+            with self._lock:
+                return super().make_request(method, params)
+
+    provider = LockedTesterProvider(tester)
+    web3 = Web3(provider)
+    account = web3.eth.account.create()
+    private_key = Web3.to_hex(account.key)
+    tester.add_account(private_key)
+    web3.eth.send_transaction({
+        "from": web3.eth.accounts[0],
+        "to": account.address,
+        "value": web3.to_wei(10000, "ether"),
+    })
+
+    address = chain.deploy_contract(web3, private_key, bytecode)
+
+    stop = Event()
+    if block_time > 0:
+        tester.disable_auto_mine_transactions()
+
+        def mine():
+            while not stop.wait(block_time):
+                with LockedTesterProvider._lock:
+                    tester.mine_blocks(1)
+
+        Thread(target=mine, daemon=True).start()
+    return provider, address, private_key, stop
+
+# ---------------------------
+# Scenario drivers
+# ---------------------------
+def _client(app, role):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = f"bench-{role}"
+        sess["role"] = role
+    return client
+
+def make_scenario(name, app, size, chain_batches):
+    """Return (setup(n) -> [args], op(client, arg) -> response, role, txs_per_op)."""
+    rng = random.Random(7)
+    if name == "create_block":
+        def setup(n):
+            client = _client(app, "farmer")
+            return [client.post("/generate_random_batch").get_json()["batch"]["id"] for _ in range(n)]
+        return setup, lambda c, batch_id: c.post("/create_block", json={"batch_ids": [batch_id]}), "farmer", 1
+    if name == "submit_condition":
+        return (lambda n: [rng.randint(1, size) for _ in range(n)],
+                lambda c, i: c.post("/submit_condition", json={
+                    "batch_id": i, "color": "Yellow", "temperature": 22, "remarks": "ok"}),
+                "wholesaler", 0)
+    if name == "update_status":
+        return (lambda n: [rng.randint(1, chain_batches) for _ in range(n)],
+                lambda c, i: c.post("/update_status", json={
+                    "id": i, "status": "Wholesaler Approved", "ipfsHash": "Qm", "color": "Yellow", "temperature": 21}),
+                "wholesaler", 1)
+    if name == "local_batches":
+        return (lambda n: [None] * n, lambda c, _: c.get("/local_batches"), "farmer", 0)
+    if name == "trace":
+        return (lambda n: [rng.randint(1, size) for _ in range(n)],
+                lambda c, i: c.get(f"/trace/{i}"), "retailer", 0)
+    raise ValueError(name)
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_scenario(app, name, size, requests, concurrency, chain_batches):
+    setup, op, role, txs_per_op = make_scenario(name, app, size, chain_batches)
+    args = setup(requests)
+    clients = [_client(app, role) for _ in range(concurrency)]
+    latencies, errors = [], 0
+    lock = Lock()
+
+    def worker(index):
+        nonlocal errors
+        client = clients[index % concurrency]
+        started = time.perf_counter()
+        response = op(client, args[index])
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(requests)))
+    wall = time.perf_counter() - wall_started
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        "scenario": name,
+        "size": size,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "rps": round(requests / wall, 2),
+        "tx_per_s": round((requests - errors) * txs_per_op / wall, 2),
+    }
+
+# ---------------------------
+# Reporting
+# ---------------------------
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = {(r["scenario"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\n📊 Compared with {previous_path}")
+    for r in results:
+        old = previous.get((r["scenario"], r["size"]))
+        if not old:
+            continue
+        p95 = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0
+        rps = (r["rps"] - old["rps"]) / old["rps"] * 100 if old["rps"] else 0
+        flag = "⚠️" if p95 > 10 or rps < -10 else "✅"
+        print(f"{flag} {r['scenario']:<17} n={r['size']:<8} p95 {p95:+.1f}%  req/s {rps:+.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app on an in-process EVM")
+    parser.add_argument("--bytecode", default=os.path.join(BACKEND_DIR, "contract_bytecode.bin"))
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated batch counts (up to 1000000)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and size")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--block-time", type=float, default=0.0, help="Seconds per block (0 = mine every tx)")
+    parser.add_argument("--chain-batches", type=int, default=20, help="Batches created on chain for update_status")
+    parser.add_argument("--out", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="Previous results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    # Point the app at a scratch data directory before it is imported
+    data_dir = tempfile.mkdtemp(prefix="mango-bench-")
+    os.environ["MANGO_DATA_DIR"] = data_dir
+    sys.path.insert(0, BACKEND_DIR)
+    import app as app_module
+    import chain
+    from storage import BATCHES_FILE
+    import workload
+
+    provider, address, private_key, stop = start_chain(args.bytecode, args.block_time)
+    app = app_module.create_app({
+        "WEB3_PROVIDER": provider,
+        "CONTRACT_ADDRESS": address,
+        "PRIVATE_KEY": private_key,
+        "WARMUP": False,
+        "START_MONITOR": False,
+        "TESTING": True,
+        # Measure the server, not the per-user rate limit
+        "RATE_LIMIT_PER_SEC": 1e9,
+        "RATE_LIMIT_BURST": 1e9,
+    })
+    client = app.extensions["chain"]
+    chain_ids = []
+    for i in range(args.chain_batches):
+        _, receipt = client.transact(client.contract.functions.createBatch("Bench", "BenchFarm", "BenchExports", f"Qm{i}"))
+        chain_ids.append(chain.created_batch_id(client.contract, receipt))
+
+    results = []
+    for size in sizes:
+        for name in scenarios:
+            workload.write_store(BATCHES_FILE, size, seed=42, chain_ids=chain_ids)
+            result = run_scenario(app, name, size, args.requests, args.concurrency, args.chain_batches)
+            results.append(result)
+            print(f"⏱️ {name:<17} n={size:<8} p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+                  f"p99={result['p99_ms']:.1f}ms {result['rps']:.1f} req/s {result['tx_per_s']:.1f} tx/s "
+                  f"errors={result['errors']}")
+    stop.set()
+
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"bench_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(out_path, "w") as f:
+        json.dump({
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "block_time": args.block_time,
+            "results": results,
+        }, f, indent=2)
+    print(f"💾 Results written to {out_path}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
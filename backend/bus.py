@@ -0,0 +1,90 @@
+"""Pluggable event bus used to fan SocketIO events out to every worker.
+
+The leader publishes (e.g. ``new_ganache_block``) with the SocketIO rooms it
+targets, and every worker's subscriber re-emits the event to its own clients
+in those rooms.
+
+    local://            in-process only (single worker, tests)
+    file:///some/dir    Unix datagram sockets in a shared directory
+    redis://... etc.    handed to Flask-SocketIO's own message_queue
+"""
+import glob, json, os, socket
+from threading import Thread, Lock
+
+class LocalBus:
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def publish(self, event, data, rooms=None):
+        self._dispatch(event, data, rooms)
+
+    def _dispatch(self, event, data, rooms=None):
+        for callback in list(self.subscribers):
+            try:
+                callback(event, data, rooms)
+            except Exception as e:
+                print(f"⚠️ Event bus subscriber error: {str(e)}")
+
+    def close(self):
+        pass
+
+class FileSocketBus(LocalBus):
+    """Each worker binds <directory>/<pid>.sock; publish sends to all of them."""
+
+    def __init__(self, directory):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self._send_lock = Lock()
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                payload = self.sock.recv(1 << 20)
+            except OSError:
+                return
+            try:
+                message = json.loads(payload)
+            except ValueError:
+                continue
+            self._dispatch(message["event"], message["data"], message.get("rooms"))
+
+    def publish(self, event, data, rooms=None):
+        payload = json.dumps({"event": event, "data": data, "rooms": rooms}, default=str).encode()
+        with self._send_lock:
+            for peer in glob.glob(os.path.join(self.directory, "*.sock")):
+                try:
+                    self._sender.sendto(payload, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker exited without cleaning up its socket
+                    try:
+                        os.remove(peer)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    print(f"⚠️ Event bus send to {peer} failed: {str(e)}")
+
+    def close(self):
+        self.sock.close()
+        self._sender.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def make_bus(url):
+    """Return (bus, socketio_message_queue) for an EVENT_BUS url."""
+    if not url or url == "local://":
+        return LocalBus(), None
+    if url.startswith("file://"):
+        return FileSocketBus(url[len("file://"):]), None
+    # External brokers: Flask-SocketIO fans out through the queue itself
+    return LocalBus(), url
@@ -0,0 +1,318 @@
+"""Shared web3 helpers: lazy chain client, ABI loading, parallel log scans and batched reads."""
+import json, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Thread, Lock
+
+from web3 import Web3, HTTPProvider
+
+import metrics
+import tracing
+from config import ABI_FILE
+
+# Field order of the MangoTraceability.Batch struct returned by getBatch
+BATCH_FIELDS = [
+    "id", "origin", "farm", "exporter", "status", "ipfsHash",
+    "color", "temperature", "currentOwner", "createdAt", "updatedAt",
+]
+
+@lru_cache(maxsize=None)
+def _load_abi(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_abi(path=ABI_FILE):
+    return _load_abi(path)
+
+def connect(url):
+    web3 = Web3(Web3.HTTPProvider(url))
+    if not web3.is_connected():
+        raise Exception(f"❌ Could not connect to {url}")
+    return web3
+
+def get_contract(web3, address, abi=None):
+    return web3.eth.contract(address=Web3.to_checksum_address(address), abi=abi or load_abi())
+
+def deploy_contract(web3, private_key, bytecode, abi=None, gas=6000000, gas_price_gwei="20"):
+    """Deploy a MangoTraceability instance; return its checksum address."""
+    account = web3.eth.account.from_key(private_key)
+    factory = web3.eth.contract(abi=abi or load_abi(), bytecode=bytecode)
+    txn = factory.constructor().build_transaction({
+        "from": account.address,
+        "nonce": web3.eth.get_transaction_count(account.address, "pending"),
+        "gas": gas,
+        "gasPrice": web3.to_wei(gas_price_gwei, "gwei"),
+    })
+    signed = web3.eth.account.sign_transaction(txn, private_key=private_key)
+    receipt = web3.eth.wait_for_transaction_receipt(web3.eth.send_raw_transaction(signed.raw_transaction))
+    return receipt.contractAddress
+
+def event_abi(name, abi=None):
+    for entry in abi or load_abi():
+        if entry.get("type") == "event" and entry.get("name") == name:
+            return entry
+    raise KeyError(f"Event {name} not in ABI")
+
+def event_topic(name, abi=None):
+    entry = event_abi(name, abi)
+    signature = f"{name}({','.join(i['type'] for i in entry['inputs'])})"
+    return Web3.to_hex(Web3.keccak(text=signature))
+
+class InstrumentedHTTPProvider(HTTPProvider):
+    """HTTPProvider that records per-method RPC latency and errors."""
+
+    def make_request(self, method, params):
+        started = time.perf_counter()
+        name = str(method)
+        try:
+            with tracing.span(f"rpc {name}"):
+                response = super().make_request(method, params)
+        except Exception:
+            metrics.RPC_ERRORS.inc(method=name)
+            raise
+        finally:
+            metrics.RPC_LATENCY.observe(time.perf_counter() - started, method=name)
+        if isinstance(response, dict) and response.get("error"):
+            metrics.RPC_ERRORS.inc(method=name)
+        return response
+
+# ---------------------------
+# Lazily connected chain handle
+# ---------------------------
+class ChainUnavailable(Exception):
+    pass
+
+class ChainClient:
+    """Web3 / contract / signer handles, connected on first use or by warmup().
+
+    ``shard_addresses`` lists every contract shard (see shards.py);
+    ``contract`` is shard 0 and ``contract_at(i)`` any of them.
+    ``shard_keys`` optionally gives shard i its own signing key (falsy
+    entries, and shards past the end, sign with ``private_key``). Each signer
+    has its own nonce stream and ``tx_locks`` entry, so shards with different
+    keys send transactions in parallel while shards sharing one stay serialized.
+    """
+
+    def __init__(self, url, contract_address, private_key, abi=None, provider=None, shard_addresses=None,
+                 shard_keys=None):
+        self.url = url
+        # Optional pre-built provider (e.g. EthereumTesterProvider for benchmarks)
+        self.provider = provider
+        self.shard_addresses = list(shard_addresses or [contract_address])
+        self.contract_address = self.shard_addresses[0]
+        self.private_key = private_key
+        # Distinct signing keys (private_key first) and the one each shard uses
+        self.keys = [private_key]
+        self._signer_of_shard = []
+        shard_keys = list(shard_keys or [])
+        for shard in range(len(self.shard_addresses)):
+            key = (shard_keys[shard] if shard < len(shard_keys) else None) or private_key
+            if key not in self.keys:
+                self.keys.append(key)
+            self._signer_of_shard.append(self.keys.index(key))
+        self._shard_of_address = {address.lower(): i for i, address in enumerate(self.shard_addresses)}
+        self.abi = abi
+        self.error = None
+        self.connected_at = None
+        self.signer = None
+        self.signers = []
+        self._web3 = None
+        self._contracts = []
+        self._lock = Lock()
+        self._warmup_thread = None
+        # One per signer, serializing its nonce allocation; replaced by file locks when several workers share the signers
+        self.tx_locks = [Lock() for _ in self.keys]
+        # Seconds to wait for a receipt before giving up on a request
+        self.receipt_timeout = 120
+
+    def connect(self):
+        with self._lock:
+            if self._web3 is not None:
+                return self._web3
+            web3 = Web3(self.provider or InstrumentedHTTPProvider(self.url))
+            if not web3.is_connected():
+                self.error = f"Could not connect to {self.url}"
+                raise ChainUnavailable(f"❌ {self.error}")
+            self.signers = [web3.eth.account.from_key(key).address for key in self.keys]
+            self.signer = self.signers[0]
+            self._contracts = [get_contract(web3, address, self.abi) for address in self.shard_addresses]
+            self._web3 = web3
+            self.error = None
+            self.connected_at = time.time()
+            print("✅ Connected to Ganache. Signing account:", self.signer,
+                  f"(+{len(self.signers) - 1} shard signers)" if len(self.signers) > 1 else "")
+            return web3
+
+    @property
+    def ready(self):
+        return self._web3 is not None
+
+    @property
+    def web3(self):
+        return self._web3 or self.connect()
+
+    @property
+    def contract(self):
+        return self.contract_at(0)
+
+    def shard_index(self, shard):
+        """``shard`` as a valid index; ValueError naming the registered count otherwise."""
+        index = int(shard or 0)
+        if not 0 <= index < len(self.shard_addresses):
+            raise ValueError(f"Unknown contract shard {shard}: {len(self.shard_addresses)} registered (see shards.json)")
+        return index
+
+    def contract_at(self, shard):
+        index = self.shard_index(shard)
+        self.web3
+        return self._contracts[index]
+
+    def warmup(self, retry_interval=2.0, max_interval=30.0):
+        """Connect in the background, retrying with backoff until the node answers."""
+        if self._warmup_thread is not None:
+            return self._warmup_thread
+
+        def run():
+            interval = retry_interval
+            while not self.ready:
+                try:
+                    self.connect()
+                except Exception as e:
+                    self.error = str(e)
+                    time.sleep(interval)
+                    interval = min(interval * 2, max_interval)
+
+        self._warmup_thread = Thread(target=run, daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def status(self):
+        status = {
+            "connected": self.ready,
+            "url": self.url,
+            "contract": self.contract_address,
+            "shards": self.shard_addresses,
+            "signers": self.signers,
+            "error": self.error,
+        }
+        if self.ready:
+            try:
+                status["block_number"] = self._web3.eth.block_number
+            except Exception as e:
+                status["connected"] = False
+                status["error"] = str(e)
+        return status
+
+    def transact(self, contract_fn, gas=3000000, gas_price_gwei="20"):
+        """Sign, send and wait for ``contract_fn``; return (tx_hex, receipt)."""
+        web3 = self.web3
+        # Signed by the key of the shard the call goes to
+        shard = self._shard_of_address.get((contract_fn.address or "").lower(), 0)
+        signer = self._signer_of_shard[shard]
+        with self.tx_locks[signer]:
+            nonce = web3.eth.get_transaction_count(self.signers[signer], "pending")
+            txn = contract_fn.build_transaction({
+                "from": self.signers[signer],
+                "nonce": nonce,
+                "gas": gas,
+                "gasPrice": web3.to_wei(gas_price_gwei, "gwei")
+            })
+            with tracing.span("tx.sign", function=contract_fn.fn_name):
+                signed = web3.eth.account.sign_transaction(txn, private_key=self.keys[signer])
+            tx_hash = web3.eth.send_raw_transaction(signed.raw_transaction)
+        sent = time.perf_counter()
+        metrics.TX_PENDING.inc()
+        try:
+            with tracing.span("tx.wait_receipt", function=contract_fn.fn_name):
+                receipt = web3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout)
+        finally:
+            metrics.TX_PENDING.dec()
+            metrics.TX_RECEIPT_LATENCY.observe(time.perf_counter() - sent, function=contract_fn.fn_name)
+        return web3.to_hex(tx_hash), receipt
+
+# ---------------------------
+# Parallel log range scanning
+# ---------------------------
+def block_ranges(from_block, to_block, chunk_size):
+    start = from_block
+    while start <= to_block:
+        end = min(start + chunk_size - 1, to_block)
+        yield start, end
+        start = end + 1
+
+def _get_logs(web3, address, topics, start, end):
+    # ``address`` may be a list: one filter covers every shard
+    try:
+        return list(web3.eth.get_logs({
+            "address": address,
+            "fromBlock": start,
+            "toBlock": end,
+            "topics": topics,
+        }))
+    except Exception:
+        # Node refused the range (result cap / timeout): split and retry
+        if start == end:
+            raise
+        mid = (start + end) // 2
+        return _get_logs(web3, address, topics, start, mid) + _get_logs(web3, address, topics, mid + 1, end)
+
+def scan_logs(web3, address, topics, from_block=0, to_block=None, chunk_size=2000, workers=8):
+    """Yield (start, end, logs) for consecutive block ranges, in block order.
+
+    Ranges are fetched concurrently; at most ``workers * 2`` ranges are in
+    flight so memory does not grow with the length of the chain.
+    """
+    if to_block is None:
+        to_block = web3.eth.block_number
+    ranges = block_ranges(from_block, to_block, chunk_size)
+    window = max(1, workers * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for start, end in ranges:
+            pending.append((start, end, pool.submit(_get_logs, web3, address, topics, start, end)))
+            if len(pending) >= window:
+                start, end, future = pending.pop(0)
+                yield start, end, future.result()
+        for start, end, future in pending:
+            yield start, end, future.result()
+
+# ---------------------------
+# Batched getBatch reads
+# ---------------------------
+def batch_to_dict(values):
+    record = dict(zip(BATCH_FIELDS, values))
+    record["id"] = int(record["id"])
+    return record
+
+def _fetch_chunk(web3, contract, ids):
+    # One JSON-RPC round trip per chunk where the web3 version supports it
+    if hasattr(web3, "batch_requests"):
+        try:
+            with web3.batch_requests() as batch:
+                for batch_id in ids:
+                    batch.add(contract.functions.getBatch(batch_id))
+                results = batch.execute()
+            return {batch_id: batch_to_dict(r) for batch_id, r in zip(ids, results)}
+        except Exception:
+            pass
+    return {batch_id: batch_to_dict(contract.functions.getBatch(batch_id).call()) for batch_id in ids}
+
+def fetch_batches(web3, contract, ids, workers=16, chunk_size=100):
+    """Return {chain_id: batch dict} for ``ids`` using parallel, batched RPC."""
+    ids = list(ids)
+    chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    found = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(lambda chunk: _fetch_chunk(web3, contract, chunk), chunks):
+            found.update(result)
+    return found
+
+def created_batch_id(contract, receipt):
+    """Chain batch id assigned by createBatch, read from the receipt's BatchCreated log."""
+    try:
+        events = contract.events.BatchCreated().process_receipt(receipt)
+    except Exception:
+        return None
+    for event in events:
+        return int(event["args"]["id"])
+    return None
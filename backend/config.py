@@ -0,0 +1,13 @@
+import os
+
+# ---------------------------
+# Configuration (edit here)
+# ---------------------------
+# Environment variables of the same name take precedence.
+GANACHE_URL = os.environ.get("GANACHE_URL", "http://127.0.0.1:7545")
+PRIVATE_KEY = os.environ.get("PRIVATE_KEY", "0xf248d6a4e7fbdf1eca5ffd286e8aef4c1da95c103daa5d5ff270e07dd6fdf6ea")
+CONTRACT_ADDRESS = os.environ.get("CONTRACT_ADDRESS", "0x2D485a42fE61e30DF7B44D3268DbE6ca9C858177")
+# Comma-separated signing key per contract shard, in shard order; empty entries use PRIVATE_KEY
+SHARD_PRIVATE_KEYS = [k.strip() for k in os.environ.get("SHARD_PRIVATE_KEYS", "").split(",")]
+
+ABI_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contract_abi.json")
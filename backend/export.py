@@ -0,0 +1,286 @@
+"""Streaming traceability export (NDJSON / CSV / Parquet).
+
+Batches and condition records are read one at a time from the batch store and
+encoded incrementally, so no record list is ever built in memory. The
+positions and ids of exported batches are kept (to select their condition
+records), so memory grows with the number of batches exported, by a few dozen
+bytes each.
+
+A condition record names its batch the way ``submit_condition`` finds it: by
+position in the store (``batch_id`` 1 is the first batch). Exported
+condition records carry the id of that batch instead, so they join with the
+batch records whatever the batch's own id (e.g. ``"1001"`` for generated ones).
+
+    python export.py --format csv --farm GreenFarm-001 --since 2025-01-01 --gzip -o audit.csv.gz
+"""
+import argparse, csv, io, json, sys, zlib
+
+import history
+from storage import BATCHES_FILE, iter_json_array
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Flat column layout shared by CSV and Parquet; nested values are JSON-encoded
+EXPORT_COLUMNS = [
+    "record_type", "batch_id", "origin", "farm", "exporter", "status",
+    "ipfsHash", "color", "temperature", "condition", "role", "user",
+    "remarks", "reasons", "created_by", "timestamp", "tx_hash",
+    "block_number", "history",
+]
+
+CHUNK_SIZE = 65536
+PARQUET_ROW_GROUP = 10000
+
+# ---------------------------
+# Filters
+# ---------------------------
+def _in_range(timestamp, since, until):
+    # ISO-8601 strings compare correctly as plain strings
+    ts = str(timestamp or "")
+    if since and ts < since:
+        return False
+    if until and ts[:len(until)] > until:
+        return False
+    return True
+
+def _batch_matches(batch, filters, path):
+    if filters.get("farm") and batch.get("farm") != filters["farm"]:
+        return False
+    if filters.get("status") and batch.get("status") != filters["status"]:
+        return False
+    if filters.get("role"):
+        if not any(h.get("role") == filters["role"] for h in history.iter_history(batch, path)):
+            return False
+    return _in_range(batch.get("timestamp"), filters.get("since"), filters.get("until"))
+
+def _condition_matches(record, filters):
+    if filters.get("role") and record.get("role") != filters["role"]:
+        return False
+    return _in_range(record.get("timestamp"), filters.get("since"), filters.get("until"))
+
+# ---------------------------
+# Record stream
+# ---------------------------
+def iter_export_records(path=BATCHES_FILE, **filters):
+    """Yield flat batch records, then the condition records of those batches."""
+    exported = {}  # store position (1-based) -> batch id
+    for position, batch in enumerate(iter_json_array(path, "batches"), 1):
+        if not _batch_matches(batch, filters, path):
+            continue
+        exported[position] = batch.get("id")
+        record = dict(batch)
+        record["record_type"] = "batch"
+        record["batch_id"] = record.pop("id", None)
+        record.setdefault("tx_hash", None)
+        record.setdefault("block_number", None)
+        # One batch's history extent at a time
+        record["history"] = history.load(batch, path)
+        for field in history.HEADER_FIELDS[1:]:
+            record.pop(field, None)
+        yield record
+
+    for condition in iter_json_array(path, "conditions"):
+        try:
+            position = int(condition.get("batch_id"))
+        except (TypeError, ValueError):
+            continue
+        if position not in exported or not _condition_matches(condition, filters):
+            continue
+        record = dict(condition)
+        record["record_type"] = "condition"
+        record["batch_id"] = exported[position]
+        record.setdefault("tx_hash", record.get("onchain_tx"))
+        record.setdefault("block_number", None)
+        yield record
+
+# ---------------------------
+# Encoders
+# ---------------------------
+def _flat_row(record):
+    row = {}
+    for col in EXPORT_COLUMNS:
+        value = record.get(col)
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value, default=str)
+        row[col] = value
+    return row
+
+def _buffered(chunks, size=CHUNK_SIZE):
+    pending, length = [], 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(pending)
+            pending, length = [], 0
+    if pending:
+        yield "".join(pending)
+
+def encode_ndjson(records):
+    return _buffered(json.dumps(r, default=str) + "\n" for r in records)
+
+def encode_csv(records):
+    def rows():
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(_flat_row(record))
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        yield out.getvalue()
+    return _buffered(rows())
+
+class _DrainSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator."""
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    return pa, pq
+
+def encode_parquet(records, row_group=PARQUET_ROW_GROUP):
+    pa, pq = _pyarrow()
+
+    fields = []
+    for col in EXPORT_COLUMNS:
+        if col == "temperature":
+            fields.append(pa.field(col, pa.float64()))
+        elif col == "block_number":
+            fields.append(pa.field(col, pa.int64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    schema = pa.schema(fields)
+
+    def to_columns(rows):
+        columns = {col: [] for col in EXPORT_COLUMNS}
+        for row in rows:
+            for col in EXPORT_COLUMNS:
+                value = row[col]
+                if col == "temperature":
+                    value = _to_float(value)
+                elif col == "block_number":
+                    value = _to_int(value)
+                elif value is not None:
+                    value = str(value)
+                columns[col].append(value)
+        return pa.table(columns, schema=schema)
+
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema)
+    rows = []
+    for record in records:
+        rows.append(_flat_row(record))
+        if len(rows) >= row_group:
+            writer.write_table(to_columns(rows))
+            rows = []
+            data = sink.drain()
+            if data:
+                yield data
+    if rows:
+        writer.write_table(to_columns(rows))
+    writer.close()
+    yield sink.drain()
+
+ENCODERS = {"ndjson": encode_ndjson, "csv": encode_csv, "parquet": encode_parquet}
+
+def _as_bytes(chunks):
+    for chunk in chunks:
+        yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(fmt="ndjson", compress=None, path=BATCHES_FILE, **filters):
+    """Return a generator of encoded (and optionally gzipped) export bytes."""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet":
+        # Fail before the first byte is sent, not halfway through the stream
+        _pyarrow()
+    chunks = _as_bytes(ENCODERS[fmt](iter_export_records(path, **filters)))
+    if compress == "gzip":
+        chunks = gzip_stream(chunks)
+    elif compress:
+        raise ValueError(f"Unsupported compression: {compress}")
+    return chunks
+
+def export_filename(fmt, compress=None):
+    name = f"batches_export.{FORMATS[fmt][1]}"
+    return name + ".gz" if compress == "gzip" else name
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a traceability export of the batch store")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--since", help="Earliest timestamp (ISO date/time)")
+    parser.add_argument("--until", help="Latest timestamp (ISO date/time, inclusive prefix)")
+    parser.add_argument("--farm")
+    parser.add_argument("--status")
+    parser.add_argument("--role")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output stream")
+    parser.add_argument("--store", default=BATCHES_FILE, help="Path to batches.json")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    stream = export_stream(
+        args.format, "gzip" if args.gzip else None, args.store,
+        since=args.since, until=args.until, farm=args.farm,
+        status=args.status, role=args.role,
+    )
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Room-targeted, coalescing SocketIO fan-out.
+
+Clients are placed in rooms: ``all`` and ``role:<role>`` on connect,
+``batch:<id>`` and ``farm:<name>`` through the ``subscribe`` event. Published
+events are buffered for a short window, then each client gets at most one
+``events`` message per window holding only the events for its rooms:
+
+    {"events": [[seq, event, data], ...], "dropped": 0}
+
+Clients acknowledge each message. A client with too many unacknowledged
+messages is a slow consumer: its events are dropped, and the count is
+reported in ``dropped`` once it catches up so it can refetch.
+
+With an external message queue, rooms are handed to Flask-SocketIO and each
+room gets one batched message per window (no per-client acks).
+"""
+import itertools
+from functools import partial
+from threading import Thread, Lock, Event
+
+import metrics
+
+ALL = "all"
+MAX_ROOMS_PER_CLIENT = 200
+
+def role_room(role):
+    return f"role:{role}"
+
+def batch_room(batch_id):
+    return f"batch:{batch_id}"
+
+def farm_room(farm):
+    return f"farm:{farm}"
+
+class CoalescingEmitter:
+    def __init__(self, socketio, window=0.1, max_unacked=4, per_client=True, namespace="/"):
+        self.socketio = socketio
+        self.window = window
+        self.max_unacked = max_unacked
+        self.per_client = per_client
+        self.namespace = namespace
+        self._seq = itertools.count(1)
+        self._lock = Lock()
+        self._pending = []   # (seq, event, data, rooms)
+        self._members = {}   # room -> {sid}
+        self._rooms = {}     # sid -> {room}
+        self._unacked = {}   # sid -> messages awaiting ack
+        self._dropped = {}   # sid -> events dropped since its last delivery
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------------------------
+    # Membership
+    # ---------------------------
+    def join(self, sid, room):
+        with self._lock:
+            rooms = self._rooms.setdefault(sid, set())
+            if room in rooms:
+                return True
+            if len(rooms) >= MAX_ROOMS_PER_CLIENT:
+                return False
+            rooms.add(room)
+            self._members.setdefault(room, set()).add(sid)
+        if not self.per_client:
+            self.socketio.server.enter_room(sid, room, namespace=self.namespace)
+        return True
+
+    def leave(self, sid, room):
+        with self._lock:
+            self._rooms.get(sid, set()).discard(room)
+            members = self._members.get(room)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self._members[room]
+        if not self.per_client:
+            self.socketio.server.leave_room(sid, room, namespace=self.namespace)
+
+    def rooms(self, sid):
+        with self._lock:
+            return set(self._rooms.get(sid, ()))
+
+    def forget(self, sid):
+        with self._lock:
+            for room in self._rooms.pop(sid, ()):
+                members = self._members.get(room)
+                if members is not None:
+                    members.discard(sid)
+                    if not members:
+                        del self._members[room]
+            self._unacked.pop(sid, None)
+            self._dropped.pop(sid, None)
+
+    # ---------------------------
+    # Publishing
+    # ---------------------------
+    def publish(self, event, data, rooms=None):
+        with self._lock:
+            self._pending.append((next(self._seq), event, data, tuple(rooms or (ALL,))))
+
+    def _run(self):
+        while not self._stop.wait(self.window):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ SocketIO fan-out error: {str(e)}")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            deliveries = {}
+            if not self.per_client:
+                for seq, event, data, rooms in pending:
+                    # Members may be on other workers; the queue knows them all
+                    for room in rooms:
+                        deliveries.setdefault(room, []).append([seq, event, data])
+            else:
+                for seq, event, data, rooms in pending:
+                    item = [seq, event, data]
+                    seen = set()
+                    for room in rooms:
+                        for sid in self._members.get(room, ()):
+                            if sid not in seen:
+                                seen.add(sid)
+                                deliveries.setdefault(sid, []).append(item)
+
+        for target, events in deliveries.items():
+            if self.per_client:
+                self._send(target, events)
+            else:
+                self.socketio.emit("events", {"events": events, "dropped": 0}, to=target, namespace=self.namespace)
+                metrics.SOCKET_EMITS.inc(event="events")
+                metrics.SOCKET_BATCH_EVENTS.observe(len(events))
+
+    def _send(self, sid, events):
+        with self._lock:
+            if sid not in self._rooms:
+                return
+            if self._unacked.get(sid, 0) >= self.max_unacked:
+                if not self._dropped.get(sid):
+                    print(f"🐌 Slow SocketIO consumer {sid}; dropping events until it catches up")
+                self._dropped[sid] = self._dropped.get(sid, 0) + len(events)
+                metrics.SOCKET_DROPPED.inc(len(events))
+                return
+            self._unacked[sid] = self._unacked.get(sid, 0) + 1
+            dropped = self._dropped.pop(sid, 0)
+        self.socketio.emit(
+            "events", {"events": events, "dropped": dropped},
+            to=sid, namespace=self.namespace, callback=partial(self._ack, sid),
+        )
+        metrics.SOCKET_EMITS.inc(event="events")
+        metrics.SOCKET_BATCH_EVENTS.observe(len(events))
+
+    def _ack(self, sid, *args):
+        with self._lock:
+            if self._unacked.get(sid):
+                self._unacked[sid] -= 1
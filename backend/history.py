@@ -0,0 +1,264 @@
+"""Batch history in shared append-only segments.
+
+A batch's history (approved condition checks, chain updates) lives in
+``<store dir>/history/segment-<n>.ndjson`` files that every batch appends to;
+a segment is closed once it passes ``SEGMENT_BYTES`` and the next one starts.
+The batch record in batches.json only keeps a small header saying where its
+history is:
+
+    "history_count": 3, "history_segment": 0, "history_offset": 81920, "history_bytes": 512
+
+Appending writes only the new records to the end of the current segment, as
+one new extent that starts with a link to the batch's previous extent:
+
+    {"_prev": [0, 81920, 512]}
+
+and moves the header there. Bytes written are proportional to the records
+appended. Reading a batch follows the links back: one read per append it
+has had. Segments are never rewritten: an append whose store write never
+happened only leaves unreferenced bytes behind, and every extent older
+headers point at (point-in-time views in temporal.py) still reads as the
+history it was at that time.
+
+Batches that still embed a ``history`` list, or that have a per-batch
+``history/<id>.ndjson`` file from before segments were shared, are read as
+before and moved into a segment on their next append; ``python history.py
+--migrate`` moves all of them at once.
+"""
+import argparse, json, os, re, shutil, time
+from threading import Lock
+
+from storage import BATCHES_FILE, read_json, write_json
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+HEADER_FIELDS = ("history_count", "history_segment", "history_offset", "history_bytes")
+LINK = "_prev"
+
+_lock = Lock()
+_writers = {}  # history dir -> _SegmentWriter
+
+def history_dir(store_path=BATCHES_FILE):
+    return os.path.join(os.path.dirname(os.path.abspath(store_path)), "history")
+
+def segment_path(segment, store_path=BATCHES_FILE):
+    return os.path.join(history_dir(store_path), f"segment-{int(segment):06d}.ndjson")
+
+def _legacy_path(batch_id, store_path=BATCHES_FILE):
+    # One file per batch, as written before segments were shared
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(batch_id))
+    return os.path.join(history_dir(store_path), f"{name}.ndjson")
+
+def header(batch):
+    """The batch without its embedded history, plus ``history_count``."""
+    if "history" not in batch:
+        out = dict(batch)
+        out.setdefault("history_count", 0)
+        return out
+    out = {k: v for k, v in batch.items() if k != "history"}
+    out["history_count"] = batch.get("history_count", 0) + len(batch["history"])
+    return out
+
+# ---------------------------
+# Writing
+# ---------------------------
+class _SegmentWriter:
+    """Appends to the current segment of one history directory.
+
+    Writes go through an O_APPEND descriptor, so workers appending to the same
+    segment never overwrite each other; the offset of a write is read back
+    from the descriptor right after it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segment = None
+        self.fd = None
+        self.pid = None
+
+    def _open(self):
+        if self.fd is not None and self.pid == os.getpid():
+            return
+        # A descriptor inherited across fork shares its offset with the parent
+        os.makedirs(self.directory, exist_ok=True)
+        if self.segment is None:
+            numbers = [int(m.group(1)) for m in (re.match(r"segment-(\d+)\.ndjson$", n) for n in os.listdir(self.directory)) if m]
+            self.segment = max(numbers, default=0)
+        self.fd = os.open(os.path.join(self.directory, f"segment-{self.segment:06d}.ndjson"),
+                          os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.pid = os.getpid()
+
+    def write(self, payload):
+        """Append ``payload`` in one write; return (segment, offset)."""
+        self._open()
+        written = os.write(self.fd, payload)
+        if written != len(payload):
+            raise OSError(f"Short write to history segment {self.segment} ({written} of {len(payload)} bytes)")
+        end = os.lseek(self.fd, 0, os.SEEK_CUR)
+        segment = self.segment
+        if end >= SEGMENT_BYTES:
+            self.close()
+            self.segment += 1
+        return segment, end - len(payload)
+
+    def close(self):
+        if self.fd is not None and self.pid == os.getpid():
+            os.close(self.fd)
+        self.fd = None
+
+def _writer(store_path):
+    directory = history_dir(store_path)
+    writer = _writers.get(directory)
+    if writer is None:
+        writer = _writers[directory] = _SegmentWriter(directory)
+    return writer
+
+def _encode(records):
+    return "".join(json.dumps(r, default=str) + "\n" for r in records).encode()
+
+def _link(batch):
+    # First line of an extent that continues an earlier one
+    return _encode([{LINK: [batch.get("history_segment", 0), batch["history_offset"], batch["history_bytes"]]}])
+
+def append_many(items, store_path=BATCHES_FILE):
+    """Append ``records`` for every ``(batch, records)`` in ``items`` with one write.
+
+    Each batch gets one new extent holding the new records and a link to its
+    previous extent. The caller still has to save the store for the records to count."""
+    extents = []
+    for batch, records in items:
+        records = batch.pop("history", []) + list(records)
+        if _is_legacy(batch):
+            # Moved into a segment once, whole
+            payload = _read_committed(batch, store_path) + _encode(records)
+        elif not records:
+            continue
+        elif batch.get("history_bytes"):
+            payload = _link(batch) + _encode(records)
+        else:
+            payload = _encode(records)
+        extents.append((batch, len(records), payload))
+    if not extents:
+        return
+    with _lock:
+        segment, offset = _writer(store_path).write(b"".join(payload for _, _, payload in extents))
+    for batch, count, payload in extents:
+        batch["history_count"] = batch.get("history_count", 0) + count
+        batch["history_segment"] = segment
+        batch["history_offset"] = offset
+        batch["history_bytes"] = len(payload)
+        offset += len(payload)
+
+def append(batch, records, store_path=BATCHES_FILE):
+    """Append ``records`` to the batch's history and move its header to the new extent.
+
+    The caller still has to save the store for the records to count.
+    """
+    append_many([(batch, records)], store_path)
+    return batch
+
+# ---------------------------
+# Reading
+# ---------------------------
+def _is_legacy(batch):
+    return bool(batch.get("history_bytes")) and batch.get("history_offset") is None
+
+def _read(batch, f, offset, length):
+    f.seek(offset)
+    data = f.read(length)
+    if len(data) < length:
+        print(f"⚠️ History of batch {batch.get('id')} is shorter than its header ({len(data)} of {length} bytes)")
+    return data
+
+def _read_committed(batch, store_path):
+    """The batch's committed history as NDJSON bytes, following extent links."""
+    length = batch.get("history_bytes", 0)
+    if not length:
+        return b""
+    if _is_legacy(batch):
+        try:
+            with open(_legacy_path(batch.get("id"), store_path), "rb") as f:
+                return _read(batch, f, 0, length)
+        except FileNotFoundError:
+            return b""
+    chunks = []
+    files = {}  # segment -> open file, for the length of the walk
+    pointer = (batch.get("history_segment", 0), batch["history_offset"], length)
+    try:
+        while pointer:
+            segment, offset, length = pointer
+            if segment not in files:
+                try:
+                    files[segment] = open(segment_path(segment, store_path), "rb")
+                except FileNotFoundError:
+                    break
+            data = _read(batch, files[segment], offset, length)
+            pointer = None
+            if data.startswith(b'{"%s"' % LINK.encode()):
+                line, _, data = data.partition(b"\n")
+                pointer = tuple(json.loads(line)[LINK])
+            chunks.append(data)
+    finally:
+        for f in files.values():
+            f.close()
+    return b"".join(reversed(chunks))
+
+def iter_history(batch, store_path=BATCHES_FILE):
+    """Yield the batch's history records, oldest first."""
+    for line in _read_committed(batch, store_path).splitlines():
+        if line:
+            yield json.loads(line)
+    yield from batch.get("history", [])
+
+def load(batch, store_path=BATCHES_FILE):
+    return list(iter_history(batch, store_path))
+
+def clear(store_path=BATCHES_FILE, backup=False):
+    """Remove (or with ``backup`` move aside) every segment of a store."""
+    directory = history_dir(store_path)
+    with _lock:
+        writer = _writers.pop(directory, None)
+        if writer is not None:
+            writer.close()
+    if not os.path.isdir(directory):
+        return None
+    if backup:
+        moved = f"{directory}.bak-{int(time.time())}"
+        os.replace(directory, moved)
+        return moved
+    shutil.rmtree(directory)
+    return None
+
+def migrate(store_path=BATCHES_FILE):
+    """Move embedded history lists and per-batch files into segments. Returns batches migrated."""
+    data = read_json(store_path, {"batches": [], "conditions": []})
+    pending = [b for b in data.get("batches", []) if "history" in b or _is_legacy(b)]
+    for start in range(0, len(pending), 1000):
+        append_many([(batch, []) for batch in pending[start:start + 1000]], store_path)
+    if pending:
+        write_json(store_path, data)
+        for batch in pending:
+            # Only now that the store points at the segments
+            try:
+                os.remove(_legacy_path(batch.get("id"), store_path))
+            except OSError:
+                pass
+    return len(pending)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch history segments")
+    parser.add_argument("--store", default=BATCHES_FILE)
+    parser.add_argument("--migrate", action="store_true", help="Move embedded history lists and per-batch files into segments")
+    parser.add_argument("--show", help="Print the history of this batch id")
+    args = parser.parse_args(argv)
+
+    if args.migrate:
+        print(f"✅ Migrated {migrate(args.store)} batches to {history_dir(args.store)}")
+    if args.show:
+        data = read_json(args.store, {"batches": []})
+        batch = next((b for b in data.get("batches", []) if str(b.get("id")) == args.show), None)
+        if batch is None:
+            raise SystemExit(f"❌ Batch {args.show} not found")
+        for record in iter_history(batch, args.store):
+            print(json.dumps(record, default=str))
+
+if __name__ == "__main__":
+    main()
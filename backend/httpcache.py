@@ -0,0 +1,127 @@
+"""HTTP validators, compression and static caching for the Flask app.
+
+- Store-backed GET routes are wrapped with ``revalidated(view, *files)``: the
+  ETag is derived from the files' revisions, so a matching ``If-None-Match``
+  is answered with 304 before the store is read at all.
+- Other GET responses get a content-hash ETag and the usual conditional
+  handling.
+- JSON / HTML / CSS / JS bodies above ``COMPRESS_MIN_BYTES`` are gzip'ed
+  (brotli when the ``brotli`` package is installed and the client accepts it).
+  Streamed responses (exports) are left alone; large JSON documents are
+  streamed with ``stream_json``, which compresses as it encodes.
+- Static files requested with a ``?v=<content hash>`` fingerprint (added by
+  ``url_for('static', ...)`` and to QR URLs) are cached as immutable.
+"""
+import gzip, hashlib, os
+from functools import wraps
+
+from flask import request, current_app, stream_with_context
+
+from export import gzip_stream
+from serialization import iter_json
+from storage import revision
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {"application/json", "text/html", "text/css", "application/javascript", "text/javascript"}
+
+# ---------------------------
+# Fingerprints
+# ---------------------------
+_fingerprints = {}
+
+def fingerprint(path):
+    """Short content hash of a file, recomputed only when it changes."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+    _fingerprints[path] = (key, digest)
+    return digest
+
+def static_url_defaults(endpoint, values):
+    # url_for('static', filename=...) → /static/<file>?v=<hash>
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        digest = fingerprint(os.path.join(current_app.static_folder, values["filename"]))
+        if digest:
+            values["v"] = digest
+
+# ---------------------------
+# Validators
+# ---------------------------
+def _etag(*parts):
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=12).hexdigest()
+
+def revalidated(view, *paths):
+    """Wrap a GET view whose output only depends on ``paths`` and the URL."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        tag = _etag(current_app.config["ETAG_SALT"], request.full_path, *(revision(p) for p in paths))
+        if request.if_none_match.contains_weak(tag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(tag, weak=True)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return wrapper
+
+def finalize_response(response):
+    """after_request hook: static caching, content-hash ETags, compression."""
+    config = current_app.config
+    if request.endpoint == "static":
+        if request.args.get("v"):
+            response.headers["Cache-Control"] = f"public, max-age={config['STATIC_MAX_AGE']}, immutable"
+        return response
+
+    if (request.method != "GET" or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or response.headers.get("Content-Encoding")):
+        return response
+    if response.mimetype not in COMPRESSIBLE:
+        return response
+
+    body = response.get_data()
+    if "ETag" not in response.headers:
+        response.set_etag(hashlib.blake2b(body, digest_size=12).hexdigest(), weak=True)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    if len(body) < config["COMPRESS_MIN_BYTES"]:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(body, quality=config["COMPRESS_LEVEL"]))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=config["COMPRESS_LEVEL"]))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+    response.vary.add("Accept-Encoding")
+    return response
+
+# ---------------------------
+# Streamed JSON
+# ---------------------------
+def stream_json(document):
+    """Response that encodes ``document`` in chunks (gzip'ed when accepted)
+    instead of building the whole body in memory."""
+    chunks = iter_json(document)
+    headers = {}
+    if request.accept_encodings["gzip"]:
+        chunks = gzip_stream(chunks, current_app.config["COMPRESS_LEVEL"])
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return current_app.response_class(stream_with_context(chunks), mimetype="application/json", headers=headers)
@@ -0,0 +1,83 @@
+"""File-lock based leadership and cross-process locks for multi-worker mode.
+
+Only one worker may run the block monitor, and all workers share one signing
+account, so both are coordinated through ``flock`` on files in ``data/``.
+The OS drops a lock when its process dies, so a crashed leader is replaced
+on the next election attempt. Without ``fcntl`` (Windows) every process
+assumes it is alone.
+"""
+import os, time
+from threading import Thread, Lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class FileLock:
+    """Exclusive lock shared by threads of this process and by other processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+class LeaderLease:
+    """Held for the life of the process by whichever worker locks ``path`` first."""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_leader = False
+        self._fd = None
+
+    def try_acquire(self):
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        self.is_leader = True
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.is_leader = False
+
+    def run_when_leader(self, targets, retry_interval=5.0):
+        """Start ``targets`` in daemon threads once this worker wins the lease."""
+        def elect():
+            while not self.try_acquire():
+                time.sleep(retry_interval)
+            print(f"👑 Worker {os.getpid()} is leader; starting {len(targets)} background job(s)")
+            for target in targets:
+                Thread(target=target, daemon=True).start()
+
+        thread = Thread(target=elect, daemon=True)
+        thread.start()
+        return thread
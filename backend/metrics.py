@@ -0,0 +1,146 @@
+"""Minimal in-process Prometheus metrics (counters, gauges, histograms).
+
+Kept dependency-free and cheap enough to stay on in production: recording a
+sample is a dict lookup, a bisect and an add under a per-metric lock.
+``render()`` produces the text exposition format served on ``/metrics``.
+"""
+import bisect
+from threading import Lock
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    labels = _label_text(self.labelnames, key, ("le", _fmt(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_fmt(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+REGISTRY = []
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------------------------
+# Application metrics
+# ---------------------------
+WORKER_INFO = Gauge("app_worker_info", "Worker process serving this scrape (set by create_app)", ["pid"])
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Flask request latency", ["route", "method", "status"])
+
+RPC_LATENCY = Histogram("web3_rpc_duration_seconds", "JSON-RPC call latency", ["method"])
+RPC_ERRORS = Counter("web3_rpc_errors_total", "JSON-RPC calls that raised or returned an error", ["method"])
+
+STORE_LATENCY = Histogram("json_store_duration_seconds", "JSON store read/write latency", ["op", "file"],
+                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+STORE_BYTES = Counter("json_store_bytes_total", "Bytes read from / written to the JSON store", ["op", "file"])
+
+TX_RECEIPT_LATENCY = Histogram("chain_tx_submit_to_receipt_seconds", "Time from sending a transaction to its receipt", ["function"])
+TX_PENDING = Gauge("chain_pending_transactions", "Transactions sent and still waiting for a receipt")
+
+ADMISSION_INFLIGHT = Gauge("admission_inflight_requests", "Transaction slots held by admitted requests (one per transaction)", ["lane"])
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for an admission slot", ["lane"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests turned away with 429/503", ["lane", "reason"])
+
+MONITOR_LAG = Gauge("block_monitor_lag_blocks", "Latest chain block minus last processed block, at each poll")
+MONITOR_LAG_SECONDS = Gauge("block_monitor_lag_seconds", "Wall-clock delay between a block's timestamp and its processing")
+MONITOR_LAST_BLOCK = Gauge("block_monitor_last_processed_block", "Last block processed by the monitor")
+
+SOCKET_CLIENTS = Gauge("socketio_connected_clients", "Connected SocketIO clients on this worker")
+SOCKET_EMITS = Counter("socketio_emits_total", "SocketIO events emitted by this worker", ["event"])
+SOCKET_BATCH_EVENTS = Histogram("socketio_batch_events", "Events coalesced into one SocketIO message",
+                                buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
+SOCKET_DROPPED = Counter("socketio_dropped_events_total", "Events dropped for slow SocketIO consumers")
+
+LOGIN_VERIFY = Counter("login_verifications_total", "Password checks by outcome (cached, verified, rejected)", ["result"])
+SESSIONS_ACTIVE = Gauge("server_sessions_active", "Unexpired server-side sessions held by this worker's store")
@@ -0,0 +1,245 @@
+"""Rebuild the local batch store from contract events.
+
+Replays ``BatchCreated`` / ``BatchUpdated`` logs in block order into
+``batches.json``. Log ranges are fetched concurrently (one filter over every
+contract shard), decoded with a cached ABI decoder and applied in
+(block, log index) order. Progress is checkpointed, so an interrupted rebuild
+picks up where it stopped. The store keeps its order and new batches are
+appended as they are created, so a batch's id is its position + 1 (the lookup
+``submit_condition`` and ``update_status`` use) whatever its shard; the shard
+is kept in its own ``shard`` field. Local batches are matched to events only
+through an explicit ``(shard, chain_id)``.
+
+    python rebuild.py                       # cold start or resume
+    python rebuild.py --snapshot old.json --from-block 120000
+"""
+import argparse, os, shutil, time
+from datetime import datetime
+from functools import lru_cache
+
+from eth_abi import decode as abi_decode
+from web3 import Web3
+
+import chain
+import history
+import shards
+import temporal
+from config import ABI_FILE, GANACHE_URL, CONTRACT_ADDRESS
+from storage import BATCHES_FILE, DATA_DIR, read_json, write_json
+
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "rebuild_checkpoint.json")
+REPLAYED_EVENTS = ["BatchCreated", "BatchUpdated"]
+
+# ---------------------------
+# Cached event decoder
+# ---------------------------
+class EventDecoder:
+    """Decodes raw logs by topic without going through contract event objects."""
+
+    def __init__(self, abi, names):
+        self.events = {}
+        for name in names:
+            entry = chain.event_abi(name, abi)
+            # None of the replayed events have indexed inputs; everything is in data
+            self.events[chain.event_topic(name, abi).lower()] = (
+                name,
+                [i["name"] for i in entry["inputs"]],
+                [i["type"] for i in entry["inputs"]],
+            )
+
+    @property
+    def topics(self):
+        return list(self.events)
+
+    def decode(self, log):
+        topic = Web3.to_hex(log["topics"][0]).lower()
+        if topic not in self.events:
+            return None
+        name, arg_names, arg_types = self.events[topic]
+        values = abi_decode(arg_types, bytes(log["data"]))
+        return {
+            "event": name,
+            "args": dict(zip(arg_names, values)),
+            "block_number": log["blockNumber"],
+            "log_index": log["logIndex"],
+            "tx_hash": Web3.to_hex(log["transactionHash"]),
+            "address": log["address"],
+        }
+
+@lru_cache(maxsize=None)
+def get_decoder(abi_path=ABI_FILE):
+    return EventDecoder(chain.load_abi(abi_path), tuple(REPLAYED_EVENTS))
+
+# ---------------------------
+# Event application
+# ---------------------------
+def _new_batch(batches, index, shard, chain_id):
+    # Appended in event order; the routes find a batch at position id - 1, on any shard
+    batch = {"id": len(batches) + 1, "chain_id": chain_id, "shard": shard}
+    batches.append(batch)
+    index[(shard, chain_id)] = batch
+    return batch
+
+def apply_event(batches, index, event):
+    """Apply one decoded event to ``batches`` (``index`` maps (shard, chain_id) to a batch)."""
+    args = event["args"]
+    shard = event.get("shard", 0)
+    chain_id = int(args["id"])
+    batch = index.get((shard, chain_id)) or _new_batch(batches, index, shard, chain_id)
+    if event["event"] == "BatchCreated":
+        batch.update({
+            "origin": args["origin"],
+            "status": args["status"],
+            "tx_hash": event["tx_hash"],
+            "block_number": event["block_number"],
+        })
+        return
+    batch.update({
+        "status": args["status"],
+        "color": args["color"],
+        "temperature": _temperature(args["temperature"]),
+        "tx_hash": event["tx_hash"],
+        "block_number": event["block_number"],
+    })
+    batch.setdefault("history", []).append({
+        "batch_id": batch["id"],
+        "status": args["status"],
+        "color": args["color"],
+        "temperature": _temperature(args["temperature"]),
+        "tx_hash": event["tx_hash"],
+        "block_number": event["block_number"],
+        "source": "chain",
+    })
+
+def _temperature(value):
+    try:
+        return float(value) if value != "" else ""
+    except ValueError:
+        return value
+
+def fill_static_fields(web3, contracts, index, workers=16):
+    # Events do not carry farm/exporter/ipfsHash; read them once per batch, from its shard
+    missing = {}
+    for (shard, chain_id), batch in index.items():
+        if "farm" not in batch:
+            missing.setdefault(shard, []).append(chain_id)
+    for shard, chain_ids in missing.items():
+        for chain_id, onchain in chain.fetch_batches(web3, contracts[shard], chain_ids, workers=workers).items():
+            _fill(index[(shard, chain_id)], onchain)
+
+def _fill(batch, onchain):
+    batch["farm"] = onchain["farm"]
+    batch["exporter"] = onchain["exporter"]
+    batch["ipfsHash"] = onchain["ipfsHash"]
+    batch.setdefault("color", onchain["color"])
+    batch.setdefault("temperature", _temperature(onchain["temperature"]))
+    if onchain.get("createdAt"):
+        batch["timestamp"] = datetime.utcfromtimestamp(onchain["createdAt"]).isoformat()
+
+# ---------------------------
+# Checkpointed replay
+# ---------------------------
+def _load_state(path):
+    """Return (batches in store order, {(shard, chain_id): batch}, conditions)."""
+    data = read_json(path, {"batches": [], "conditions": []})
+    batches = data.get("batches", [])
+    # Only batches that recorded a chain id; pending local ones have none yet
+    index = {(int(b.get("shard") or 0), int(b["chain_id"])): b for b in batches if b.get("chain_id") is not None}
+    return batches, index, data.get("conditions", [])
+
+def _save(path, batches, conditions, checkpoint):
+    # Events replayed since the last save move from memory into history segments
+    history.append_many([(batch, []) for batch in batches if batch.get("history")], path)
+    # Store order is kept: submit_condition / update_status rely on id == position + 1
+    write_json(path, {"batches": batches, "conditions": conditions})
+    write_json(CHECKPOINT_FILE, checkpoint)
+
+def rebuild(web3, contracts, path=BATCHES_FILE, from_block=None, to_block=None,
+            chunk_size=2000, workers=8, checkpoint_every=50, snapshot=None):
+    """Replay events of ``contracts`` (one contract, or every shard in order)."""
+    started = time.time()
+    if not isinstance(contracts, (list, tuple)):
+        contracts = [contracts]
+    addresses = [c.address for c in contracts]
+    shard_of = {address.lower(): i for i, address in enumerate(addresses)}
+    checkpoint = read_json(CHECKPOINT_FILE, {}) if os.path.exists(CHECKPOINT_FILE) else {}
+    recorded = checkpoint.get("contracts") or [checkpoint.get("contract", "")]
+    if checkpoint and [a.lower() for a in recorded] != list(shard_of):
+        raise Exception("❌ Checkpoint belongs to different contracts; use --reset")
+
+    if snapshot:
+        if from_block is None:
+            # The snapshot's events would be replayed a second time from genesis
+            raise Exception("❌ --snapshot needs --from-block (the first block the snapshot does not cover)")
+        shutil.copyfile(snapshot, path)
+        checkpoint = {}
+    batches, index, conditions = _load_state(path)
+    if batches and not checkpoint and not snapshot and from_block is None:
+        # Replaying genesis over a live store would merge unrelated local ids
+        raise Exception("❌ Store already has batches and no checkpoint; use --reset or --snapshot")
+    if from_block is None:
+        from_block = checkpoint.get("last_block", -1) + 1
+    if to_block is None:
+        to_block = web3.eth.block_number
+
+    decoder = get_decoder()
+    applied = checkpoint.get("applied", 0)
+    ranges_done = 0
+    print(f"🔁 Replaying blocks {from_block}..{to_block} into {path}")
+    for start, end, logs in chain.scan_logs(web3, addresses, [decoder.topics],
+                                            from_block, to_block, chunk_size, workers):
+        events = [e for e in (decoder.decode(log) for log in logs) if e]
+        events.sort(key=lambda e: (e["block_number"], e["log_index"]))
+        for event in events:
+            event["shard"] = shard_of[event["address"].lower()]
+            apply_event(batches, index, event)
+        applied += len(events)
+        ranges_done += 1
+        if ranges_done % checkpoint_every == 0:
+            fill_static_fields(web3, contracts, index, workers)
+            _save(path, batches, conditions, {"contracts": addresses, "last_block": end, "applied": applied})
+            print(f"💾 Checkpoint at block {end}: {applied} events, {len(batches)} batches")
+
+    fill_static_fields(web3, contracts, index, workers)
+    _save(path, batches, conditions, {"contracts": addresses, "last_block": to_block, "applied": applied})
+    elapsed = round(time.time() - started, 2)
+    print(f"✅ Rebuilt {len(batches)} batches from {applied} events in {elapsed}s")
+    return {"batches": len(batches), "events": applied, "last_block": to_block, "seconds": elapsed}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild batches.json from contract events")
+    parser.add_argument("--rpc", default=GANACHE_URL)
+    parser.add_argument("--contract", action="append", help="Contract address, repeatable (default: every registered shard)")
+    parser.add_argument("--store", default=BATCHES_FILE)
+    parser.add_argument("--from-block", type=int, help="Default: resume after the last checkpoint")
+    parser.add_argument("--to-block", type=int, help="Default: latest block")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Blocks per eth_getLogs call")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="Log ranges between checkpoints")
+    parser.add_argument("--snapshot", help="Start from a copy of this batches.json instead of the current store (needs --from-block)")
+    parser.add_argument("--reset", action="store_true", help="Discard the checkpoint and start from genesis")
+    args = parser.parse_args(argv)
+
+    if args.reset:
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+        if os.path.exists(args.store):
+            backup = f"{args.store}.bak-{int(time.time())}"
+            os.replace(args.store, backup)
+            print(f"📦 Previous store moved to {backup}")
+        moved = history.clear(args.store, backup=True)
+        if moved:
+            print(f"📦 Previous history segments moved to {moved}")
+        # Deltas and snapshots point into the old segments; they go with them
+        moved = temporal.clear(args.store, backup=True)
+        if moved:
+            print(f"📦 Previous point-in-time log moved to {moved}")
+
+    web3 = chain.connect(args.rpc)
+    addresses = args.contract or shards.load(shards.SHARDS_FILE, CONTRACT_ADDRESS).addresses
+    contracts = [chain.get_contract(web3, address) for address in addresses]
+    rebuild(web3, contracts, args.store, args.from_block, args.to_block,
+            args.chunk_size, args.workers, args.checkpoint_every, args.snapshot)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Chain-to-local reconciliation.
+
+Rebuilds the canonical local-id -> (shard, chain-id) mapping from
+``BatchCreated`` logs of every contract shard, reads every chain batch through
+parallel batched ``getBatch`` calls on its shard and diffs the result against
+``batches.json``.
+
+    python reconcile.py                 # report only
+    python reconcile.py --repair        # write chain ids / chain values back
+"""
+import argparse, json, time
+
+import chain
+import shards
+from config import GANACHE_URL, CONTRACT_ADDRESS
+from storage import BATCHES_FILE, read_json, write_json
+
+# Fields the contract stores for every batch
+CORE_FIELDS = ["origin", "farm", "exporter", "ipfsHash"]
+# Approvals (submit_condition) change status locally only, so a different
+# chain status is reported but never repaired
+STATUS_FIELD = "status"
+# Only written by updateBatch, so an empty chain value means "never sent"
+IOT_FIELDS = ["color", "temperature"]
+
+def build_id_map(web3, contracts, from_block=0, to_block=None, chunk_size=2000, workers=8):
+    """Return ({tx_hash: (shard, chain_id)}, {(shard, chain_id): block_number}) from BatchCreated logs."""
+    topic = chain.event_topic("BatchCreated")
+    events = {c.address.lower(): (i, c.events.BatchCreated()) for i, c in enumerate(contracts)}
+    by_tx, blocks = {}, {}
+    for _, _, logs in chain.scan_logs(web3, [c.address for c in contracts], [topic],
+                                      from_block, to_block, chunk_size, workers):
+        for log in logs:
+            shard, event = events[log["address"].lower()]
+            key = (shard, int(event.process_log(log)["args"]["id"]))
+            by_tx[web3.to_hex(log["transactionHash"]).lower()] = key
+            blocks[key] = log["blockNumber"]
+    return by_tx, blocks
+
+def _normalize(field, value):
+    if value is None:
+        return ""
+    if field == "temperature":
+        try:
+            return f"{float(value):g}"
+        except (TypeError, ValueError):
+            return str(value)
+    return str(value)
+
+def diff_batch(local, onchain):
+    fields = {}
+    for field in CORE_FIELDS + IOT_FIELDS:
+        chain_value = onchain.get(field)
+        if field in IOT_FIELDS and chain_value in (None, ""):
+            continue
+        if _normalize(field, local.get(field)) != _normalize(field, chain_value):
+            fields[field] = {"local": local.get(field), "chain": chain_value}
+    return fields
+
+def resolve_chain_id(batch, by_tx):
+    """(shard, chain_id) of a local batch, or None."""
+    if batch.get("chain_id") is not None:
+        return int(batch.get("shard") or 0), int(batch["chain_id"])
+    tx_hash = (batch.get("tx_hash") or "").lower()
+    if tx_hash and not tx_hash.startswith("0x"):
+        tx_hash = "0x" + tx_hash
+    return by_tx.get(tx_hash)
+
+def reconcile(web3, contracts, path=BATCHES_FILE, repair=False, from_block=0,
+              chunk_size=2000, workers=16):
+    """Diff the store against ``contracts`` (one contract, or every shard in order)."""
+    started = time.time()
+    if not isinstance(contracts, (list, tuple)):
+        contracts = [contracts]
+    by_tx, blocks = build_id_map(web3, contracts, from_block, None, chunk_size, workers)
+    onchain = {}
+    for shard, contract in enumerate(contracts):
+        next_id = contract.functions.nextBatchId().call()
+        chain_ids = {cid for s, cid in blocks if s == shard} | set(range(1, next_id))
+        fetched = chain.fetch_batches(web3, contract, sorted(chain_ids), workers=workers)
+        # Unused slots come back zeroed
+        onchain.update({(shard, cid): b for cid, b in fetched.items() if b.get("createdAt")})
+
+    data = read_json(path, {"batches": [], "conditions": []})
+    report = {
+        "local_batches": len(data["batches"]),
+        "chain_batches": len(onchain),
+        "matched": 0,
+        "id_drift": [],
+        "mismatches": [],
+        "status_differs": [],
+        "local_only": [],
+        "missing_on_chain": [],
+        "orphan_on_chain": [],
+    }
+    claimed = set()
+    for batch in data["batches"]:
+        key = resolve_chain_id(batch, by_tx)
+        if key is None:
+            # Pending batches (never sent) legitimately have no tx hash
+            key = "missing_on_chain" if batch.get("tx_hash") else "local_only"
+            report[key].append(batch.get("id"))
+            continue
+        if key not in onchain:
+            report["missing_on_chain"].append(batch.get("id"))
+            continue
+        shard, chain_id = key
+        claimed.add(key)
+        report["matched"] += 1
+        if str(batch.get("id")) != str(chain_id):
+            report["id_drift"].append({"batch_id": batch.get("id"), "shard": shard, "chain_id": chain_id})
+        fields = diff_batch(batch, onchain[key])
+        if fields:
+            report["mismatches"].append({"batch_id": batch.get("id"), "shard": shard, "chain_id": chain_id, "fields": fields})
+        if _normalize(STATUS_FIELD, batch.get(STATUS_FIELD)) != _normalize(STATUS_FIELD, onchain[key].get(STATUS_FIELD)):
+            report["status_differs"].append({"batch_id": batch.get("id"), "local": batch.get(STATUS_FIELD),
+                                             "chain": onchain[key].get(STATUS_FIELD)})
+
+        if repair:
+            batch["chain_id"] = chain_id
+            batch["shard"] = shard
+            if key in blocks:
+                batch.setdefault("block_number", blocks[key])
+            for field, values in fields.items():
+                batch[field] = values["chain"]
+
+    report["orphan_on_chain"] = [{"shard": shard, "chain_id": cid} for shard, cid in sorted(set(onchain) - claimed)]
+    if repair:
+        write_json(path, data)
+    report["repaired"] = repair
+    report["seconds"] = round(time.time() - started, 2)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff batches.json against contract state")
+    parser.add_argument("--rpc", default=GANACHE_URL)
+    parser.add_argument("--contract", action="append", help="Contract address, repeatable (default: every registered shard)")
+    parser.add_argument("--store", default=BATCHES_FILE)
+    parser.add_argument("--from-block", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Blocks per eth_getLogs call")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--repair", action="store_true", help="Write chain ids and chain values into the store")
+    args = parser.parse_args(argv)
+
+    web3 = chain.connect(args.rpc)
+    addresses = args.contract or shards.load(shards.SHARDS_FILE, CONTRACT_ADDRESS).addresses
+    contracts = [chain.get_contract(web3, address) for address in addresses]
+    report = reconcile(web3, contracts, args.store, args.repair, args.from_block, args.chunk_size, args.workers)
+    print(json.dumps(report, indent=2, default=str))
+    drift = report["mismatches"] or report["missing_on_chain"] or report["orphan_on_chain"]
+    print(f"{'⚠️ Drift detected' if drift else '✅ In sync'}: {report['matched']} matched in {report['seconds']}s")
+    return 1 if drift and not args.repair else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,419 @@
+"""Compact struct-of-arrays representation of the batch working set.
+
+A batch dict costs around a kilobyte once its keys, ISO strings and repeated
+categoricals are counted. ``BatchTable`` keeps one typed column per field
+instead:
+
+- categoricals (origin, farm, exporter, status, color, condition,
+  created_by) are dictionary-encoded into ``array('I')`` codes
+- timestamps are epoch microseconds, tx hashes 32 raw bytes each
+- ids, chain ids, shards, block numbers, history headers are ``array('q')``;
+  ids normally sit at row ``id - 1``, and ``moved`` maps the others to their row
+
+Rows are turned back into plain dicts only at the API boundary
+(``table.get(id)``, ``row.to_dict()``). Values that don't fit their column
+(odd ids, non-numeric temperatures, unknown keys) are kept per row in an
+overflow dict, so every batch round-trips exactly.
+
+    python records.py --batches 1000000      # memory per batch, dicts vs table
+"""
+import argparse, json, math, time, tracemalloc
+from array import array
+from datetime import datetime, timedelta
+from threading import Event, Lock
+
+import serialization
+from storage import BATCHES_FILE, iter_json_array, revision
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+MISSING = -1
+ZERO_HASH = bytes(32)
+
+CATEGORICALS = ("origin", "farm", "exporter", "status", "color", "condition", "created_by")
+INTEGERS = ("chain_id", "shard", "block_number", "history_count", "history_segment", "history_offset", "history_bytes")
+
+class Dictionary:
+    """Dictionary encoding for a categorical column."""
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def copy(self):
+        other = Dictionary()
+        other.values = list(self.values)
+        other.codes = dict(self.codes)
+        return other
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+def _encode_timestamp(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is not None or dt.isoformat() != value:
+        return None
+    return (dt - EPOCH) // _MICROSECOND
+
+def _decode_timestamp(micros):
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+def _encode_hash(value):
+    if isinstance(value, str) and len(value) == 66 and value.startswith("0x"):
+        try:
+            raw = bytes.fromhex(value[2:])
+        except ValueError:
+            return None
+        if raw != ZERO_HASH and "0x" + raw.hex() == value:
+            return raw
+    return None
+
+class BatchRecord:
+    """Lazy view of one table row; behaves like a read-only batch dict."""
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        value = self._table.value(self._row, key)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._table.value(self._row, key)
+        return default if value is _ABSENT else value
+
+    def to_dict(self):
+        return self._table.row_dict(self._row)
+
+_ABSENT = object()
+
+class BatchTable:
+    def __init__(self):
+        self.ids = array("q")
+        self.categoricals = {name: (Dictionary(), array("I")) for name in CATEGORICALS}
+        self.integers = {name: array("q") for name in INTEGERS}
+        self.temperature = array("d")
+        self.timestamp = array("q")
+        self.tx_hash = bytearray()
+        self.ipfs = []
+        self.key_order = Dictionary()  # field-order tuples, so dicts come back in their original order
+        self.orders = array("I")
+        self.overflow = {}             # row -> {field: value} that did not fit a column
+        self.moved = {}                # id -> row, for ids not at row id - 1 (most are)
+        self.digests = array("q")      # content hash per row (per process), for refresh()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (BatchRecord(self, row) for row in range(len(self)))
+
+    def __getitem__(self, row):
+        return BatchRecord(self, row)
+
+    @classmethod
+    def from_batches(cls, batches):
+        table = cls()
+        for batch in batches:
+            table.append(batch)
+        return table
+
+    @classmethod
+    def load(cls, path=BATCHES_FILE):
+        # Streams the store, so only one batch dict is alive at a time
+        return cls.from_batches(iter_json_array(path, "batches"))
+
+    def append(self, batch, digest=None):
+        row = len(self.ids)
+        extra = {}
+
+        batch_id = batch.get("id")
+        if type(batch_id) is int and batch_id >= 0:
+            self.ids.append(batch_id)
+        else:
+            self.ids.append(MISSING)
+            extra["id"] = batch_id
+        if batch_id != row + 1:
+            self.moved.setdefault(str(batch_id), row)
+
+        for name, (dictionary, codes) in self.categoricals.items():
+            value = batch.get(name, _ABSENT)
+            if isinstance(value, str):
+                codes.append(dictionary.encode(value))
+            else:
+                codes.append(dictionary.encode(None))
+                if value is not _ABSENT:
+                    extra[name] = value
+
+        for name, column in self.integers.items():
+            value = batch.get(name, _ABSENT)
+            if type(value) is int and value >= 0:
+                column.append(value)
+            else:
+                column.append(MISSING)
+                if value is not _ABSENT and value is not None:
+                    extra[name] = value
+
+        temperature = batch.get("temperature", _ABSENT)
+        if type(temperature) in (int, float) and not math.isnan(temperature):
+            self.temperature.append(temperature)
+            if type(temperature) is int:
+                extra["temperature"] = temperature
+        else:
+            self.temperature.append(math.nan)
+            if temperature is not _ABSENT:
+                extra["temperature"] = temperature
+
+        timestamp = batch.get("timestamp", _ABSENT)
+        micros = _encode_timestamp(timestamp)
+        self.timestamp.append(MISSING if micros is None else micros)
+        if micros is None and timestamp is not _ABSENT:
+            extra["timestamp"] = timestamp
+
+        tx_hash = batch.get("tx_hash", _ABSENT)
+        raw = _encode_hash(tx_hash)
+        self.tx_hash += raw or ZERO_HASH
+        if raw is None and tx_hash is not _ABSENT:
+            extra["tx_hash"] = tx_hash
+
+        ipfs = batch.get("ipfsHash", _ABSENT)
+        self.ipfs.append(ipfs if isinstance(ipfs, str) else None)
+        if not isinstance(ipfs, str) and ipfs is not _ABSENT:
+            extra["ipfsHash"] = ipfs
+
+        for key, value in batch.items():
+            if key not in _COLUMNS:
+                extra[key] = value
+        self.orders.append(self.key_order.encode(tuple(batch)))
+        if extra:
+            self.overflow[row] = extra
+        self.digests.append(_digest(batch) if digest is None else digest)
+        return row
+
+    def _replace(self, row, batch, digest=None):
+        """Overwrite ``row`` with ``batch``: encoded as a new last row, then moved into place."""
+        self._unindex(row)
+        last = self.append(batch, digest)
+        columns = [self.ids, self.temperature, self.timestamp, self.ipfs, self.orders, self.digests,
+                   *(codes for _, codes in self.categoricals.values()), *self.integers.values()]
+        for column in columns:
+            column[row] = column.pop()
+        self.tx_hash[row * 32:(row + 1) * 32] = self.tx_hash[last * 32:]
+        del self.tx_hash[last * 32:]
+        extra = self.overflow.pop(last, None)
+        if extra:
+            self.overflow[row] = extra
+        else:
+            self.overflow.pop(row, None)
+        key = str(batch.get("id"))
+        if self.moved.get(key) == last:
+            del self.moved[key]
+        if batch.get("id") != row + 1:
+            self.moved.setdefault(key, row)
+        return row
+
+    def _unindex(self, row):
+        batch_id = self.value(row, "id")
+        if self.moved.get(str(batch_id)) == row:
+            del self.moved[str(batch_id)]
+
+    def copy(self):
+        table = BatchTable()
+        table.ids = array("q", self.ids)
+        table.categoricals = {name: (dictionary.copy(), array("I", codes))
+                              for name, (dictionary, codes) in self.categoricals.items()}
+        table.integers = {name: array("q", column) for name, column in self.integers.items()}
+        table.temperature = array("d", self.temperature)
+        table.timestamp = array("q", self.timestamp)
+        table.tx_hash = bytearray(self.tx_hash)
+        table.ipfs = list(self.ipfs)
+        table.key_order = self.key_order.copy()
+        table.orders = array("I", self.orders)
+        table.overflow = dict(self.overflow)
+        table.moved = dict(self.moved)
+        table.digests = array("q", self.digests)
+        return table
+
+    def refresh(self, batches):
+        """A table of ``batches`` that reuses this one's unchanged rows.
+
+        Rows whose content hash matches are kept as they are; changed rows are
+        re-encoded and new ones appended. This table is left untouched, so
+        readers holding it are never blocked. Returns (table, rows re-encoded).
+        """
+        table = self.copy()
+        changed = 0
+        row = 0
+        for batch in batches:
+            digest = _digest(batch)
+            if row < len(table) and table.digests[row] == digest:
+                row += 1
+                continue
+            if row < len(table):
+                table._replace(row, batch, digest)
+            else:
+                table.append(batch, digest)
+            row += 1
+            changed += 1
+        if row < len(table):
+            # Batches were removed (create_block drops pending ones); rows shift
+            return BatchTable.from_batches(batches), len(batches)
+        return table, changed
+
+    def value(self, row, key):
+        extra = self.overflow.get(row)
+        if extra is not None and key in extra:
+            return extra[key]
+        if key not in self.key_order.values[self.orders[row]]:
+            return _ABSENT
+        if key == "id":
+            return self.ids[row]
+        if key in self.categoricals:
+            dictionary, codes = self.categoricals[key]
+            return dictionary.values[codes[row]]
+        if key in self.integers:
+            value = self.integers[key][row]
+            return None if value == MISSING else value
+        if key == "temperature":
+            return self.temperature[row]
+        if key == "timestamp":
+            return _decode_timestamp(self.timestamp[row])
+        if key == "tx_hash":
+            return "0x" + self.tx_hash[row * 32:(row + 1) * 32].hex()
+        if key == "ipfsHash":
+            return self.ipfs[row]
+        return _ABSENT
+
+    def row_dict(self, row):
+        return {key: self.value(row, key) for key in self.key_order.values[self.orders[row]]}
+
+    def find(self, batch_id):
+        """Row of ``batch_id`` (int or its string form), or None."""
+        row = self.moved.get(str(batch_id))
+        if row is not None:
+            return row
+        try:
+            numeric = int(batch_id)
+        except (TypeError, ValueError):
+            return None
+        # Ids are normally their row + 1 (see submit_condition / update_status)
+        if 0 < numeric <= len(self.ids) and self.ids[numeric - 1] == numeric:
+            return numeric - 1
+        return None
+
+    def get(self, batch_id):
+        row = self.find(batch_id)
+        return None if row is None else self.row_dict(row)
+
+def _digest(batch):
+    # hash() is salted per process, which is fine for a per-process cache
+    return hash(serialization.dumps(batch))
+
+_COLUMNS = {"id", "temperature", "timestamp", "tx_hash", "ipfsHash", *CATEGORICALS, *INTEGERS}
+
+# ---------------------------
+# Revision-keyed cache of the store
+# ---------------------------
+_cache = {}     # path -> (revision, table)
+_building = {}  # path -> (revision, Event set once that revision's table is cached)
+_cache_lock = Lock()
+
+def cached_table(path=BATCHES_FILE):
+    """BatchTable of ``path`` at its current revision.
+
+    A new revision is applied to the previous table with ``refresh`` (only
+    changed rows are re-encoded) by the first request that sees it; requests
+    for the same revision wait for that build, and ``_cache_lock`` is only
+    held to look up and swap entries, never during a build.
+    """
+    rev = revision(path)
+    cached = _cache.get(path)
+    if cached and cached[0] == rev:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == rev:
+            return cached[1]
+        building = _building.get(path)
+        owner = building is None or building[0] != rev
+        if owner:
+            building = _building[path] = (rev, Event())
+    if not owner:
+        building[1].wait()
+        cached = _cache.get(path)
+        return cached[1] if cached and cached[0] == rev else cached_table(path)
+    try:
+        if cached:
+            table, changed = cached[1].refresh(iter_json_array(path, "batches"))
+        else:
+            table = BatchTable.load(path)
+        with _cache_lock:
+            # A build of a newer revision may have finished first
+            if _building.get(path) is building or not _cache.get(path):
+                _cache[path] = (rev, table)
+        return table
+    finally:
+        with _cache_lock:
+            if _building.get(path) is building:
+                del _building[path]
+        building[1].set()
+
+# ---------------------------
+# Memory measurement
+# ---------------------------
+def _measure(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    obj = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, peak, time.perf_counter() - started
+
+def main(argv=None):
+    import history
+    import workload
+
+    parser = argparse.ArgumentParser(description="Measure memory per batch: dicts vs BatchTable")
+    parser.add_argument("--batches", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    # Serialized up front so only decoding is traced, as when reading the store
+    lines, offset = [], 0
+    for batches, _ in workload.generate(args.batches, seed=args.seed, chain_ids=list(range(1, args.batches + 1))):
+        for batch in batches:
+            # As stored: history lives in segments, the batch keeps a header
+            records = batch.pop("history", [])
+            batch["history_count"] = len(records)
+            batch["history_segment"], batch["history_offset"] = divmod(offset, history.SEGMENT_BYTES)
+            batch["history_bytes"] = 200 * len(records)
+            offset += batch["history_bytes"]
+            lines.append(json.dumps(batch))
+
+    dicts, dict_bytes, _, dict_seconds = _measure(lambda: [json.loads(line) for line in lines])
+    del dicts
+    table, table_bytes, table_peak, table_seconds = _measure(
+        lambda: BatchTable.from_batches(json.loads(line) for line in lines))
+
+    n = args.batches
+    print(f"📏 {n} batches")
+    print(f"   dicts:      {dict_bytes / n:8.0f} B/batch  ({dict_bytes / 1e6:.1f} MB, decoded in {dict_seconds:.1f}s)")
+    print(f"   BatchTable: {table_bytes / n:8.0f} B/batch  ({table_bytes / 1e6:.1f} MB, peak {table_peak / 1e6:.1f} MB, decoded in {table_seconds:.1f}s)")
+    print(f"   {dict_bytes / max(table_bytes, 1):.1f}x smaller; {len(table.overflow)} rows needed overflow")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Serialization for the data files and large API responses.
+
+JSON goes through the fastest codec installed (orjson, then msgspec, then the
+stdlib) and is written compact. The compact store format is a stream of
+length-prefixed frames:
+
+    b"MGO1" | flags | frame*            flags: 1 = zstd body, 2 = msgpack payloads
+    frame = type (1 byte) | length (uint32 BE) | payload
+        K  start of a top-level array (payload: key)
+        R  one array item
+        V  a top-level scalar (payload: [key, value])
+
+Items of ``batches``, ``conditions`` and ``blocks`` are packed positionally by
+their schema, ``[present-field bitmask, values..., {other fields}]``, so field
+names are not repeated per record. Readers detect the format from the first
+bytes, so ``read_json`` / ``write_json`` / ``iter_json_array`` work on either.
+
+    MANGO_STORE_FORMAT=compact MANGO_STORE_COMPRESSION=zstd python app.py
+    MANGO_STORE_VALIDATE=1 ...        # reject off-schema records on compact writes
+    python serialization.py --bench --batches 100000
+"""
+import argparse, io, json, os, struct, tempfile, time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"MGO1"
+FLAG_ZSTD = 1
+FLAG_MSGPACK = 2
+_FRAME = struct.Struct(">cI")
+
+STORE_FORMAT = os.environ.get("MANGO_STORE_FORMAT", "json")
+STORE_COMPRESSION = os.environ.get("MANGO_STORE_COMPRESSION") or None
+# Check records against their schema on every compact write (costs a pass over the document)
+VALIDATE_WRITES = os.environ.get("MANGO_STORE_VALIDATE") == "1"
+
+# ---------------------------
+# Typed schemas
+# ---------------------------
+BATCH_FIELDS = (
+    ("id", (int, str)), ("origin", str), ("farm", str), ("exporter", str), ("status", str),
+    ("ipfsHash", str), ("color", str), ("temperature", (float, int, str)), ("condition", str),
+    ("tx_hash", str), ("block_number", int), ("chain_id", int), ("created_by", str),
+    ("timestamp", str), ("history_count", int), ("history_bytes", int), ("shard", int),
+    ("history_segment", int), ("history_offset", int),
+)
+CONDITION_FIELDS = (
+    ("batch_id", (int, str)), ("role", str), ("user", str), ("color", str),
+    ("temperature", (float, int)), ("remarks", str), ("status", str), ("reasons", list),
+    ("timestamp", str),
+)
+BLOCK_FIELDS = (
+    ("block_number", int), ("block_hash", str), ("timestamp", int), ("real_time", str),
+    ("transactions", list),
+)
+SCHEMAS = {"batches": BATCH_FIELDS, "conditions": CONDITION_FIELDS, "blocks": BLOCK_FIELDS}
+_NAMES = {fields: frozenset(name for name, _ in fields) for fields in SCHEMAS.values()}
+
+def validate(record, fields):
+    """Return the names of schema fields whose values have the wrong type (None is allowed)."""
+    return [name for name, kind in fields
+            if record.get(name) is not None and not isinstance(record[name], kind)]
+
+def _check(record, fields):
+    wrong = validate(record, fields)
+    if wrong:
+        raise ValueError(f"Record {record.get('id', record.get('batch_id'))} has off-schema values for {', '.join(wrong)}")
+
+def pack_record(record, fields):
+    mask, values = 0, [0]
+    for bit, (name, _) in enumerate(fields):
+        if name in record:
+            mask |= 1 << bit
+            values.append(record[name])
+    values[0] = mask
+    if len(values) - 1 < len(record):
+        names = _NAMES[fields]
+        values.append({k: v for k, v in record.items() if k not in names})
+    return values
+
+def unpack_record(values, fields):
+    mask = values[0]
+    record, pos = {}, 1
+    for bit, (name, _) in enumerate(fields):
+        if mask >> bit & 1:
+            record[name] = values[pos]
+            pos += 1
+    if pos < len(values):
+        record.update(values[pos])
+    return record
+
+# ---------------------------
+# JSON fast path
+# ---------------------------
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+elif msgspec is not None:
+    _encoder = msgspec.json.Encoder(enc_hook=str)
+    dumps = _encoder.encode
+    loads = msgspec.json.decode
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=str, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+def iter_json(document, chunk_items=1000):
+    """Encode ``{"key": [items...], ...}`` as a stream of JSON byte chunks."""
+    if not isinstance(document, dict):
+        yield dumps(document)
+        return
+    yield b"{"
+    for i, (key, value) in enumerate(document.items()):
+        yield (b"," if i else b"") + dumps(key) + b":"
+        if not isinstance(value, list):
+            yield dumps(value)
+            continue
+        yield b"["
+        for start in range(0, len(value), chunk_items):
+            chunk = dumps(value[start:start + chunk_items])[1:-1]
+            if chunk:
+                yield (b"," if start else b"") + chunk
+        yield b"]"
+    yield b"}"
+
+# ---------------------------
+# Compact frames
+# ---------------------------
+def _payload_codec(flags):
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("This store uses msgpack payloads; pip install msgpack")
+        return (lambda obj: msgpack.packb(obj, default=str, use_bin_type=True),
+                lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False))
+    return dumps, loads
+
+class CompactWriter:
+    """Streams a document into the compact format: section(key), then record(item)..."""
+
+    def __init__(self, f, compression=None):
+        flags = FLAG_MSGPACK if msgpack is not None else 0
+        if compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstd compression requires zstandard (pip install zstandard)")
+            flags |= FLAG_ZSTD
+        elif compression:
+            raise ValueError(f"Unknown compression: {compression}")
+        f.write(MAGIC + bytes([flags]))
+        self._raw = f
+        self._out = zstandard.ZstdCompressor(level=3).stream_writer(f, closefd=False) if flags & FLAG_ZSTD else f
+        self._encode = _payload_codec(flags)[0]
+        self._fields = None
+
+    def _frame(self, kind, payload):
+        self._out.write(_FRAME.pack(kind, len(payload)) + payload)
+
+    def section(self, key):
+        self._fields = SCHEMAS.get(key)
+        self._frame(b"K", self._encode(key))
+
+    def record(self, item):
+        if self._fields is not None and isinstance(item, dict):
+            if VALIDATE_WRITES:
+                _check(item, self._fields)
+            item = pack_record(item, self._fields)
+        self._frame(b"R", self._encode(item))
+
+    def scalar(self, key, value):
+        self._frame(b"V", self._encode([key, value]))
+
+    def close(self):
+        if self._out is not self._raw:
+            self._out.flush(zstandard.FLUSH_FRAME)
+            self._out.close()
+
+def write_compact(f, document, compression=None):
+    writer = CompactWriter(f, compression)
+    for key, value in document.items():
+        if isinstance(value, list):
+            writer.section(key)
+            for item in value:
+                writer.record(item)
+        else:
+            writer.scalar(key, value)
+    writer.close()
+
+def _frames(f):
+    flags = f.read(len(MAGIC) + 1)[-1]
+    decode = _payload_codec(flags)[1]
+    if flags & FLAG_ZSTD and zstandard is None:
+        raise RuntimeError("This store is zstd-compressed; pip install zstandard")
+    stream = zstandard.ZstdDecompressor().stream_reader(f) if flags & FLAG_ZSTD else f
+    while True:
+        head = stream.read(_FRAME.size)
+        if len(head) < _FRAME.size:
+            return
+        kind, length = _FRAME.unpack(head)
+        yield kind, decode(stream.read(length))
+
+def iter_compact(f):
+    """Yield (key, item) for array items and (key, value) for scalars, in file order."""
+    key, fields = None, None
+    for kind, payload in _frames(f):
+        if kind == b"K":
+            key, fields = payload, SCHEMAS.get(payload)
+        elif kind == b"R":
+            yield key, unpack_record(payload, fields) if fields is not None and isinstance(payload, list) else payload
+        elif kind == b"V":
+            yield payload[0], payload[1]
+
+def read_compact(f):
+    document = {}
+    for kind, payload in _frames(f):
+        if kind == b"K":
+            key, fields = payload, SCHEMAS.get(payload)
+            document[key] = []
+        elif kind == b"R":
+            document[key].append(unpack_record(payload, fields) if fields is not None and isinstance(payload, list) else payload)
+        elif kind == b"V":
+            document[payload[0]] = payload[1]
+    return document
+
+def is_compact(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+# ---------------------------
+# Document API used by storage
+# ---------------------------
+def write_document(f, document, fmt=None, compression=None):
+    """Write ``document`` to the binary file ``f`` in the configured store format."""
+    fmt = fmt or STORE_FORMAT
+    if fmt == "compact" and isinstance(document, dict):
+        write_compact(f, document, compression or STORE_COMPRESSION)
+    elif fmt == "json":
+        for chunk in iter_json(document):
+            f.write(chunk)
+    else:
+        raise ValueError(f"Unknown store format: {fmt}")
+
+def read_document(data):
+    """Decode a whole file's bytes, whichever format it is in."""
+    if data[:len(MAGIC)] == MAGIC:
+        return read_compact(io.BytesIO(data))
+    return loads(data)
+
+# ---------------------------
+# Benchmark against the previous helpers
+# ---------------------------
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+def main(argv=None):
+    import workload
+
+    parser = argparse.ArgumentParser(description="Benchmark store serialization")
+    parser.add_argument("--bench", action="store_true", required=True)
+    parser.add_argument("--batches", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    batches, conditions = [], []
+    for chunk_batches, chunk_conditions in workload.generate(args.batches):
+        for batch in chunk_batches:
+            batch.pop("history", None)
+        batches += chunk_batches
+        conditions += chunk_conditions
+    document = {"batches": batches, "conditions": conditions}
+    off_schema = sum(bool(validate(b, BATCH_FIELDS)) for b in batches)
+
+    def stdlib_write(path):
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+
+    def stdlib_read(path):
+        with open(path, "r") as f:
+            return json.loads(f.read().strip())
+
+    def new_writer(fmt, compression=None):
+        def write(path):
+            with open(path, "wb") as f:
+                write_document(f, document, fmt, compression)
+        return write
+
+    def new_read(path):
+        with open(path, "rb") as f:
+            return read_document(f.read())
+
+    variants = [
+        ("json indent=2 (previous)", stdlib_write, stdlib_read),
+        ("json compact (fast path)", new_writer("json"), new_read),
+        ("compact frames", new_writer("compact"), new_read),
+    ]
+    if zstandard is not None:
+        variants.append(("compact frames + zstd", new_writer("compact", "zstd"), new_read))
+
+    codecs = "orjson" if orjson else "msgspec" if msgspec else "stdlib json"
+    payloads = "msgpack" if msgpack else "json"
+    print(f"📦 {args.batches} batches, {len(conditions)} conditions (JSON codec: {codecs}, frame payloads: {payloads})")
+    if off_schema:
+        print(f"   ⚠️ {off_schema} batches have fields outside their schema types (stored as-is)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, write, read in variants:
+            path = os.path.join(tmp, "store")
+            _, write_s = _timed(lambda: write(path))
+            loaded, read_s = _timed(lambda: read(path))
+            assert loaded == document, f"{name} did not round-trip"
+            size = os.path.getsize(path)
+            print(f"   {name:<26} {size / 1e6:8.1f} MB  write {write_s:6.2f}s  read {read_s:6.2f}s")
+
+if __name__ == "__main__":
+    main()
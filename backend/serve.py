@@ -0,0 +1,82 @@
+"""Pre-fork multi-worker server.
+
+The parent binds one listening socket and forks N workers that all accept on
+it. One worker wins the leader lease and runs the block monitor; SocketIO
+events reach every worker's clients through a FileSocketBus in
+``data/bus``, and server-side sessions are shared through ``data/sessions``.
+Clients must use the websocket transport (as the dashboards do), since
+long-polling needs sticky sessions.
+
+    python app.py --workers 4
+"""
+import glob, os, signal, socket, time
+
+from storage import DATA_DIR
+
+BUS_DIR = os.path.join(DATA_DIR, "bus")
+SESSION_DIR = os.path.join(DATA_DIR, "sessions")
+
+def _run_worker(sock, host, port):
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    application = app_module.create_app({"EVENT_BUS": f"file://{BUS_DIR}", "SESSION_STORE": f"file://{SESSION_DIR}"})
+    server = make_server(host, port, application, threaded=True, fd=sock.fileno())
+    print(f"🧵 Worker {os.getpid()} serving on http://{host}:{port}")
+    server.serve_forever()
+
+def _spawn(sock, host, port):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            _run_worker(sock, host, port)
+        finally:
+            os._exit(0)
+    return pid
+
+def serve(workers, host="127.0.0.1", port=5000):
+    if not hasattr(os, "fork"):
+        raise SystemExit("❌ --workers needs fork(); run a single worker on this platform")
+
+    os.makedirs(BUS_DIR, exist_ok=True)
+    for stale in glob.glob(os.path.join(BUS_DIR, "*.sock")):
+        os.remove(stale)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    children = {_spawn(sock, host, port) for _ in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"🚀 {workers} workers on http://{host}:{port}")
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            # Replace crashed workers; a new leader is elected if needed
+            print(f"⚠️ Worker {pid} exited; restarting")
+            time.sleep(1)
+            children.add(_spawn(sock, host, port))
+    sock.close()
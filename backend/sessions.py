@@ -0,0 +1,174 @@
+"""Server-side sessions with expiry.
+
+The session cookie only carries a random id; the session data lives in a
+store chosen by the ``SESSION_STORE`` url:
+
+- ``memory://``       per-process dict (single worker)
+- ``file:///dir``     one small file per session, shared by pre-forked workers
+
+Sessions expire ``SESSION_TTL`` seconds after their last save. A session
+that is only read is re-saved once half its lifetime has passed, so active
+users stay logged in without a store write on every request. Logout removes
+the session from the store, and login issues a fresh id (``regenerate``).
+"""
+import json, os, re, secrets, threading, time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import metrics
+
+# ---------------------------
+# Stores
+# ---------------------------
+class MemorySessionStore:
+    PURGE_EVERY = 1000  # saves between sweeps of expired sessions
+
+    def __init__(self):
+        self._sessions = {}  # sid -> (expires_at, data)
+        self._lock = threading.Lock()
+        self._saves = 0
+
+    def load(self, sid):
+        """Return (data, expires_at) or None."""
+        entry = self._sessions.get(sid)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self.delete(sid)
+            return None
+        return dict(entry[1]), entry[0]
+
+    def save(self, sid, data, ttl):
+        with self._lock:
+            self._sessions[sid] = (time.time() + ttl, dict(data))
+            self._saves += 1
+            if self._saves % self.PURGE_EVERY == 0:
+                now = time.time()
+                for key in [k for k, (expires_at, _) in self._sessions.items() if expires_at <= now]:
+                    del self._sessions[key]
+            metrics.SESSIONS_ACTIVE.set(len(self._sessions))
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+            metrics.SESSIONS_ACTIVE.set(len(self._sessions))
+
+class FileSessionStore:
+    PURGE_EVERY = 1000
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._saves = 0
+
+    def _path(self, sid):
+        return os.path.join(self.directory, f"{sid}.json")
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            self.delete(sid)
+            return None
+        return entry["data"], entry["expires_at"]
+
+    def save(self, sid, data, ttl):
+        path = self._path(sid)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"expires_at": time.time() + ttl, "data": data}, f, default=str)
+        os.replace(tmp_path, path)
+        self._saves += 1
+        if self._saves % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def purge(self):
+        # load() removes the expired ones
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                sid = name[:-len(".json")]
+                self.load(sid)
+
+def make_session_store(url):
+    if not url or url == "memory://":
+        return MemorySessionStore()
+    if url.startswith("file://"):
+        return FileSessionStore(url[len("file://"):])
+    raise ValueError(f"Unsupported SESSION_STORE: {url}")
+
+# ---------------------------
+# Flask integration
+# ---------------------------
+_SID = re.compile(r"^[A-Za-z0-9_-]{20,64}$")
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, data=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.stale_sid = None
+
+    def regenerate(self):
+        """Give the session a new id (on login), dropping the old one from the store."""
+        if self.sid is not None:
+            self.stale_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+class ServerSessionInterface(SessionInterface):
+    session_class = ServerSession
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SID.match(sid):
+            loaded = self.store.load(sid)
+            if loaded is not None:
+                data, expires_at = loaded
+                return self.session_class(data, sid=sid, expires_at=expires_at)
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.stale_sid:
+            self.store.delete(session.stale_sid)
+            session.stale_sid = None
+
+        if not session:
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        refresh = session.expires_at is not None and session.expires_at - time.time() < self.ttl / 2
+        if not (session.modified or refresh or session.sid is None):
+            return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, dict(session), self.ttl)
+        session.expires_at = time.time() + self.ttl
+        response.vary.add("Cookie")
+        response.set_cookie(
+            name, session.sid, max_age=self.ttl, domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
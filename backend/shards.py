@@ -0,0 +1,122 @@
+"""Registry of contract shards.
+
+Batches are spread over N deployments of the MangoTraceability contract
+(same ABI, ``contract_abi.json``), listed in ``data/shards.json``:
+
+    {"key": "farm", "shards": ["0xA...", "0xB...", "0xC..."]}
+
+A batch goes to shard ``blake2b(farm) mod N`` (or of its id with
+``"key": "id"``). The chosen index is stored in the batch as ``shard`` and is
+used for every later call (batches without one are on shard 0), so the
+registry only ever grows: existing addresses keep their index and cannot be
+changed or removed, and adding shards only changes where new batches go.
+Without a shards file there is one shard: ``CONTRACT_ADDRESS``.
+
+    python shards.py --deploy 4 --bytecode contract_bytecode.bin   # shards 1-4 after CONTRACT_ADDRESS
+    python shards.py --register 0xB... 0xC...
+    python shards.py --list
+"""
+import argparse, hashlib, os
+
+from storage import DATA_DIR, read_json, write_json
+
+SHARDS_FILE = os.path.join(DATA_DIR, "shards.json")
+ROUTING_KEYS = ("farm", "id")
+
+def stable_hash(value):
+    # Python's hash() is salted per process; shard choice must agree across workers and restarts
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+class ShardRegistry:
+    def __init__(self, addresses, key="farm"):
+        if not addresses:
+            raise ValueError("A shard registry needs at least one contract address")
+        if key not in ROUTING_KEYS:
+            raise ValueError(f"Unknown shard key: {key} (use one of {', '.join(ROUTING_KEYS)})")
+        self.addresses = list(addresses)
+        self.key = key
+        self._index = {address.lower(): i for i, address in enumerate(self.addresses)}
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def shard_for(self, batch):
+        """Shard of ``batch``: the one it was recorded on, else routed by its key."""
+        if batch.get("shard") is not None:
+            return int(batch["shard"])
+        return stable_hash(batch.get(self.key)) % len(self.addresses)
+
+    def address(self, shard):
+        """Contract address of shard index ``shard`` (None is shard 0)."""
+        index = int(shard or 0)
+        if not 0 <= index < len(self.addresses):
+            raise ValueError(f"Unknown contract shard {shard}: {len(self.addresses)} registered (see shards.json)")
+        return self.addresses[index]
+
+    def index_of(self, address):
+        """Shard index of a contract address (None when it isn't one of ours)."""
+        return self._index.get((address or "").lower())
+
+def load(path=SHARDS_FILE, default_address=None, key=None):
+    data = read_json(path, {}) if os.path.exists(path) else {}
+    addresses = data.get("shards") or ([default_address] if default_address else [])
+    return ShardRegistry(addresses, key or data.get("key", "farm"))
+
+def save(addresses, path=SHARDS_FILE, key="farm", default_address=None):
+    """Write the registry; the current shards must stay first, in order (ValueError otherwise)."""
+    ShardRegistry(addresses, key)  # validates
+    current = load(path, default_address).addresses if os.path.exists(path) or default_address else []
+    if [a.lower() for a in addresses[:len(current)]] != [a.lower() for a in current]:
+        raise ValueError("Registered shards can only be appended to: batches refer to them by index")
+    write_json(path, {"key": key, "shards": list(addresses)})
+
+def extend(registry, addresses):
+    """Addresses of ``registry`` followed by those of ``addresses`` it doesn't have yet."""
+    extended = list(registry.addresses)
+    for address in addresses:
+        if address.lower() not in (a.lower() for a in extended):
+            extended.append(address)
+    return extended
+
+def main(argv=None):
+    from config import CONTRACT_ADDRESS, GANACHE_URL, PRIVATE_KEY
+
+    parser = argparse.ArgumentParser(description="Contract shard registry")
+    parser.add_argument("--file", default=SHARDS_FILE)
+    parser.add_argument("--key", choices=ROUTING_KEYS, help="Batch field hashed to pick a shard (default: keep the current one)")
+    parser.add_argument("--deploy", type=int, metavar="N", help="Deploy N contract instances and append them as shards")
+    parser.add_argument("--bytecode", help="Hex bytecode of MangoTraceability (for --deploy)")
+    parser.add_argument("--register", nargs="+", metavar="ADDRESS", help="Append already deployed contracts as shards")
+    parser.add_argument("--rpc", default=GANACHE_URL)
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+
+    # Existing shards keep their index; shard 0 defaults to CONTRACT_ADDRESS
+    registry = load(args.file, CONTRACT_ADDRESS)
+    key = args.key or registry.key
+    if args.deploy:
+        import chain
+
+        if not args.bytecode or not os.path.exists(args.bytecode):
+            raise SystemExit("❌ --deploy needs --bytecode pointing at the compiled contract")
+        with open(args.bytecode) as f:
+            bytecode = f.read().strip()
+        web3 = chain.connect(args.rpc)
+        addresses = list(registry.addresses)
+        for _ in range(args.deploy):
+            addresses.append(chain.deploy_contract(web3, PRIVATE_KEY, bytecode))
+            print(f"🚀 Deployed shard {len(addresses) - 1} at {addresses[-1]}")
+        save(addresses, args.file, key, CONTRACT_ADDRESS)
+    elif args.register:
+        save(extend(registry, args.register), args.file, key, CONTRACT_ADDRESS)
+    elif args.key and args.key != registry.key:
+        save(registry.addresses, args.file, key, CONTRACT_ADDRESS)
+
+    registry = load(args.file, CONTRACT_ADDRESS)
+    if args.list or args.deploy or args.register:
+        print(f"🧩 {len(registry)} shards, routed by {registry.key}:")
+        for i, address in enumerate(registry.addresses):
+            print(f"   {i}: {address}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import json, os, threading, time
+
+import metrics
+import serialization
+import tracing
+
+# ---------------------------
+# Local data files
+# ---------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# MANGO_DATA_DIR points the app at another data directory (benchmarks, scratch copies)
+DATA_DIR = os.environ.get("MANGO_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
+BATCHES_FILE = os.path.join(DATA_DIR, "batches.json")
+GANACHE_BLOCKS_FILE = os.path.join(DATA_DIR, "ganache_blocks.json")
+
+# ---------------------------
+# JSON helpers (robust)
+# ---------------------------
+# Files are written compact (or in the framed format with
+# MANGO_STORE_FORMAT=compact, see serialization.py); reads accept either.
+def write_json(path, data):
+    # Write to a temp file and swap it in so a crash never leaves a torn file
+    started = time.perf_counter()
+    name = os.path.basename(path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with tracing.span("store.write", file=name) as span:
+        with open(tmp_path, "wb") as f:
+            serialization.write_document(f, data)
+            size = f.tell()
+        os.replace(tmp_path, path)
+        if span:
+            span.attrs["bytes"] = size
+    metrics.STORE_LATENCY.observe(time.perf_counter() - started, op="write", file=name)
+    metrics.STORE_BYTES.inc(size, op="write", file=name)
+
+def revision(path):
+    """Store revision of ``path``; changes on every write_json (the atomic
+    replace gives the file a new inode). "0" when the file does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "0"
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+def _quarantine(path):
+    # Keep unreadable files around instead of silently replacing them
+    backup = f"{path}.corrupt-{int(time.time())}"
+    try:
+        os.replace(path, backup)
+        print(f"⚠️ {path} was unreadable; moved to {backup}")
+    except OSError:
+        pass
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        if default is not None:
+            write_json(path, default)
+            return default
+        return default or {}
+    try:
+        started = time.perf_counter()
+        name = os.path.basename(path)
+        with tracing.span("store.read", file=name) as span, open(path, "rb") as f:
+            content = f.read()
+            metrics.STORE_BYTES.inc(len(content), op="read", file=name)
+            if span:
+                span.attrs["bytes"] = len(content)
+            if not content.strip():
+                if default is not None:
+                    write_json(path, default)
+                    return default
+                return default or {}
+            document = serialization.read_document(content)
+            # Parsing is most of a read; time it together with the I/O
+            metrics.STORE_LATENCY.observe(time.perf_counter() - started, op="read", file=name)
+            return document
+    except Exception:
+        if default is not None:
+            _quarantine(path)
+            write_json(path, default)
+            return default
+        return default or {}
+
+# ---------------------------
+# Streaming reader for large JSON files
+# ---------------------------
+# Walks a top-level {"key": [ ... ], ...} document a chunk at a time so the
+# caller only ever holds one array item in memory.
+_WHITESPACE = " \t\r\n"
+
+class _JsonStream:
+    def __init__(self, f, chunk_size=65536):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.pos > self.chunk_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buf += chunk
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of JSON stream")
+            self._fill()
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"Expected {ch!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number may continue in the next chunk
+                if end == len(self.buf) and not self.eof:
+                    self._fill()
+                    continue
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+
+    def items(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+def iter_json_array(path, key):
+    """Yield the items of the top-level array ``key`` without loading the file."""
+    if not os.path.exists(path):
+        return
+    if serialization.is_compact(path):
+        with open(path, "rb") as f:
+            seen = False
+            for name, item in serialization.iter_compact(f):
+                if name == key:
+                    seen = True
+                    yield item
+                elif seen:
+                    return
+        return
+    with open(path, "r") as f:
+        stream = _JsonStream(f)
+        try:
+            stream.expect("{")
+        except ValueError:
+            return
+        if stream.peek() == "}":
+            return
+        while True:
+            name = stream.value()
+            stream.expect(":")
+            if stream.peek() == "[":
+                if name == key:
+                    yield from stream.items()
+                    return
+                for _ in stream.items():
+                    pass
+            else:
+                stream.value()
+            if stream.peek() == ",":
+                stream.pos += 1
+                continue
+            return
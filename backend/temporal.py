@@ -0,0 +1,274 @@
+"""Point-in-time batch state: an ordered delta log plus periodic snapshots.
+
+Every change to a batch (creation, ``update_status``, approved
+``submit_condition``) appends a delta to ``<store dir>/temporal/deltas.ndjson``.
+Writers hold ``writing()`` across their store read-modify-write and the
+``record()`` calls for it, so the baseline is taken before the first change
+reaches the store and deltas land in the log in the order of the store writes:
+
+    {"seq": 42, "block": 17, "ts": "2025-06-01T10:00:00", "source": "update_status",
+     "batch_id": 1042, "set": {"status": "In Transit", ...}}
+
+and the block monitor appends a marker for every block with contract
+transactions, so block numbers and times line up. ``block`` is the chain
+height the change was recorded at (its receipt's block when it has one);
+``seq``, ``block`` and ``ts`` never decrease along the log.
+
+Every ``spacing`` deltas the full state is compacted into a snapshot tagged
+with the seq, block, time and log offset it covers. ``as_of(block=N)`` /
+``as_of(timestamp=T)`` loads the nearest snapshot at or before the target and
+replays the deltas after it.
+
+Retention thins snapshots out logarithmically instead of dropping them: the
+newest ``retain`` are all kept, the next ``retain`` every second one, then
+every fourth, and so on, plus the baseline (the store as it was when the log
+started). A point ``A`` snapshots back therefore replays fewer than
+``spacing * 2 * A / retain`` deltas (``spacing`` within the newest
+``retain``), with about ``retain * log2(snapshots / retain)`` snapshots on
+disk.
+
+    python temporal.py --batch 1042 --as-of 120
+    python temporal.py --batch 1042 --as-of 2025-06-01T10:00:00
+"""
+import argparse, json, os, shutil, time
+from contextlib import contextmanager
+from datetime import datetime
+from threading import get_ident
+
+import leader
+import serialization
+from storage import BATCHES_FILE, read_json, write_json
+
+def temporal_dir(store_path=BATCHES_FILE):
+    return os.path.join(os.path.dirname(os.path.abspath(store_path)), "temporal")
+
+def log_path(store_path=BATCHES_FILE):
+    return os.path.join(temporal_dir(store_path), "deltas.ndjson")
+
+def clear(store_path=BATCHES_FILE, backup=False):
+    """Remove (or with ``backup`` move aside) the log and snapshots of a store.
+
+    Needed whenever the store and its history segments are replaced: deltas
+    and snapshots carry history headers that point into the old segments."""
+    directory = temporal_dir(store_path)
+    if not os.path.isdir(directory):
+        return None
+    if backup:
+        moved = f"{directory}.bak-{int(time.time())}"
+        os.replace(directory, moved)
+        return moved
+    shutil.rmtree(directory)
+    return None
+
+def parse_as_of(value):
+    """``"120"`` → (120, None); an ISO time → (None, "2025-...") ; raises ValueError."""
+    value = (value or "").strip()
+    if value.isdigit():
+        return int(value), None
+    return None, datetime.fromisoformat(value).isoformat()
+
+def _key(batch_id):
+    return str(batch_id)
+
+class TemporalLog:
+    def __init__(self, store_path=BATCHES_FILE, spacing=500, retain=20):
+        self.store_path = store_path
+        self.spacing = spacing
+        self.retain = retain
+        self.directory = temporal_dir(store_path)
+        self.log_path = log_path(store_path)
+        self.manifest_path = os.path.join(self.directory, "snapshots.json")
+        self._lock = leader.FileLock(f"{self.directory}.lock")
+        self._owner = None
+
+    @contextmanager
+    def writing(self):
+        """Hold the log lock around a store write and its ``record()`` calls (reentrant)."""
+        if self._owner == get_ident():
+            yield
+            return
+        with self._lock:
+            self._owner = get_ident()
+            try:
+                self._ensure_baseline()
+                yield
+            finally:
+                self._owner = None
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+    def _ensure_baseline(self):
+        # The store as it was when the log started; kept whatever the retention
+        if os.path.exists(self.manifest_path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        store = read_json(self.store_path, {"batches": [], "conditions": []})
+        batches = [{k: v for k, v in b.items() if k != "history"} for b in store.get("batches", [])]
+        self._write_snapshot({"seq": 0, "block": 0, "ts": "", "offset": 0, "n": 0}, batches, [])
+
+    def _last_delta(self):
+        try:
+            with open(self.log_path, "rb+") as f:
+                end = f.seek(0, os.SEEK_END)
+                f.seek(max(0, end - 65536))
+                tail = f.read()
+                if tail and not tail.endswith(b"\n"):
+                    # Torn by a crash mid-append; that delta never counted
+                    f.truncate(end - len(tail) + tail.rfind(b"\n") + 1)
+                    tail = tail[:tail.rfind(b"\n") + 1]
+        except FileNotFoundError:
+            return None
+        lines = tail.splitlines()
+        return serialization.loads(lines[-1]) if lines else None
+
+    def _append(self, delta, block=None):
+        with self.writing():
+            last = self._last_delta() or {"seq": 0, "block": 0, "ts": ""}
+            delta = {
+                "seq": last["seq"] + 1,
+                "block": max(block or 0, last["block"]),
+                "ts": max(datetime.utcnow().isoformat(), last["ts"]),
+                **delta,
+            }
+            with open(self.log_path, "ab") as f:
+                f.write(serialization.dumps(delta) + b"\n")
+            manifest = self.snapshots()
+            if delta["seq"] - manifest[-1]["seq"] >= self.spacing:
+                self._snapshot(manifest)
+        return delta
+
+    def record(self, batch, fields=None, source="update", block=None):
+        """Log ``fields`` of ``batch`` (all of them when None) as its new values."""
+        fields = [k for k in batch if k != "history"] if fields is None else fields
+        return self._append({
+            "source": source,
+            "batch_id": batch.get("id"),
+            "set": {field: batch.get(field) for field in fields},
+        }, block)
+
+    def mark_block(self, block_number, transactions=()):
+        """Chain marker from the block monitor: lines blocks up with times."""
+        return self._append({"source": "chain", "tx": [t.get("tx_hash") for t in transactions]}, block_number)
+
+    # ---------------------------
+    # Snapshots
+    # ---------------------------
+    def snapshots(self):
+        try:
+            return self._read(self.manifest_path)["snapshots"]
+        except FileNotFoundError:
+            return []
+
+    def _read(self, path):
+        # Readers run without the lock; never write a default in place of a missing file
+        with open(path, "rb") as f:
+            return serialization.read_document(f.read())
+
+    def _snapshot_path(self, seq):
+        return os.path.join(self.directory, f"snapshot-{seq:010d}.json")
+
+    def _kept(self, n, newest):
+        # Snapshot number n (the baseline is 0) at age newest - n: all of the
+        # newest `retain`, then every 2nd, 4th, ... as the age doubles. Once
+        # dropped a snapshot never qualifies again, since the level only grows
+        age = newest - n
+        level = (age // max(self.retain, 1)).bit_length()
+        return n == 0 or n % (1 << level) == 0
+
+    def _write_snapshot(self, tag, batches, manifest):
+        write_json(self._snapshot_path(tag["seq"]), {**tag, "batches": batches})
+        manifest = manifest + [tag]
+        kept, dropped = [], []
+        for position, snapshot in enumerate(manifest):
+            # Manifests written before snapshots were numbered: count by position
+            (kept if self._kept(snapshot.get("n", position), tag["n"]) else dropped).append(snapshot)
+        # Manifest first: a reader that still sees a dropped snapshot falls back to an older one
+        write_json(self.manifest_path, {"snapshots": kept})
+        for snapshot in dropped:
+            try:
+                os.remove(self._snapshot_path(snapshot["seq"]))
+            except OSError:
+                pass
+
+    def _snapshot(self, manifest):
+        state, last, offset = self._replay(manifest[-1])
+        tag = {"seq": last["seq"], "block": last["block"], "ts": last["ts"], "offset": offset,
+               "n": manifest[-1].get("n", len(manifest) - 1) + 1}
+        self._write_snapshot(tag, list(state.values()), manifest)
+        print(f"📸 Temporal snapshot at seq {tag['seq']} (block {tag['block']}, {len(state)} batches)")
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+    def _replay(self, snapshot, block=None, timestamp=None):
+        """State from ``snapshot`` plus the deltas up to the target.
+
+        Returns (state by batch key, last applied tag, log offset after it).
+        Raises FileNotFoundError when the snapshot was thinned out meanwhile."""
+        data = self._read(self._snapshot_path(snapshot["seq"]))
+        state = {_key(b.get("id")): b for b in data.get("batches", [])}
+        last = {k: snapshot[k] for k in ("seq", "block", "ts")}
+        offset = snapshot["offset"]
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return state, last, offset
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                delta = serialization.loads(line)
+                if (block is not None and delta["block"] > block) or (timestamp is not None and delta["ts"] > timestamp):
+                    break
+                offset += len(line)
+                last = {k: delta[k] for k in ("seq", "block", "ts")}
+                if "set" in delta:
+                    key = _key(delta["batch_id"])
+                    state[key] = {**state.get(key, {}), **delta["set"]}
+        return state, last, offset
+
+    def as_of(self, block=None, timestamp=None):
+        """Return (state by batch key, info) at block ``block`` or time ``timestamp``."""
+        if not os.path.exists(self.manifest_path):
+            with self.writing():
+                pass
+        manifest = self.snapshots()
+        candidates = [manifest[0]]
+        for snapshot in manifest[1:]:
+            if (block is not None and snapshot["block"] > block) or (timestamp is not None and snapshot["ts"] > timestamp):
+                break
+            candidates.append(snapshot)
+        # Nearest first; the baseline is never thinned out
+        for start in reversed(candidates):
+            try:
+                state, last, _ = self._replay(start, block, timestamp)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise FileNotFoundError(f"No snapshot of {self.store_path} is readable in {self.directory}")
+        info = {"block": last["block"], "timestamp": last["ts"], "seq": last["seq"],
+                "snapshot_seq": start["seq"], "replayed": last["seq"] - start["seq"]}
+        return state, info
+
+    def batch_as_of(self, batch_id, block=None, timestamp=None):
+        state, info = self.as_of(block, timestamp)
+        return state.get(_key(batch_id)), info
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Point-in-time batch state")
+    parser.add_argument("--store", default=BATCHES_FILE)
+    parser.add_argument("--batch", required=True)
+    parser.add_argument("--as-of", required=True, help="Block number or ISO time")
+    args = parser.parse_args(argv)
+
+    block, timestamp = parse_as_of(args.as_of)
+    batch, info = TemporalLog(args.store).batch_as_of(args.batch, block, timestamp)
+    print(f"🕰️ As of block {info['block']} ({info['timestamp'] or 'log start'}), "
+          f"snapshot {info['snapshot_seq']} + {info['replayed']} deltas")
+    print(json.dumps(batch, indent=2, default=str) if batch else f"Batch {args.batch} did not exist yet")
+
+if __name__ == "__main__":
+    main()
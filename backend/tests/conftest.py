@@ -0,0 +1,29 @@
+import os, shutil, sys, tempfile
+
+import pytest
+
+# storage.py reads MANGO_DATA_DIR at import; point it at a scratch directory first
+DATA_DIR = tempfile.mkdtemp(prefix="mango-tests-")
+os.environ["MANGO_DATA_DIR"] = DATA_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def data_dir():
+    """The app's data directory, emptied for each test."""
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    os.makedirs(DATA_DIR)
+    return DATA_DIR
+
+@pytest.fixture
+def app(data_dir):
+    module = pytest.importorskip("app")
+    return module.create_app({"WARMUP": False, "START_MONITOR": False, "TESTING": True})
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def login(client, user="farmer1", role="farmer"):
+    with client.session_transaction() as session:
+        session["user"] = user
+        session["role"] = role
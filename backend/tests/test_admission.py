@@ -0,0 +1,51 @@
+import time
+from threading import Thread
+
+import pytest
+
+import admission
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = admission.TokenBucket(rate=100, burst=2)
+    assert bucket.take("a") == (True, 0)
+    assert bucket.take("a") == (True, 0)
+    allowed, retry_after = bucket.take("a")
+    assert not allowed and 0 < retry_after <= 0.01
+    assert bucket.take("b")[0]  # buckets are per caller
+    time.sleep(0.02)
+    assert bucket.take("a")[0]
+
+def test_budget_counts_slots_per_transaction():
+    budget = admission.Budget("tx", limit=4, queue_limit=0, max_wait=0)
+    assert budget.acquire(3)
+    assert not budget.acquire(2)  # only one slot left, and no queue
+    assert budget.acquire(1)
+    budget.release(0.1, 3)
+    assert budget.inflight == 1
+    assert budget.clamp(10) == 4 and budget.clamp(0) == 1
+
+def test_budget_queue_is_bounded_and_timed():
+    budget = admission.Budget("tx", limit=1, queue_limit=1, max_wait=0.05)
+    assert budget.acquire()
+    started = time.monotonic()
+    assert not budget.acquire()  # waits max_wait, then gives up
+    assert time.monotonic() - started >= 0.05
+
+    results = []
+    waiter = Thread(target=lambda: results.append(budget.acquire()))
+    budget.max_wait = 5
+    waiter.start()
+    while budget.waiting == 0:
+        time.sleep(0.001)
+    assert not budget.acquire()  # the queue already holds one waiter
+    budget.release(0.01)
+    waiter.join(1)
+    assert results == [True] and budget.inflight == 1
+
+def test_write_routes_are_rate_limited(data_dir):
+    module = pytest.importorskip("app")
+    app = module.create_app({"WARMUP": False, "START_MONITOR": False, "RATE_LIMIT_PER_SEC": 0.001, "RATE_LIMIT_BURST": 2})
+    client = app.test_client()
+    codes = [client.post("/submit_condition", json={"batch_id": 1}).status_code for _ in range(3)]
+    # Unauthenticated writes still spend tokens; the third is turned away
+    assert 429 not in codes[:2] and codes[2] == 429
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from conftest import login
+
+def test_query_before_first_change_is_empty(client):
+    login(client)
+    created = client.post("/generate_random_batch").get_json()["batch"]
+
+    assert client.get("/query?as_of=2020-01-01").get_json()["batches"] == []
+    now = client.get("/query?as_of=2100-01-01").get_json()["batches"]
+    assert [b["id"] for b in now] == [created["id"]]
+
+def test_second_app_does_not_rewire_the_first(data_dir):
+    module = pytest.importorskip("app")
+    first = module.create_app({"WARMUP": False, "START_MONITOR": False, "CONTRACT_ADDRESS": "0x" + "1" * 40})
+    second = module.create_app({"WARMUP": False, "START_MONITOR": False, "CONTRACT_ADDRESS": "0x" + "2" * 40})
+
+    assert first.test_client().get("/readyz").get_json()["chain"]["contract"] == "0x" + "1" * 40
+    assert second.test_client().get("/readyz").get_json()["chain"]["contract"] == "0x" + "2" * 40
+    with first.app_context():
+        assert module.temporal_log._get_current_object() is first.extensions["temporal"]
+
+def test_export_keeps_conditions_of_generated_batches(client):
+    login(client)
+    created = client.post("/generate_random_batch").get_json()["batch"]
+    assert created["id"] == "1001"
+    # submit_condition finds the batch by position: batch_id 1 is the first batch
+    condition = client.post("/submit_condition", json={"batch_id": 1, "role": "farmer", "color": "Yellow",
+                                                       "temperature": 12, "remarks": ""})
+    assert condition.status_code == 200
+
+    lines = client.get("/export?format=ndjson").get_data(as_text=True).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r["record_type"] for r in records] == ["batch", "condition"]
+    assert records[1]["batch_id"] == records[0]["batch_id"] == "1001"
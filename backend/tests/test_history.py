@@ -0,0 +1,59 @@
+import os
+
+import history
+import temporal
+import workload
+from storage import read_json, write_json
+
+def test_generated_store_clears_stale_temporal_log(tmp_path):
+    store = str(tmp_path / "batches.json")
+    workload.write_store(store, 20, seed=1)
+    log = temporal.TemporalLog(store)
+    log.record(read_json(store)["batches"][0], source="test")
+    assert os.path.exists(log.log_path)
+
+    workload.write_store(store, 20, seed=2)
+    # The old deltas pointed into segments that were just rewritten
+    assert not os.path.exists(log.directory)
+    for batch in read_json(store)["batches"]:
+        assert len(history.load(batch, store)) == batch.get("history_count", 0)
+
+def test_appends_write_only_new_records(tmp_path):
+    store = str(tmp_path / "batches.json")
+    batch = {"id": 1}
+    sizes = []
+    for i in range(50):
+        history.append(batch, [{"step": i}], store)
+        sizes.append(os.path.getsize(history.segment_path(0, store)))
+    assert [r["step"] for r in history.load(batch, store)] == list(range(50))
+    assert batch["history_count"] == 50
+    # Every append costs the same few bytes, however long the history already is
+    growth = [b - a for a, b in zip(sizes, sizes[1:])]
+    assert max(growth) < 2 * min(growth)
+
+def test_older_header_reads_history_as_it_was(tmp_path):
+    store = str(tmp_path / "batches.json")
+    batch = {"id": 1, "history": [{"step": 0}]}
+    history.append(batch, [{"step": 1}], store)
+    then = dict(batch)
+    history.append_many([(batch, [{"step": 2}]), ({"id": 2}, [{"other": 1}])], store)
+    assert [r["step"] for r in history.load(then, store)] == [0, 1]
+    assert [r["step"] for r in history.load(batch, store)] == [0, 1, 2]
+
+def test_legacy_file_moves_into_a_segment(tmp_path):
+    store = str(tmp_path / "batches.json")
+    os.makedirs(history.history_dir(store))
+    with open(os.path.join(history.history_dir(store), "7.ndjson"), "wb") as f:
+        f.write(b'{"a":1}\n')
+    batch = {"id": 7, "history_count": 1, "history_bytes": 8}
+    history.append(batch, [{"a": 2}], store)
+    assert batch["history_segment"] == 0
+    assert history.load(batch, store) == [{"a": 1}, {"a": 2}]
+
+def test_migrate_moves_embedded_history(tmp_path):
+    store = str(tmp_path / "batches.json")
+    write_json(store, {"batches": [{"id": 1, "history": [{"a": 1}]}, {"id": 2}], "conditions": []})
+    assert history.migrate(store) == 1
+    batch = read_json(store)["batches"][0]
+    assert "history" not in batch
+    assert history.load(batch, store) == [{"a": 1}]
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("web3")
+pytest.importorskip("eth_abi")
+import rebuild
+from storage import write_json
+
+def event(name, chain_id, shard=0, status="Batch Created"):
+    return {"event": name, "shard": shard, "tx_hash": "0x1", "block_number": 5,
+            "args": {"id": chain_id, "origin": "o", "status": status, "color": "c", "temperature": "20"}}
+
+def test_events_append_integer_ids_on_every_shard(tmp_path):
+    store = str(tmp_path / "batches.json")
+    # A local batch without a chain id is never matched by its own id
+    write_json(store, {"batches": [{"id": "1001", "origin": "x"}], "conditions": []})
+    batches, index, _ = rebuild._load_state(store)
+    assert index == {}
+
+    rebuild.apply_event(batches, index, event("BatchCreated", 1001))
+    rebuild.apply_event(batches, index, event("BatchCreated", 1, shard=1))
+    rebuild.apply_event(batches, index, event("BatchUpdated", 1, shard=1, status="In Transit"))
+    assert [(b["id"], b.get("chain_id"), b.get("shard")) for b in batches] == [
+        ("1001", None, None), (2, 1001, 0), (3, 1, 1)]
+    assert batches[2]["status"] == "In Transit"
+    assert len(batches[2]["history"]) == 1
+
+def test_load_state_keys_on_shard_and_chain_id(tmp_path):
+    store = str(tmp_path / "batches.json")
+    write_json(store, {"batches": [{"id": 1, "chain_id": 7}, {"id": 2, "chain_id": 7, "shard": 1}], "conditions": []})
+    batches, index, _ = rebuild._load_state(store)
+    assert index[(0, 7)] is batches[0] and index[(1, 7)] is batches[1]
+
+def test_snapshot_needs_from_block(tmp_path):
+    snapshot = str(tmp_path / "old.json")
+    write_json(snapshot, {"batches": [], "conditions": []})
+    with pytest.raises(Exception, match="--from-block"):
+        rebuild.rebuild(None, SimpleNamespace(address="0xA"), str(tmp_path / "batches.json"), snapshot=snapshot)
@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("web3")
+import reconcile
+from storage import read_json, write_json
+
+def contract(next_id):
+    return SimpleNamespace(address="0xA", functions=SimpleNamespace(
+        nextBatchId=lambda: SimpleNamespace(call=lambda: next_id)))
+
+def test_repair_fixes_chain_fields_but_keeps_local_status(tmp_path, monkeypatch):
+    store = str(tmp_path / "batches.json")
+    local = {"id": 1, "chain_id": 1, "origin": "Ratnagiri", "farm": "F1", "exporter": "E1",
+             "ipfsHash": "Qm1", "status": "Farmer Approved"}
+    write_json(store, {"batches": [local, {"id": 2, "origin": "pending"}], "conditions": []})
+    onchain = {"origin": "Devgad", "farm": "F1", "exporter": "E1", "ipfsHash": "Qm1",
+               "status": "Batch Created", "color": "", "temperature": "", "createdAt": 1}
+    monkeypatch.setattr(reconcile, "build_id_map", lambda *args: ({}, {(0, 1): 5}))
+    monkeypatch.setattr(reconcile.chain, "fetch_batches", lambda web3, c, ids, workers: {1: onchain})
+
+    report = reconcile.reconcile(None, contract(2), store, repair=True)
+    assert report["matched"] == 1
+    assert report["local_only"] == [2]
+    assert report["mismatches"][0]["fields"] == {"origin": {"local": "Ratnagiri", "chain": "Devgad"}}
+    assert report["status_differs"] == [{"batch_id": 1, "local": "Farmer Approved", "chain": "Batch Created"}]
+    repaired = read_json(store)["batches"][0]
+    assert repaired["origin"] == "Devgad"
+    assert repaired["status"] == "Farmer Approved"
+    assert repaired["block_number"] == 5
+
+def test_unset_iot_fields_are_not_drift():
+    local = {"origin": "o", "farm": "f", "exporter": "e", "ipfsHash": "q", "color": "Yellow", "temperature": 12.0}
+    onchain = dict(local, color="", temperature="")
+    assert reconcile.diff_batch(local, onchain) == {}
+    assert reconcile.diff_batch(local, dict(local, temperature="12")) == {}
@@ -0,0 +1,63 @@
+import history
+import records
+import workload
+from storage import write_json
+
+def sample(n=50, **options):
+    batches = []
+    for chunk, _ in workload.generate(n, seed=7, **options):
+        batches.extend(history.header(batch) for batch in chunk)
+    return batches
+
+def rows(table):
+    return [table.row_dict(row) for row in range(len(table))]
+
+def test_rows_round_trip():
+    batches = sample()
+    batches[3]["unexpected"] = {"nested": [1, 2]}  # overflow column
+    batches[4]["temperature"] = ""
+    assert rows(records.BatchTable.from_batches(batches)) == batches
+
+def test_refresh_matches_full_build():
+    batches = sample()
+    table = records.BatchTable.from_batches(batches)
+    changed = [dict(b) for b in batches]
+    changed[5]["status"] = "Exporter Approved"
+    changed[9]["id"] = "B9"
+    changed += sample(3, start_id=51)
+
+    refreshed, count = table.refresh(changed)
+    assert count == 5
+    assert rows(refreshed) == rows(records.BatchTable.from_batches(changed))
+    assert rows(table) == batches  # the previous table is left as it was
+    assert refreshed.find("B9") == 9
+    assert refreshed.find(10) is None
+
+def test_refresh_after_removal_rebuilds():
+    batches = sample(10)
+    table = records.BatchTable.from_batches(batches)
+    refreshed, count = table.refresh(batches[2:])
+    assert count == 8
+    assert rows(refreshed) == batches[2:]
+
+def test_find_by_position_and_moved_ids():
+    batches = [{"id": 1}, {"id": "1001"}, {"id": 3}]
+    table = records.BatchTable.from_batches(batches)
+    assert table.find(1) == table.find("1") == 0
+    assert table.find("1001") == 1
+    assert table.find(3) == 2
+    assert table.find(2) is None
+    assert table.get("missing") is None
+
+def test_cached_table_follows_store_revision(tmp_path):
+    store = str(tmp_path / "batches.json")
+    batches = sample(5)
+    write_json(store, {"batches": batches, "conditions": []})
+    first = records.cached_table(store)
+    assert records.cached_table(store) is first
+
+    batches[0]["status"] = "Changed"
+    write_json(store, {"batches": batches, "conditions": []})
+    second = records.cached_table(store)
+    assert second is not first
+    assert second.get(batches[0]["id"])["status"] == "Changed"
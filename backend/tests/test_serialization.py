@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+import history
+import serialization
+import storage
+import workload
+
+def document(n=30):
+    batches, conditions = [], []
+    for chunk, chunk_conditions in workload.generate(n, seed=3):
+        batches.extend(history.header(batch) for batch in chunk)
+        conditions.extend(chunk_conditions)
+    batches[0]["extra_field"] = [1, {"a": "b"}]  # kept outside the schema
+    return {"batches": batches, "conditions": conditions, "blocks": [], "version": 2}
+
+@pytest.mark.parametrize("fmt", ["json", "compact"])
+def test_document_round_trip(fmt):
+    doc = document()
+    out = io.BytesIO()
+    serialization.write_document(out, doc, fmt=fmt)
+    assert serialization.read_document(out.getvalue()) == doc
+
+def test_zstd_round_trip():
+    pytest.importorskip("zstandard")
+    doc = document()
+    out = io.BytesIO()
+    serialization.write_document(out, doc, fmt="compact", compression="zstd")
+    assert serialization.read_document(out.getvalue()) == doc
+
+def test_pack_record_skips_absent_fields():
+    record = {"id": 7, "status": "Batch Created", "note": "x"}
+    packed = serialization.pack_record(record, serialization.BATCH_FIELDS)
+    assert packed[-1] == {"note": "x"}
+    assert serialization.unpack_record(packed, serialization.BATCH_FIELDS) == record
+
+def test_iter_json_array_streams_compact_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(serialization, "STORE_FORMAT", "compact")
+    path = str(tmp_path / "batches.json")
+    doc = document()
+    storage.write_json(path, doc)
+    assert serialization.is_compact(path)
+    assert list(storage.iter_json_array(path, "conditions")) == doc["conditions"]
+    assert storage.read_json(path) == doc
+
+def test_validated_writes_reject_off_schema_records(monkeypatch):
+    monkeypatch.setattr(serialization, "VALIDATE_WRITES", True)
+    bad = {"batches": [{"id": 1, "block_number": "12"}]}
+    with pytest.raises(ValueError, match="block_number"):
+        serialization.write_document(io.BytesIO(), bad, fmt="compact")
+    assert serialization.validate({"id": 1, "block_number": None}, serialization.BATCH_FIELDS) == []
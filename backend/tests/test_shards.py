@@ -0,0 +1,36 @@
+import pytest
+
+import shards
+
+def test_shard_for_is_stable_and_prefers_recorded_shard():
+    registry = shards.ShardRegistry(["0xA", "0xB", "0xC"])
+    picks = {registry.shard_for({"farm": f"farm-{i}"}) for i in range(50)}
+    assert picks == {0, 1, 2}
+    assert registry.shard_for({"farm": "farm-7"}) == shards.stable_hash("farm-7") % 3
+    assert registry.shard_for({"farm": "farm-7", "shard": 2}) == 2
+
+def test_address_rejects_unknown_index():
+    registry = shards.ShardRegistry(["0xA", "0xB"])
+    assert registry.address(None) == "0xA"
+    assert registry.address(1) == "0xB"
+    for shard in (2, -1):
+        with pytest.raises(ValueError, match="Unknown contract shard"):
+            registry.address(shard)
+
+def test_registry_only_grows(tmp_path):
+    path = str(tmp_path / "shards.json")
+    shards.save(["0xA", "0xB"], path)
+    shards.save(["0xA", "0xB", "0xC"], path)
+    for addresses in (["0xC", "0xB", "0xA"], ["0xA"], ["0xD", "0xB", "0xC"]):
+        with pytest.raises(ValueError):
+            shards.save(addresses, path)
+    assert shards.load(path).addresses == ["0xA", "0xB", "0xC"]
+
+def test_register_keeps_contract_address_as_shard_zero(tmp_path):
+    path = str(tmp_path / "shards.json")
+    from config import CONTRACT_ADDRESS
+    shards.main(["--file", path, "--register", "0xB", "0xC"])
+    shards.main(["--file", path, "--register", "0xc", "0xD", "--key", "id"])
+    registry = shards.load(path)
+    assert registry.addresses == [CONTRACT_ADDRESS, "0xB", "0xC", "0xD"]
+    assert registry.key == "id"
@@ -0,0 +1,64 @@
+import os
+
+from storage import read_json, write_json
+import temporal
+
+def make_log(tmp_path, batches=(), **kwargs):
+    store = str(tmp_path / "batches.json")
+    write_json(store, {"batches": list(batches), "conditions": []})
+    return store, temporal.TemporalLog(store, **kwargs)
+
+def add_batch(store, log, batch, block=None):
+    with log.writing():
+        data = read_json(store)
+        data["batches"].append(batch)
+        write_json(store, data)
+        log.record(batch, source="test", block=block)
+
+def test_state_before_first_delta_excludes_batch_it_created(tmp_path):
+    store, log = make_log(tmp_path, [{"id": 1, "status": "old"}])
+    add_batch(store, log, {"id": 2, "status": "new"}, block=5)
+
+    before, info = log.as_of(timestamp="2000-01-01T00:00:00")
+    assert set(before) == {"1"}
+    assert info["seq"] == 0
+    after, _ = log.as_of(block=5)
+    assert set(after) == {"1", "2"}
+
+def test_replay_matches_every_block(tmp_path):
+    store, log = make_log(tmp_path, spacing=3, retain=2)
+    for i in range(1, 120):
+        with log.writing():
+            log.record({"id": i % 5, "v": i}, block=i)
+    for block in range(1, 120):
+        state, _ = log.as_of(block=block)
+        assert state[str(block % 5)]["v"] == block
+
+def test_snapshots_thin_out_logarithmically(tmp_path):
+    store, log = make_log(tmp_path, spacing=3, retain=2)
+    for i in range(1, 200):
+        log.record({"id": i % 5, "v": i}, block=i)
+    assert [s["seq"] for s in log.snapshots()] == [0, 96, 144, 168, 180, 192, 195, 198]
+    on_disk = [n for n in os.listdir(log.directory) if n.startswith("snapshot-")]
+    assert len(on_disk) == len(log.snapshots())
+
+def test_kept_never_brings_back_a_dropped_snapshot(tmp_path):
+    _, log = make_log(tmp_path, retain=4)
+    for n in range(1, 300):
+        dropped_at = next((newest for newest in range(n, 400) if not log._kept(n, newest)), None)
+        if dropped_at is not None:
+            assert not any(log._kept(n, newest) for newest in range(dropped_at, 400))
+
+def test_query_falls_back_when_snapshot_vanishes(tmp_path):
+    store, log = make_log(tmp_path, spacing=2, retain=10)
+    for i in range(1, 10):
+        log.record({"id": 1, "v": i}, block=i)
+    newest = log.snapshots()[-1]
+    path = log._snapshot_path(newest["seq"])
+    os.remove(path)  # as if thinned out while the query ran
+
+    state, info = log.as_of(block=9)
+    assert state["1"]["v"] == 9
+    assert info["snapshot_seq"] < newest["seq"]
+    # A read never writes a default file in place of the missing one
+    assert not os.path.exists(path)
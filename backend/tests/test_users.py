@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import users
+from storage import write_json
+
+def test_hash_and_verify():
+    stored = users.hash_password("s3cret")
+    assert users.is_hashed(stored)
+    assert users.verify_password(stored, "s3cret")
+    assert not users.verify_password(stored, "wrong")
+
+def test_plaintext_passwords_are_hashed_on_load(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_json(path, {"users": [{"username": "old", "password": "plain", "role": "farmer"}]})
+    directory = users.UserDirectory(path)
+    assert directory.authenticate("old", "plain")["role"] == "farmer"
+    with open(path) as f:
+        assert users.is_hashed(json.load(f)["users"][0]["password"])
+
+def test_register_rejects_duplicates_and_other_workers_see_it(tmp_path):
+    path = str(tmp_path / "users.json")
+    first = users.UserDirectory(path, refresh_interval=3600)
+    second = users.UserDirectory(path, refresh_interval=3600)
+    assert second.get("nobody") is None
+    first.register("alice", "pw", "exporter")
+    with pytest.raises(ValueError):
+        second.register("alice", "other", "farmer")
+    # Unknown to second's index until the revision check on a miss
+    assert second.authenticate("alice", "pw")["role"] == "exporter"
+
+def test_unknown_usernames_do_not_reload(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.json")
+    directory = users.UserDirectory(path, refresh_interval=3600)
+    directory.register("bob", "pw", "farmer")
+    loads = []
+    monkeypatch.setattr(directory, "_load", lambda locked=False: loads.append(1))
+    for i in range(5):
+        assert directory.authenticate(f"ghost{i}", "pw") is None
+    assert loads == []
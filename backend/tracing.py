@@ -0,0 +1,230 @@
+"""Span-based request tracing and an opt-in sampling profiler.
+
+Every sampled HTTP request gets a root span; ``span()`` opens child spans
+around web3 calls, store operations, template and QR renders. Outside a
+traced request ``span()`` is a no-op. Finished traces are written to a sink:
+
+    jsonl:///path/traces.jsonl   one span per line
+    otlp:///path/traces.otlp     OTLP/JSON ExportTraceServiceRequest per line
+
+The profiler samples one thread's stack every few milliseconds and dumps
+folded stacks (flamegraph.pl / speedscope compatible) for slow requests.
+"""
+import contextvars, json, os, random, sys, time
+from collections import Counter
+from contextlib import contextmanager
+from threading import Thread, Lock, Event
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attrs", "error", "kind")
+
+    def __init__(self, trace, name, parent_id=None, attrs=None, kind="internal"):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attrs = attrs or {}
+        self.error = None
+        self.kind = kind
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        self.trace.add(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or _new_id(16)
+        self.spans = []
+        self._lock = Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+# ---------------------------
+# Sinks
+# ---------------------------
+class JsonlSink:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = Lock()
+
+    def _lines(self, trace):
+        return [json.dumps(s.to_dict(), default=str) for s in trace.spans]
+
+    def export(self, trace):
+        lines = self._lines(trace)
+        with self._lock, open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+class OtlpFileSink(JsonlSink):
+    """OTLP/JSON file exporter format, one request per line."""
+    SERVICE_NAME = "mango-supply-chain"
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+
+    def _lines(self, trace):
+        spans = []
+        for s in trace.spans:
+            span = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": self.KINDS.get(s.kind, 1),
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s.attrs.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent_id:
+                span["parentSpanId"] = s.parent_id
+            spans.append(span)
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.SERVICE_NAME}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]}
+        return [json.dumps(request)]
+
+def make_sink(url):
+    if not url:
+        return None
+    if url.startswith("jsonl://"):
+        return JsonlSink(url[len("jsonl://"):])
+    if url.startswith("otlp://"):
+        return OtlpFileSink(url[len("otlp://"):])
+    raise ValueError(f"Unknown trace sink: {url}")
+
+_sink = None
+_sample_rate = 1.0
+
+def configure(sink_url=None, sample_rate=1.0):
+    global _sink, _sample_rate
+    _sink = make_sink(sink_url)
+    _sample_rate = sample_rate
+
+# ---------------------------
+# Span API
+# ---------------------------
+def current_span():
+    return _current.get()
+
+def parse_traceparent(header):
+    # W3C traceparent: version-traceid-parentid-flags
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+def start_trace(name, traceparent=None, force=False, **attrs):
+    """Open a root span and make it current. Returns (span, token) or (None, None)."""
+    if _sink is None and not force:
+        return None, None
+    trace_id, parent_id = parse_traceparent(traceparent)
+    if not force and trace_id is None and random.random() >= _sample_rate:
+        return None, None
+    root = Span(Trace(trace_id), name, parent_id, attrs, kind="server")
+    return root, _current.set(root)
+
+def end_trace(root, token, **attrs):
+    if root is None:
+        return
+    root.attrs.update(attrs)
+    root.finish()
+    _current.reset(token)
+    if _sink is not None:
+        try:
+            _sink.export(root.trace)
+        except Exception as e:
+            print(f"⚠️ Trace export failed: {str(e)}")
+
+@contextmanager
+def span(name, **attrs):
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = str(e)
+        raise
+    finally:
+        child.finish()
+        _current.reset(token)
+
+# ---------------------------
+# Sampling profiler
+# ---------------------------
+class SamplingProfiler:
+    """Samples one thread's Python stack on a timer and counts folded stacks."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
@@ -0,0 +1,210 @@
+"""In-memory user directory with salted password hashes.
+
+``UserDirectory`` keeps ``users.json`` indexed by username. Logins look users
+up in that index and never read the file; the file's revision (a stat) is
+checked at most every ``refresh_interval`` seconds, and again when a username
+is unknown, so registrations made by other workers are seen at once. The file
+is only reread when that revision has changed.
+
+Passwords are stored as ``scrypt$n$r$p$salt$hash`` (PBKDF2-SHA256 where
+OpenSSL has no scrypt). Plaintext passwords left from older stores are hashed
+when the directory loads them. A verified (user, password) pair is remembered
+for ``cache_ttl`` seconds as a keyed digest, so repeat logins skip the KDF.
+
+    python users.py --migrate      # hash any plaintext passwords now
+    python users.py --bench        # KDF cost and cached verification latency
+"""
+import argparse, base64, hashlib, hmac, os, secrets, time
+from collections import OrderedDict
+from threading import Lock
+
+import leader
+import metrics
+from storage import USERS_FILE, read_json, revision, write_json
+
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PBKDF2_ITERATIONS = 200000
+MAX_PASSWORD_LENGTH = 1024  # keeps the KDF's input, and so its cost, bounded
+
+# ---------------------------
+# Password hashes
+# ---------------------------
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _kdf(password, salt, scheme, params):
+    secret = password.encode()[:MAX_PASSWORD_LENGTH]
+    if scheme == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p, maxmem=128 * n * r * p + 2 ** 20, dklen=32)
+    (iterations,) = params
+    return hashlib.pbkdf2_hmac("sha256", secret, salt, iterations)
+
+def hash_password(password):
+    salt = os.urandom(16)
+    if hasattr(hashlib, "scrypt"):
+        params = (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        scheme = "scrypt"
+    else:
+        params = (PBKDF2_ITERATIONS,)
+        scheme = "pbkdf2_sha256"
+    digest = _kdf(password, salt, scheme, params)
+    return "$".join([scheme, *map(str, params), _b64(salt), _b64(digest)])
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+def verify_password(stored, password):
+    """Check ``password`` against a stored hash (or a legacy plaintext value)."""
+    if not isinstance(stored, str) or not isinstance(password, str):
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode(), password.encode())
+    scheme, *params, salt, digest = stored.split("$")
+    try:
+        expected = _kdf(password, _unb64(salt), scheme, tuple(int(p) for p in params))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(expected, _unb64(digest))
+
+_dummy_hash = None
+
+def _dummy():
+    # Unknown usernames still pay for one KDF, so timing doesn't reveal them.
+    # Made on first use: a KDF at import would slow every import and worker start
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_urlsafe(16))
+    return _dummy_hash
+
+# ---------------------------
+# Directory
+# ---------------------------
+class UserDirectory:
+    def __init__(self, path=USERS_FILE, refresh_interval=2.0, cache_size=4096, cache_ttl=300.0):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._document = {"users": []}
+        self._index = {}
+        self._revision = None
+        self._next_check = 0.0
+        self._lock = Lock()
+        self._file_lock = leader.FileLock(f"{path}.lock")
+        self._cache_key = os.urandom(32)
+        self._verified = OrderedDict()  # username -> (stored hash, keyed digest of password, expires_at)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._index)
+
+    def _load(self, locked=False):
+        document = read_json(self.path, {"users": []})
+        document.setdefault("users", [])
+        plaintext = [u for u in document["users"] if "password" in u and not is_hashed(u["password"])]
+        if plaintext and not locked:
+            with self._file_lock:
+                # Another worker may have migrated (or registered) meanwhile
+                return self._load(locked=True)
+        for user in plaintext:
+            user["password"] = hash_password(user["password"])
+        if plaintext:
+            write_json(self.path, document)
+            print(f"🔐 Hashed {len(plaintext)} plaintext passwords in {self.path}")
+        self._document = document
+        self._index = {u.get("username"): u for u in document["users"]}
+        self._revision = revision(self.path)
+
+    def refresh(self, force=False):
+        """Reload the index if users.json changed (checked at most every refresh_interval)."""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        with self._lock:
+            self._next_check = now + self.refresh_interval
+            if force or revision(self.path) != self._revision:
+                self._load()
+
+    def get(self, username):
+        self.refresh()
+        user = self._index.get(username)
+        if user is None and revision(self.path) != self._revision:
+            # Perhaps just registered by another worker; unknown names alone never reread the file
+            with self._lock:
+                if revision(self.path) != self._revision:
+                    self._load()
+            user = self._index.get(username)
+        return user
+
+    def _tag(self, stored, password):
+        return hmac.new(self._cache_key, f"{stored}\0{password}".encode(), hashlib.blake2b).digest()
+
+    def authenticate(self, username, password):
+        """Return the user's record if ``password`` is right, else None."""
+        user = self.get(username)
+        stored = user.get("password") if user else _dummy()
+        tag = self._tag(stored, password)
+        cached = self._verified.get(username)
+        if user and cached and cached[0] == stored and cached[2] > time.monotonic() and hmac.compare_digest(cached[1], tag):
+            metrics.LOGIN_VERIFY.inc(result="cached")
+            return user
+        if not verify_password(stored, password) or user is None:
+            metrics.LOGIN_VERIFY.inc(result="rejected")
+            return None
+        metrics.LOGIN_VERIFY.inc(result="verified")
+        with self._lock:
+            self._verified[username] = (stored, tag, time.monotonic() + self.cache_ttl)
+            self._verified.move_to_end(username)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return user
+
+    def register(self, username, password, role):
+        """Add a user; raises ValueError if the username is taken."""
+        record = {"username": username, "password": hash_password(password), "role": role}
+        with self._lock, self._file_lock:
+            if revision(self.path) != self._revision:
+                self._load(locked=True)
+            if username in self._index:
+                raise ValueError("Username already exists")
+            self._document["users"].append(record)
+            self._index[username] = record
+            write_json(self.path, self._document)
+            self._revision = revision(self.path)
+        return record
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="User directory maintenance")
+    parser.add_argument("--store", default=USERS_FILE)
+    parser.add_argument("--migrate", action="store_true", help="Hash plaintext passwords")
+    parser.add_argument("--bench", action="store_true", help="Time KDF and cached verification")
+    args = parser.parse_args(argv)
+
+    if args.migrate:
+        directory = UserDirectory(args.store)
+        print(f"✅ {len(directory)} users in {args.store}, all passwords hashed")
+    if args.bench:
+        stored = hash_password("bench-password")
+        started = time.perf_counter()
+        verify_password(stored, "bench-password")
+        print(f"🔑 {stored.split('$')[0]} verification: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        directory = UserDirectory(args.store, refresh_interval=3600)
+        directory.refresh()
+        directory._index["bench-user"] = {"username": "bench-user", "password": stored, "role": "farmer"}
+        directory.authenticate("bench-user", "bench-password")
+        rounds = 10000
+        started = time.perf_counter()
+        for _ in range(rounds):
+            directory.authenticate("bench-user", "bench-password")
+        print(f"⚡ cached login: {(time.perf_counter() - started) / rounds * 1e6:.1f} µs")
+
+if __name__ == "__main__":
+    main()
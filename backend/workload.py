@@ -0,0 +1,355 @@
+"""Seeded synthetic supply-chain workload generator.
+
+Builds batches and their full lifecycle (farm → wholesaler → distributor →
+retailer condition checks, rejections, temperature excursions) from
+``RANDOM_DATA_POOLS``. Values are drawn a column at a time per chunk (with
+numpy when installed), so millions of batches take seconds. Output goes
+straight into the batch store (histories as per-batch segments) or out as an
+NDJSON event stream.
+
+    python workload.py -n 1000000 --seed 7 --force
+    python workload.py -n 10000 --rejection-rate 0.1 --excursion-rate 0.05 --ndjson - | head
+
+The same seed and backend always produce the same data.
+"""
+import argparse, json, os, random, shutil, sys, time
+from datetime import datetime, timedelta
+
+import history
+import serialization
+import temporal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RANDOM_DATA_POOLS = {
+    "origins": ["Mysore", "Bangalore", "Coimbatore", "Ratnagiri", "Pune"],
+    "farms": ["GreenFarm-001", "SunriseFarm-002", "OrganicFarm-003", "GoldenFields-004"],
+    "exporters": ["ABC Exports", "XYZ Traders", "Global Foods", "AgriLink Exports"],
+    "colors": ["Yellow", "Green", "Red", "Orange"],
+    "conditions": ["Fresh", "Good", "Excellent", "Premium"],
+    "farmers": ["Ramesh K", "Sita M", "Rajesh P", "Lakshmi R"],
+    "wholesalers": ["Anil W", "Meena W", "Kiran W"],
+    "distributors": ["Suresh D", "Farah D", "Vikram D"],
+    "retailers": ["Priya R", "Joseph R", "Nandini R", "Arjun R"],
+    "remarks": ["Firm and fragrant", "Uniform ripening", "Minor bruising", "Good shelf life", ""],
+    "bad_colors": ["Black", "Rotten"],
+    "spoilage_remarks": ["Mold on several fruits", "Spoilt in transit"],
+}
+
+# Downstream stages in order, with the mean and spread of their storage temperature (°C)
+STAGES = [
+    ("wholesaler", "wholesalers", 13.0, 2.0),
+    ("distributor", "distributors", 14.0, 2.5),
+    ("retailer", "retailers", 18.0, 3.0),
+]
+
+TEMP_MIN, TEMP_MAX = 5, 35
+START = datetime(2025, 1, 1)
+
+def random_batch(batch_id, rng=random):
+    """One randomly generated farm batch (the /generate_random_batch payload)."""
+    pools = RANDOM_DATA_POOLS
+    return {
+        "id": f"{batch_id}",
+        "origin": rng.choice(pools["origins"]),
+        "farm": rng.choice(pools["farms"]),
+        "exporter": rng.choice(pools["exporters"]),
+        "ipfsHash": f"Qm{rng.randint(100000, 999999)}{rng.randrange(1000, 9999)}",
+        "color": rng.choice(pools["colors"]),
+        "temperature": round(20 + rng.uniform(-5, 10), 1),
+        "condition": rng.choice(pools["conditions"]),
+        "created_by": rng.choice(pools["farmers"]),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def assess_condition(color, temperature, remarks):
+    """Approval rules for a condition check. Returns (approved, reasons)."""
+    reasons = []
+    if color and color.lower() in ["black", "bad", "rotten"]:
+        reasons.append("Bad color")
+    if temperature is not None and (temperature < TEMP_MIN or temperature > TEMP_MAX):
+        reasons.append("Temperature out of range")
+    if remarks and ("mold" in remarks.lower() or "spoilt" in remarks.lower()):
+        reasons.append("Remark indicates spoilage")
+    return not reasons, reasons
+
+# ---------------------------
+# Column samplers
+# ---------------------------
+class PythonSampler:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def choice(self, pool, n):
+        return self.rng.choices(pool, k=n)
+
+    def uniform(self, low, high, n):
+        r = self.rng.random
+        span = high - low
+        return [low + span * r() for _ in range(n)]
+
+    def normal(self, mean, sigma, n):
+        g = self.rng.gauss
+        return [g(mean, sigma) for _ in range(n)]
+
+    def exponential(self, scale, n):
+        e = self.rng.expovariate
+        rate = 1.0 / scale
+        return [e(rate) for _ in range(n)]
+
+    def bernoulli(self, p, n):
+        r = self.rng.random
+        return [r() < p for _ in range(n)]
+
+    def integers(self, low, high, n):
+        r = self.rng.randrange
+        return [r(low, high) for _ in range(n)]
+
+class NumpySampler:
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def choice(self, pool, n):
+        return [pool[i] for i in self.rng.integers(0, len(pool), n).tolist()]
+
+    def uniform(self, low, high, n):
+        return self.rng.uniform(low, high, n).tolist()
+
+    def normal(self, mean, sigma, n):
+        return self.rng.normal(mean, sigma, n).tolist()
+
+    def exponential(self, scale, n):
+        return self.rng.exponential(scale, n).tolist()
+
+    def bernoulli(self, p, n):
+        return (self.rng.random(n) < p).tolist()
+
+    def integers(self, low, high, n):
+        return self.rng.integers(low, high, n).tolist()
+
+def make_sampler(seed, backend="auto"):
+    if backend == "numpy" or (backend == "auto" and np is not None):
+        if np is None:
+            raise RuntimeError("The numpy backend requires numpy (pip install numpy)")
+        return NumpySampler(seed)
+    return PythonSampler(seed)
+
+# ---------------------------
+# Generator
+# ---------------------------
+def _stage_columns(sampler, n, mean, sigma, rejection_rate, excursion_rate, excursion_scale, hot_fraction):
+    temps = sampler.normal(mean, sigma, n)
+    excursion = sampler.bernoulli(excursion_rate, n)
+    magnitude = sampler.exponential(excursion_scale, n)
+    hot = sampler.bernoulli(hot_fraction, n)
+    rejected = sampler.bernoulli(rejection_rate, n)
+    spoiled = sampler.bernoulli(0.5, n)
+    for i in range(n):
+        if excursion[i]:
+            temps[i] = TEMP_MAX + 0.1 + magnitude[i] if hot[i] else TEMP_MIN - 0.1 - magnitude[i]
+    return {
+        "temperature": temps,
+        "rejected": rejected,
+        "spoiled": spoiled,
+        "color": sampler.choice(RANDOM_DATA_POOLS["colors"], n),
+        "bad_color": sampler.choice(RANDOM_DATA_POOLS["bad_colors"], n),
+        "remarks": sampler.choice(RANDOM_DATA_POOLS["remarks"], n),
+        "spoilage": sampler.choice(RANDOM_DATA_POOLS["spoilage_remarks"], n),
+        "delay_hours": sampler.exponential(24.0, n),
+    }
+
+def generate(n, seed=42, start_id=1, chunk_size=100000, rejection_rate=0.05,
+             excursion_rate=0.02, excursion_scale=5.0, hot_fraction=0.8,
+             interval_seconds=60, start=START, chain_ids=None, backend="auto"):
+    """Yield (batches, conditions) chunks for ``n`` batches with sequential numeric ids.
+
+    ``rejection_rate`` is the per-stage chance of a bad color or spoilage
+    remark; ``excursion_rate`` the per-stage chance of a temperature outside
+    5–35 °C, overshooting by an exponential amount of mean ``excursion_scale``.
+    A rejected batch stops at that stage. ``chain_ids`` are recorded as the
+    ``chain_id`` of the first batches.
+    """
+    sampler = make_sampler(seed, backend)
+    pools = RANDOM_DATA_POOLS
+    chain_ids = chain_ids or []
+    for offset in range(0, n, chunk_size):
+        size = min(chunk_size, n - offset)
+        first = start_id + offset
+        cols = {
+            "origin": sampler.choice(pools["origins"], size),
+            "farm": sampler.choice(pools["farms"], size),
+            "exporter": sampler.choice(pools["exporters"], size),
+            "color": sampler.choice(pools["colors"], size),
+            "condition": sampler.choice(pools["conditions"], size),
+            "farmer": sampler.choice(pools["farmers"], size),
+            "temperature": sampler.uniform(15, 30, size),
+            "ipfs": sampler.integers(100000, 999999, size),
+            "tx": sampler.integers(0, 1 << 62, size),
+        }
+        stages = [
+            (role, sampler.choice(pools[users], size),
+             _stage_columns(sampler, size, mean, sigma, rejection_rate, excursion_rate, excursion_scale, hot_fraction))
+            for role, users, mean, sigma in STAGES
+        ]
+
+        batches, conditions = [], []
+        for i in range(size):
+            batch_id = first + i
+            created = start + timedelta(seconds=(batch_id - start_id) * interval_seconds)
+            batch = {
+                "id": batch_id,
+                "origin": cols["origin"][i],
+                "farm": cols["farm"][i],
+                "exporter": cols["exporter"][i],
+                "status": "Batch Created",
+                "ipfsHash": f"Qm{cols['ipfs'][i]}",
+                "color": cols["color"][i],
+                "temperature": round(cols["temperature"][i], 1),
+                "condition": cols["condition"][i],
+                "tx_hash": "0x" + ("%016x" % cols["tx"][i]) * 4,
+                "chain_id": chain_ids[batch_id - start_id] if batch_id - start_id < len(chain_ids) else None,
+                "created_by": cols["farmer"][i],
+                "timestamp": created.isoformat(),
+            }
+            when = created
+            for role, users, stage in stages:
+                when += timedelta(hours=stage["delay_hours"][i])
+                temperature = round(stage["temperature"][i], 1)
+                color, remarks = stage["color"][i], stage["remarks"][i]
+                if stage["rejected"][i]:
+                    if stage["spoiled"][i]:
+                        remarks = stage["spoilage"][i]
+                    else:
+                        color = stage["bad_color"][i]
+                approved, reasons = assess_condition(color, temperature, remarks)
+                record = {
+                    "batch_id": batch_id,
+                    "role": role,
+                    "user": users[i],
+                    "color": color,
+                    "temperature": temperature,
+                    "remarks": remarks,
+                    "status": "Approved" if approved else "Rejected",
+                    "reasons": reasons,
+                    "timestamp": when.isoformat(),
+                }
+                conditions.append(record)
+                if not approved:
+                    break
+                batch["status"] = f"{role.capitalize()} Approved"
+                batch.setdefault("history", []).append(record)
+            batches.append(batch)
+        yield batches, conditions
+
+# ---------------------------
+# Writers
+# ---------------------------
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"))
+
+def write_store(path, n, fmt=None, **options):
+    """Stream a generated store to ``path`` (atomically), with each batch's
+    history in the shared segments. ``fmt`` defaults to MANGO_STORE_FORMAT.
+    Returns (batches, conditions)."""
+    history.clear(path)
+    # Its deltas and snapshots point into the segments just removed
+    temporal.clear(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    spool_path = tmp_path + ".conditions"
+    counts = [0, 0]
+    compact = (fmt or serialization.STORE_FORMAT) == "compact"
+    with open(tmp_path, "wb") as out, open(spool_path, "wb+") as spool:
+        if compact:
+            writer = serialization.CompactWriter(out, serialization.STORE_COMPRESSION)
+            writer.section("batches")
+        else:
+            out.write(b'{"batches":[')
+        for batches, conditions in generate(n, **options):
+            history.append_many([(batch, []) for batch in batches], path)
+            if compact:
+                for batch in batches:
+                    writer.record(batch)
+                spool.writelines(serialization.dumps(c) + b"\n" for c in conditions)
+            else:
+                if batches:
+                    out.write((b"," if counts[0] else b"") + serialization.dumps(batches)[1:-1])
+                if conditions:
+                    spool.write((b"," if counts[1] else b"") + serialization.dumps(conditions)[1:-1])
+            counts[0] += len(batches)
+            counts[1] += len(conditions)
+        spool.seek(0)
+        if compact:
+            writer.section("conditions")
+            for line in spool:
+                writer.record(serialization.loads(line))
+            writer.close()
+        else:
+            out.write(b'],"conditions":[')
+            shutil.copyfileobj(spool, out)
+            out.write(b"]}")
+    os.remove(spool_path)
+    os.replace(tmp_path, path)
+    return tuple(counts)
+
+def iter_events(n, **options):
+    """Lifecycle events in per-batch order: BatchCreated then each ConditionRecorded."""
+    for batches, conditions in generate(n, **options):
+        j = 0
+        for batch in batches:
+            created = {k: v for k, v in batch.items() if k != "history"}
+            created["status"] = "Batch Created"
+            yield {"event": "BatchCreated", **created}
+            while j < len(conditions) and conditions[j]["batch_id"] == batch["id"]:
+                yield {"event": "ConditionRecorded", **conditions[j]}
+                j += 1
+
+def write_ndjson(out, n, **options):
+    count = 0
+    for event in iter_events(n, **options):
+        out.write(_dumps(event) + "\n")
+        count += 1
+    return count
+
+def main(argv=None):
+    from storage import BATCHES_FILE, iter_json_array
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic mango supply-chain workload")
+    parser.add_argument("-n", "--batches", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rejection-rate", type=float, default=0.05, help="Per-stage chance of bad color / spoilage")
+    parser.add_argument("--excursion-rate", type=float, default=0.02, help="Per-stage chance of a temperature excursion")
+    parser.add_argument("--excursion-scale", type=float, default=5.0, help="Mean overshoot of an excursion (°C)")
+    parser.add_argument("--hot-fraction", type=float, default=0.8, help="Share of excursions that are too warm")
+    parser.add_argument("--backend", choices=["auto", "numpy", "python"], default="auto")
+    parser.add_argument("--store", default=BATCHES_FILE, help="Batch store to write (default: data/batches.json)")
+    parser.add_argument("--ndjson", help="Write the event stream here instead ('-' for stdout)")
+    parser.add_argument("--force", action="store_true", help="Overwrite a non-empty store")
+    args = parser.parse_args(argv)
+
+    options = dict(
+        seed=args.seed, rejection_rate=args.rejection_rate, excursion_rate=args.excursion_rate,
+        excursion_scale=args.excursion_scale, hot_fraction=args.hot_fraction, backend=args.backend,
+    )
+    started = time.perf_counter()
+    if args.ndjson:
+        out = sys.stdout if args.ndjson == "-" else open(args.ndjson, "w")
+        try:
+            count = write_ndjson(out, args.batches, **options)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"✅ {count} events in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return
+
+    if next(iter_json_array(args.store, "batches"), None) is not None and not args.force:
+        raise SystemExit(f"❌ {args.store} already has batches; pass --force to overwrite")
+    os.makedirs(os.path.dirname(os.path.abspath(args.store)), exist_ok=True)
+    batches, conditions = write_store(args.store, args.batches, **options)
+    print(f"✅ {batches} batches and {conditions} condition records written to {args.store} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()